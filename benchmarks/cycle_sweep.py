@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import tempfile
+import time
+
+import jcb
+from jcb.utilities.config_parsing import cycles_from_conf
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark rendering a sweep over cycles with Renderer.render_cycles, against creating a Renderer
+for each cycle. Each observer has a satellite chronicle with a few action dates during the sweep.
+
+  python benchmarks/cycle_sweep.py --observers 50 --cycles 2020010100:2020011518:PT6H
+"""
+
+# Action dates of the chronicles
+action_dates = ['2020-01-04T00:00:00', '2020-01-09T03:00:00', '2020-01-12T00:00:00']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark a sweep over cycles.')
+    parser.add_argument('--observers', type=int, default=50)
+    parser.add_argument('--cycles', default='2020-01-01T00:00:00Z:2020-01-15T18:00:00Z:PT6H')
+    args = parser.parse_args()
+
+    window_begins = cycles_from_conf(args.cycles)
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(path, args.observers,
+                                             chronicle_action_dates=action_dates)
+        algorithm = template_dict['algorithm']
+
+        # Compile the templates first
+        jcb.render(dict(template_dict))
+
+        start = time.perf_counter()
+        expected = []
+        for window_begin in window_begins:
+            window = window_begin.strftime('%Y-%m-%dT%H:%M:%SZ')
+            expected.append(jcb.Renderer({**template_dict, 'window_begin': window}).render(
+                algorithm))
+        separate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        renderer = jcb.Renderer(dict(template_dict))
+        jedi_dicts = [jedi_dict for _, jedi_dict in renderer.render_cycles(algorithm,
+                                                                           window_begins)]
+        sweep = time.perf_counter() - start
+
+    print(f'{len(window_begins)} cycles of {args.observers} observers')
+    print(f'  one Renderer each: {separate:8.3f} s')
+    print(f'  render_cycles:     {sweep:8.3f} s (identical: {jedi_dicts == expected})')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
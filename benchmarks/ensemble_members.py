@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import tempfile
+import time
+
+import jcb
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark producing the configurations of the members of an ensemble from a partial render with
+late bound keys, against rendering each member.
+
+  python benchmarks/ensemble_members.py --observers 100 --members 80
+"""
+
+# Keys that differ between the members
+late_bound_keys = ['obs_path', 'diag_path']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def member_values(member):
+    return {'obs_path': f'/data/mem{member:03d}/obs', 'diag_path': f'/data/mem{member:03d}/diags'}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark finalizing ensemble members.')
+    parser.add_argument('--observers', type=int, default=100)
+    parser.add_argument('--members', type=int, default=80)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(path, args.observers)
+        algorithm = template_dict['algorithm']
+
+        # Compile the templates first
+        jcb.render(dict(template_dict))
+
+        start = time.perf_counter()
+        renderer = jcb.Renderer(dict(template_dict))
+        expected = []
+        for member in range(args.members):
+            renderer.update(**member_values(member))
+            expected.append(renderer.render(algorithm))
+        rendered = time.perf_counter() - start
+
+        start = time.perf_counter()
+        partial = jcb.Renderer(dict(template_dict)).render_partial(algorithm, late_bound_keys)
+        partial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        jedi_dicts = [partial.finalize(member_values(member)) for member in range(args.members)]
+        finalized = time.perf_counter() - start
+
+    print(f'{args.members} members of {args.observers} observers, '
+          f'{len(partial.sites)} places with late bound keys')
+    print(f'  render each member:  {rendered:8.3f} s')
+    print(f'  partial render:      {partial_time:8.3f} s')
+    print(f'  finalize members:    {finalized:8.3f} s (identical: {jedi_dicts == expected})')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
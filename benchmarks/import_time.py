@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark the time taken to import jcb, and to start the command line interface, in a new
+interpreter. The time of an empty interpreter is subtracted. Exits with an error if importing jcb
+takes longer than --max-ms, so it can be used to catch regressions.
+
+  python benchmarks/import_time.py --repeats 10 --max-ms 50
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def time_interpreter(code, repeats):
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark importing jcb.')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=50.0,
+                        help='Maximum time in milliseconds for importing jcb.')
+    args = parser.parse_args()
+
+    baseline = time_interpreter('pass', args.repeats)
+
+    results = {
+        'import jcb': time_interpreter('import jcb', args.repeats) - baseline,
+        'jcb --help': time_interpreter('import sys; sys.argv = ["jcb", "--help"]\n'
+                                       'from jcb.driver import main\n'
+                                       'try:\n    main()\nexcept SystemExit:\n    pass',
+                                       args.repeats) - baseline,
+        'import jcb, use Renderer': time_interpreter('import jcb; jcb.Renderer',
+                                                     args.repeats) - baseline,
+    }
+
+    for name, seconds in results.items():
+        print(f'{name:>26}{seconds * 1000:10.1f} ms')
+
+    if results['import jcb'] * 1000 > args.max_ms:
+        sys.exit(f'import jcb took longer than {args.max_ms} ms')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import tempfile
+import time
+
+import jcb
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark removing the observer components that an algorithm does not allow from the observation
+templates before rendering, against rendering every component and removing them after parsing.
+
+  python benchmarks/observer_components.py --observers 200
+"""
+
+# Observer components allowed by algorithms of different kinds
+algorithm_components = {
+    'hofx': ('obs space', 'obs operator'),
+    'hofx with filters': ('obs space', 'obs operator', 'obs filters'),
+    'variational': ('obs space', 'obs operator', 'obs filters', 'obs bias'),
+}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def time_render(template_dict, repeats):
+
+    algorithm = template_dict['algorithm']
+
+    # Compile the templates first
+    jedi_dict = jcb.Renderer(dict(template_dict)).render(algorithm)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        jcb.Renderer(dict(template_dict)).render(algorithm)
+
+    return (time.perf_counter() - start) / repeats, jedi_dict
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark pruning observer components.')
+    parser.add_argument('--observers', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"algorithm":>18}{"after (s)":>11}{"before (s)":>12}{"speed-up":>10}{"identical":>11}')
+
+    for name, components in algorithm_components.items():
+
+        with tempfile.TemporaryDirectory() as path:
+
+            template_dict = write_synthetic_tree(path, args.observers, components=components)
+
+            after, expected = time_render({**template_dict,
+                                           'jcb_prune_observer_templates': False}, args.repeats)
+            before, jedi_dict = time_render(template_dict, args.repeats)
+
+            print(f'{name:>18}{after:11.3f}{before:12.3f}{after / before:10.2f}'
+                  f'{str(jedi_dict == expected):>11}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
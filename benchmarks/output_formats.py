@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import tempfile
+import time
+
+import jcb
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark writing a rendered configuration out in each of the output formats, against the time
+taken to render it.
+
+  python benchmarks/output_formats.py --observers 400
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the output formats.')
+    parser.add_argument('--observers', type=int, default=400)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(path, args.observers)
+        algorithm = template_dict['algorithm']
+
+        # Compile the templates first
+        jcb.render(dict(template_dict))
+
+        renderer = jcb.Renderer(dict(template_dict))
+        start = time.perf_counter()
+        jedi_dict = renderer.render(algorithm)
+        render_time = time.perf_counter() - start
+
+        nesting = renderer.observer_nesting(algorithm)
+
+    print(f'{args.observers} observers, render {render_time:.3f} s')
+    print(f'{"format":>8}{"time (s)":>10}{"size (MB)":>11}{"share of render":>17}')
+
+    for output_format in jcb.serializers.output_formats:
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            text = jcb.serialize(jedi_dict, output_format, nesting)
+        write_time = (time.perf_counter() - start) / args.repeats
+        print(f'{output_format:>8}{write_time:10.3f}{len(text) / 1e6:11.2f}'
+              f'{write_time / render_time:17.1%}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
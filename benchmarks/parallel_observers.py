@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import os
+import tempfile
+import time
+
+import jcb
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark rendering the observers in a pool of processes against rendering them serially. The time
+for each number of workers includes starting the pool.
+
+  python benchmarks/parallel_observers.py --observers 200 --workers 1 2 4 8
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark parallel observer rendering.')
+    parser.add_argument('--observers', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f'CPUs available: {os.cpu_count()}')
+    print(f'{"workers":>8}{"render (s)":>12}{"speed-up":>10}{"identical":>11}')
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(path, args.observers)
+        algorithm = template_dict['algorithm']
+
+        # Serial render without the fragment cache for reference, after compiling the templates
+        jcb.Renderer({**template_dict, 'jcb_fragment_cache': False}).render(algorithm)
+        start = time.perf_counter()
+        expected = jcb.Renderer({**template_dict, 'jcb_fragment_cache': False}).render(algorithm)
+        reference = time.perf_counter() - start
+
+        for workers in args.workers:
+            with jcb.Renderer(dict(template_dict), workers=workers) as renderer:
+                start = time.perf_counter()
+                jedi_dict = renderer.render(algorithm)
+                elapsed = time.perf_counter() - start
+
+            print(f'{workers:8}{elapsed:12.3f}{reference / elapsed:10.2f}'
+                  f'{str(jedi_dict == expected):>11}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
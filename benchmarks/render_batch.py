@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import os
+import tempfile
+import time
+
+import jcb
+from jcb.batch import render_batch
+from jcb.utilities import yaml_backend
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark rendering a batch of cycles with jcb render-batch, against creating a Renderer for each
+dictionary of templates and writing its configuration.
+
+  python benchmarks/render_batch.py --observers 100 --cycles 10 --copies 3 --workers 2
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark rendering a batch of cycles.')
+    parser.add_argument('--observers', type=int, default=100)
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--copies', type=int, default=1,
+                        help='Number of identical dictionaries of templates for each cycle.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(path, args.observers)
+        jobs = [(f'cycle_{cycle:03d}_{copy}', {**template_dict,
+                                               'obs_path': f'/data/obs/{cycle:03d}'})
+                for cycle in range(args.cycles) for copy in range(args.copies)]
+
+        # Compile the templates first
+        jcb.render(dict(template_dict))
+
+        # Write each configuration, as jcb render does
+        start = time.perf_counter()
+        for name, job_dict in jobs:
+            with open(os.path.join(path, f'{name}.yaml'), 'w') as f:
+                yaml_backend.dump(jcb.render(dict(job_dict)), f, default_flow_style=False,
+                                  sort_keys=False)
+        separate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        summary = render_batch(jobs, os.path.join(path, 'output'), workers=args.workers)
+        batch = time.perf_counter() - start
+
+    print(f'{args.cycles} cycles of {args.observers} observers, {args.copies} copies of each')
+    print(f'  one Renderer each: {separate:8.3f} s')
+    print(f'  render-batch:      {batch:8.3f} s ({summary["failed"]} failed)')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
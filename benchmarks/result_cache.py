@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import os
+import tempfile
+import time
+
+import jcb
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark rendering a configuration in a new process (without the compiled templates in memory)
+against reading it back from the result cache, which includes checking the templates and
+chronicles for changes.
+
+  python benchmarks/result_cache.py --observers 400
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the result cache.')
+    parser.add_argument('--observers', type=int, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(os.path.join(path, 'tree'), args.observers)
+        cached_dict = {**template_dict, 'jcb_result_cache_dir': os.path.join(path, 'results')}
+
+        start = time.perf_counter()
+        expected = jcb.render(dict(cached_dict))
+        miss_time = time.perf_counter() - start
+
+        # A new process has no digests of the files in memory
+        jcb.result_cache._file_digests.clear()
+
+        start = time.perf_counter()
+        jedi_dict = jcb.render(dict(cached_dict))
+        hit_time = time.perf_counter() - start
+
+        assert jedi_dict == expected
+
+    print(f'{args.observers} observers: render and store {miss_time:.3f} s, '
+          f'read from the cache {hit_time:.3f} s ({miss_time / hit_time:.0f}x)')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import jcb
+import jinja2
+from jcb.utilities import yaml_backend
+from synthetic_tree import chronicle_action_dates, write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark how the Renderer scales with the size of the template tree and of the satellite
+chronicles. Starting from a base tree, each sweep changes one size at a time: the number of
+observers, of model files, the depth of the includes of each observer, the number of keys of the
+dictionary of templates each observer reads, and the number of channels (up to hyperspectral
+sizes) and of actions of the chronicles. For each size the benchmark measures:
+
+  construction_seconds   setting up a Renderer with nothing cached (reading the chronicles)
+  first_render_seconds   the first render, which compiles the templates
+  warm_construction_seconds, render_seconds
+                         the median time to set up a Renderer and to render with it once the
+                         templates are compiled
+  renders_per_second     setting up a Renderer and rendering, repeated
+  peak_memory            the peak memory allocated by Python setting up a Renderer and rendering
+  phases                 the own time of each phase of a warm render (see jcb.profiling)
+
+The results are written as JSON. When a baseline from an earlier run is given the times are
+compared with it, and the benchmark exits with status 1 if any got slower than the threshold, so
+scaling regressions can be caught offline:
+
+  python benchmarks/scale.py --output before.json
+  python benchmarks/scale.py --output after.json --baseline before.json
+  python benchmarks/scale.py --sweep observers=10,100,1000 --sweep channels=8461
+"""
+
+# The size of the base tree
+base_sizes = {
+    'observers': 50,
+    'model_files': 2,
+    'include_depth': 1,
+    'template_keys': 5,
+    'channels': 100,
+    'actions': 5,
+}
+
+# The sizes of each sweep
+default_sweeps = {
+    'observers': [10, 50, 200],
+    'model_files': [0, 10, 50],
+    'include_depth': [0, 4, 16],
+    'template_keys': [0, 50, 200],
+    'channels': [100, 2211, 8461],
+    'actions': [0, 10, 100],
+}
+
+# Times that are compared with the baseline
+compared_times = ['construction_seconds', 'first_render_seconds', 'warm_construction_seconds',
+                  'render_seconds']
+
+# Times shorter than this in the baseline are too noisy to compare
+minimum_compared_seconds = 0.01
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_tree(path, sizes):
+
+    """
+    Write the synthetic tree of a point of a sweep and return its dictionary of templates.
+    """
+
+    return write_synthetic_tree(path, sizes['observers'],
+                                number_of_channels=sizes['channels'],
+                                chronicle_action_dates=chronicle_action_dates(sizes['actions']),
+                                number_of_model_files=sizes['model_files'],
+                                include_depth=sizes['include_depth'],
+                                number_of_template_keys=sizes['template_keys'])
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def measure(template_dict, repeats):
+
+    """
+    Measure setting up a Renderer and rendering with a dictionary of templates.
+    """
+
+    algorithm = template_dict['algorithm']
+    jcb.clear_environment_cache()
+
+    # Nothing cached
+    start = time.perf_counter()
+    renderer = jcb.Renderer(dict(template_dict))
+    construction = time.perf_counter() - start
+
+    start = time.perf_counter()
+    jedi_dict = renderer.render(algorithm)
+    first_render = time.perf_counter() - start
+
+    # Compiled templates
+    constructions = []
+    renders = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        renderer = jcb.Renderer(dict(template_dict))
+        constructions.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        renderer.render(algorithm)
+        renders.append(time.perf_counter() - start)
+
+    # Memory, measured separately since tracing slows down the code
+    tracemalloc.start()
+    try:
+        jcb.Renderer(dict(template_dict)).render(algorithm)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    with jcb.RenderProfile() as profile:
+        jcb.Renderer(dict(template_dict)).render(algorithm)
+
+    return {
+        'observers_rendered': len(jedi_dict['cost function']['observations']['observers']),
+        'construction_seconds': construction,
+        'first_render_seconds': first_render,
+        'warm_construction_seconds': statistics.median(constructions),
+        'render_seconds': statistics.median(renders),
+        'renders_per_second': repeats / (sum(constructions) + sum(renders)),
+        'peak_memory': peak_memory,
+        'phases': {name: timing['seconds'] for name, timing in profile.phases.items()},
+    }
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compare(results, baseline, threshold):
+
+    """
+    Print the times compared with the baseline and return the number that got slower than the
+    threshold.
+    """
+
+    baseline_points = {(point['sweep'], point['size']): point for point in baseline['results']}
+
+    regressions = 0
+    for point in results:
+        baseline_point = baseline_points.get((point['sweep'], point['size']))
+        if baseline_point is None:
+            continue
+        for name in compared_times:
+            if baseline_point[name] < minimum_compared_seconds:
+                continue
+            ratio = point[name] / baseline_point[name]
+            if ratio > threshold:
+                regressions += 1
+                print(f'  slower: {point["sweep"]}={point["size"]} {name} {ratio:.2f}x '
+                      f'({baseline_point[name]:.4f} s -> {point[name]:.4f} s)')
+
+    return regressions
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_sweep(text):
+
+    name, _, values = text.partition('=')
+    if name not in default_sweeps or not values:
+        raise argparse.ArgumentTypeError(f'{text} is not NAME=SIZE,SIZE,... with NAME one of '
+                                         f'{", ".join(default_sweeps)}')
+
+    return name, [int(value) for value in values.split(',')]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the scaling of the Renderer.')
+    parser.add_argument('--sweep', type=parse_sweep, action='append', default=None,
+                        help='NAME=SIZE,SIZE,... to run only this sweep, can be repeated.')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default='scale_results.json')
+    parser.add_argument('--baseline', default=None,
+                        help='Results of an earlier run to compare with.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Ratio to the baseline above which a time counts as slower.')
+    args = parser.parse_args()
+
+    sweeps = dict(args.sweep) if args.sweep else default_sweeps
+
+    results = []
+    for sweep, sizes in sweeps.items():
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as path:
+                template_dict = write_tree(path, {**base_sizes, sweep: size})
+                point = {'sweep': sweep, 'size': size, **measure(template_dict, args.repeats)}
+            results.append(point)
+            print(f'{sweep:>13} {size:>6}: construction {point["construction_seconds"]:.3f} s, '
+                  f'first render {point["first_render_seconds"]:.3f} s, '
+                  f'render {point["render_seconds"]:.3f} s, '
+                  f'{point["renders_per_second"]:.1f} renders/s, '
+                  f'{point["peak_memory"] / 2**20:.1f} MiB')
+
+    output = {
+        'jcb_version': jcb.version(),
+        'python': platform.python_version(),
+        'jinja2': jinja2.__version__,
+        'yaml_backend': yaml_backend.backend_name(),
+        'base_sizes': base_sizes,
+        'results': results,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        print(f'Compared with {args.baseline}:')
+        regressions = compare(results, baseline, args.threshold)
+        print(f'  {regressions} times slower than {args.threshold}x the baseline')
+        if regressions:
+            sys.exit(1)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
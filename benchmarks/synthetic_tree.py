@@ -0,0 +1,266 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from datetime import datetime, timedelta
+import os
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Writes a synthetic template tree, laid out like jcb-algorithms plus a jcb client, that can be used
+to benchmark the Renderer with any number of observers. The number of model files, the depth of the
+includes of each observer, the number of keys of the dictionary of templates that each observer
+reads, and the channels and actions of the satellite chronicles can also be chosen, so that the
+scaling of the Renderer with each of them can be measured (see scale.py).
+"""
+
+
+algorithm_template = '''\
+cost function:
+  cost type: 3D-Var
+  time window:
+    begin: '{{window_begin}}'
+    length: '{{window_length}}'
+  observations:
+    observers:
+    {% for observation_from_jcb in observations %}
+    {% if use_observer(observation_from_jcb) %}
+    - {% filter indent(width=6) %}
+{% include observation_from_jcb + '.yaml.j2' %}
+      {% endfilter %}
+    {% endif %}
+    {% endfor %}
+'''
+
+# Includes of the model files, added to the algorithm when there are model files
+model_include = '''\
+model:
+{% filter indent(width=2) %}
+{% for model_file in model_files %}
+{% include model_component + model_file + '.yaml.j2' %}
+{% endfor %}
+{% endfilter %}
+'''
+
+model_template = '''\
+{name}:
+  resolution: {index}
+  path: '{{{{bias_path}}}}/{name}'
+'''
+
+# Include of a level of the includes of the observers. Each level includes the level below it.
+level_include = '''\
+{indent}level {level}:
+{{% filter indent(width={width}) %}}
+{{% include 'level_{level}.yaml.j2' %}}
+{{% endfilter %}}
+'''
+
+level_template = '''\
+depth: {level}
+window: '{{{{window_begin}}}}'
+{include}'''
+
+observer_components = '''\
+{algorithm}:
+  observer_nesting: [cost function, observations, observers]
+  components: [{components}]
+'''
+
+filter_template = '''\
+- filter: Bounds Check
+  filter variables:
+  - name: brightnessTemperature
+    channels: '{{{{ channels }}}}'
+  minvalue: {minvalue}
+  maxvalue: 500.0
+  action:
+    name: reject
+'''
+
+observation_template = '''\
+obs space:
+  name: {name}
+  obsdatain:
+    engine:
+      type: H5File
+      obsfile: '{{{{obs_path}}}}/{{{{observation_from_jcb}}}}.{{{{window_begin}}}}.nc'
+  obsdataout:
+    engine:
+      type: H5File
+      obsfile: '{{{{diag_path}}}}/diag_{{{{observation_from_jcb}}}}.nc'
+  simulated variables: [brightnessTemperature]
+  channels: &{name}_channels {channels}
+{keys}obs operator:
+  name: CRTM
+  Absorbers: [H2O, O3, CO2]
+  obs options:
+    Sensor_ID: {name}
+    EndianType: little_endian
+{include}obs filters:
+{filters}obs bias:
+  input file: '{{{{bias_path}}}}/{name}.satbias.nc'
+'''
+
+chronicle_template = '''\
+commissioned: 2000-01-01T00:00:00
+observer_type: satellite
+channel_variables:
+  simulated: min
+  error: max
+channel_values:
+{channel_values}chronicles:
+{chronicles}'''
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def chronicle_action_dates(number_of_actions, last_date='2020-12-31T00:00:00'):
+
+    """
+    Returns action dates, one a day, ending at last_date.
+    """
+
+    last = datetime.strptime(last_date, '%Y-%m-%dT%H:%M:%S')
+
+    return [(last - timedelta(days=number_of_actions - 1 - index)).strftime('%Y-%m-%dT%H:%M:%S')
+            for index in range(number_of_actions)]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_chronicle(path, name, number_of_channels, action_dates):
+
+    """
+    Write a satellite chronicle that removes one more channel at each action date. Once all but the
+    last channel are removed the further actions bring the channels back one at a time.
+    """
+
+    channel_values = ''.join(f'  {channel}: [1, {channel / 10}]\n'
+                             for channel in range(1, number_of_channels + 1))
+    chronicles = ''.join(f'- action_date: "{action_date}"\n'
+                         f'  channel_values:\n'
+                         f'    {index % number_of_channels + 1}: '
+                         f'[{int(index >= number_of_channels - 1)}, {(index + 1) / 10}]\n'
+                         for index, action_date in enumerate(action_dates))
+
+    with open(os.path.join(path, f'{name}.yaml'), 'w') as f:
+        f.write(chronicle_template.format(channel_values=channel_values,
+                                          chronicles=chronicles or '  []\n'))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_synthetic_tree(path, number_of_observers, number_of_filters=10, number_of_channels=100,
+                         algorithm='variational',
+                         components=('obs space', 'obs operator', 'obs filters'),
+                         chronicle_action_dates=None, number_of_model_files=0, include_depth=0,
+                         number_of_template_keys=0):
+
+    """
+    Write a synthetic template tree and return a dictionary of templates that renders it.
+
+    Args:
+        path (str): Directory to write the tree to.
+        number_of_observers (int): The number of observation files.
+        number_of_filters (int): The number of filters in each observation file.
+        number_of_channels (int): The number of channels of each observer.
+        algorithm (str): Name of the algorithm template.
+        components (tuple): The observer components that the algorithm allows.
+        chronicle_action_dates (list): Optional action dates of a satellite chronicle written for
+                                       each observer, which then takes its channels from the
+                                       chronicle (see chronicle_action_dates).
+        number_of_model_files (int): The number of model files that the algorithm includes.
+        include_depth (int): The number of levels of includes below each observation file.
+        number_of_template_keys (int): The number of keys of the dictionary of templates that each
+                                       observation file reads, in addition to the usual ones.
+
+    Returns:
+        dict: The dictionary of templates.
+    """
+
+    algorithm_path = os.path.join(path, 'algorithms')
+    obs_path = os.path.join(path, 'app', 'observations', 'synthetic')
+    os.makedirs(algorithm_path, exist_ok=True)
+    os.makedirs(obs_path, exist_ok=True)
+
+    with open(os.path.join(algorithm_path, f'{algorithm}.yaml.j2'), 'w') as f:
+        f.write(algorithm_template + (model_include if number_of_model_files else ''))
+    with open(os.path.join(algorithm_path, 'observer_components.yaml'), 'w') as f:
+        f.write(observer_components.format(algorithm=algorithm,
+                                           components=', '.join(components)))
+
+    filters = ''.join(filter_template.format(minvalue=index) for index in range(number_of_filters))
+
+    # Model files, in the directory of the synthetic model
+    model_path = os.path.join(path, 'app', 'model', 'synthetic')
+    model_files = [f'model_{index:03d}' for index in range(number_of_model_files)]
+    if model_files:
+        os.makedirs(model_path, exist_ok=True)
+    for index, name in enumerate(model_files):
+        with open(os.path.join(model_path, f'synthetic_{name}.yaml.j2'), 'w') as f:
+            f.write(model_template.format(name=name, index=index))
+
+    # Levels of includes below the observation files, with the algorithm templates since the
+    # observations directory must only hold observation files
+    for level in range(1, include_depth + 1):
+        include = level_include.format(indent='', level=level + 1, width=2) \
+            if level < include_depth else ''
+        with open(os.path.join(algorithm_path, f'level_{level}.yaml.j2'), 'w') as f:
+            f.write(level_template.format(level=level, include=include))
+    include = level_include.format(indent='  ', level=1, width=4) if include_depth else ''
+
+    # Keys read by the observation files
+    template_keys = {f'key_{index:04d}': f'value_{index}'
+                     for index in range(number_of_template_keys)}
+    keys = ''.join(f"    {key}: '{{{{{key}}}}}'\n" for key in template_keys)
+    if keys:
+        keys = '  attributes:\n' + keys
+
+    chronicle_path = os.path.join(path, 'app', 'observation_chronicle', 'synthetic')
+    if chronicle_action_dates is not None:
+        os.makedirs(chronicle_path, exist_ok=True)
+
+    observations = []
+    for index in range(number_of_observers):
+        name = f'observer_{index:04d}'
+        observations.append(name)
+        if chronicle_action_dates is None:
+            channels = '{{ channels }}'
+        else:
+            channels = f"{{{{ get_satellite_variable('{name}', 'simulated') }}}}"
+            write_chronicle(chronicle_path, name, number_of_channels, chronicle_action_dates)
+        with open(os.path.join(obs_path, f'{name}.yaml.j2'), 'w') as f:
+            f.write(observation_template.format(name=name, filters=filters, channels=channels,
+                                                keys=keys, include=include))
+
+    template_dict = {
+        'algorithm': algorithm,
+        'algorithm_path': algorithm_path,
+        'app_path_observations': obs_path,
+        'observations': observations,
+        'window_begin': '2021-01-01T00:00:00Z',
+        'window_length': 'PT6H',
+        'obs_path': '/path/to/obs',
+        'diag_path': '/path/to/diags',
+        'bias_path': '/path/to/bias',
+        'channels': ', '.join(str(channel) for channel in range(1, number_of_channels + 1)),
+    }
+
+    if chronicle_action_dates is not None:
+        template_dict['app_path_observation_chronicle'] = chronicle_path
+
+    if model_files:
+        template_dict['app_path_model'] = model_path
+        template_dict['model_files'] = model_files
+
+    template_dict.update(template_keys)
+
+    return template_dict
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import builtins
+import os
+import tempfile
+import time
+
+import jcb
+from synthetic_tree import write_synthetic_tree
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark setting up a Renderer and rendering with and without a manifest of the template tree
+(jcb index), and with the templates in a bundle (jcb bundle), counting the calls that touch the file
+system metadata (stat, listdir and open).
+
+  python benchmarks/tree_index.py --observers 400
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def count_calls(function, counts):
+
+    def counted(*args, **kwargs):
+        counts[function.__name__] = counts.get(function.__name__, 0) + 1
+        return function(*args, **kwargs)
+
+    return counted
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def measure(template_dict):
+
+    """
+    Returns the time and the file system calls of a Renderer and a render in a fresh process state.
+    """
+
+    jcb.clear_environment_cache()
+
+    counts = {}
+    originals = {'stat': os.stat, 'listdir': os.listdir, 'open': builtins.open}
+    os.stat = count_calls(originals['stat'], counts)
+    os.listdir = count_calls(originals['listdir'], counts)
+    builtins.open = count_calls(originals['open'], counts)
+
+    try:
+        start = time.perf_counter()
+        renderer = jcb.Renderer(dict(template_dict))
+        renderer.render(template_dict['algorithm'])
+        seconds = time.perf_counter() - start
+    finally:
+        os.stat = originals['stat']
+        os.listdir = originals['listdir']
+        builtins.open = originals['open']
+
+    return seconds, counts
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the manifest of template trees.')
+    parser.add_argument('--observers', type=int, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+
+        template_dict = write_synthetic_tree(path, args.observers)
+
+        # Compile the templates into a bytecode cache first so that both measure loading
+        template_dict['jcb_cache_dir'] = os.path.join(path, 'bytecode')
+        jcb.render(dict(template_dict))
+
+        results = {'without manifest': measure(template_dict)}
+        jcb.tree_index.write_index(path)
+        results['with manifest'] = measure(template_dict)
+
+        bundle = os.path.join(path, 'templates.zip')
+        jcb.template_bundle.write_bundle(bundle, {'algorithms': template_dict['algorithm_path'],
+                                                  'observations':
+                                                  template_dict['app_path_observations']})
+        bundle_dict = {**template_dict, 'algorithm_path': f'{bundle}/algorithms',
+                       'app_path_observations': f'{bundle}/observations'}
+        jcb.render(dict(bundle_dict))
+        results['bundle'] = measure(bundle_dict)
+
+    print(f'{args.observers} observers')
+    for name, (seconds, counts) in results.items():
+        calls = ', '.join(f'{call} {count}' for call, count in sorted(counts.items()))
+        print(f'{name:>17}: {seconds:.3f} s, {calls}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import time
+
+from jcb.utilities import yaml_backend
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Benchmark the libyaml backend against the pure Python implementation of PyYAML for a config with
+the shape of a large rendered JEDI configuration, i.e. a few hundred observers each with an obs
+space, obs operator, a list of filters and long channel lists.
+
+  python benchmarks/yaml_backend.py --observers 300
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def synthetic_jedi_dict(number_of_observers):
+
+    observers = []
+    for index in range(number_of_observers):
+        channels = ', '.join(str(channel) for channel in range(1, 101))
+        observers.append({
+            'obs space': {
+                'name': f'observer_{index}',
+                'obsdatain': {'engine': {'type': 'H5File',
+                                         'obsfile': f'/path/to/obs/observer_{index}.nc'}},
+                'obsdataout': {'engine': {'type': 'H5File',
+                                          'obsfile': f'/path/to/diags/observer_{index}.nc'}},
+                'simulated variables': ['brightnessTemperature'],
+                'channels': channels,
+            },
+            'obs operator': {'name': 'CRTM', 'Absorbers': ['H2O', 'O3', 'CO2'],
+                             'obs options': {'Sensor_ID': f'sensor_{index}',
+                                             'EndianType': 'little_endian'}},
+            'obs filters': [{'filter': 'Bounds Check', 'filter variables': [
+                {'name': 'brightnessTemperature', 'channels': channels}],
+                'minvalue': 100.0, 'maxvalue': 500.0, 'action': {'name': 'reject'}}
+                for _ in range(10)],
+            'obs error': {'covariance model': 'diagonal', 'error parameter vector':
+                          [0.5 + channel / 100 for channel in range(100)]},
+        })
+
+    return {
+        'cost function': {
+            'cost type': '3D-Var',
+            'time window': {'begin': '2021-01-01T00:00:00Z', 'length': 'PT6H'},
+            'observations': {'observers': observers},
+        },
+    }
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def time_call(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the YAML backends of jcb.')
+    parser.add_argument('--observers', type=int, default=300)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    jedi_dict = synthetic_jedi_dict(args.observers)
+    options = {'default_flow_style': False, 'sort_keys': False}
+
+    # Pure Python
+    dump_python, text_python = time_call(lambda: yaml.dump(jedi_dict, **options), args.repeats)
+    load_python, dict_python = time_call(lambda: yaml.safe_load(text_python), args.repeats)
+
+    # Backend
+    dump_backend, text_backend = time_call(lambda: yaml_backend.dump(jedi_dict, **options),
+                                           args.repeats)
+    load_backend, dict_backend = time_call(lambda: yaml_backend.safe_load(text_backend),
+                                           args.repeats)
+
+    print(f'Backend: {yaml_backend.backend_name()}')
+    print(f'Document size: {len(text_python) / 1e6:.1f} MB ({args.observers} observers)')
+    print(f'Identical output: {text_python == text_backend and dict_python == dict_backend}')
+    print(f'{"":8}{"python (s)":>12}{"backend (s)":>14}{"speed-up":>10}')
+    for name, python, backend in [('load', load_python, load_backend),
+                                  ('dump', dump_python, dump_backend)]:
+        print(f'{name:8}{python:12.3f}{backend:14.3f}{python / backend:10.1f}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    main()
+
+
+# --------------------------------------------------------------------------------------------------
@@ -1,16 +1,75 @@
 # --------------------------------------------------------------------------------------------------
 
 
+import importlib
 import os
 
-from .observation_chronicle.observation_chronicle import ObservationChronicle
-from .observation_chronicle.satellite_chronicle import process_satellite_chronicles
-from .renderer import render as render
-from .renderer import Renderer as Renderer
-from .utilities.config_parsing import datetime_from_conf, duration_from_conf
-from .utilities.parse_channels import parse_channels, parse_channels_set
-from .utilities.testing import get_apps, apps_directory_to_dictionary, render_app_with_test_config
-from .utilities.trapping import abort, abort_if
+
+# --------------------------------------------------------------------------------------------------
+
+
+# The public functions and classes and the modules that define them. They are imported the first
+# time they are used, so that importing jcb does not import Jinja2, PyYAML and the rest of jcb for
+# callers that only need some of the utilities.
+_lazy_imports = {
+    'ObservationChronicle': '.observation_chronicle.observation_chronicle',
+    'process_satellite_chronicles': '.observation_chronicle.satellite_chronicle',
+    'render': '.renderer',
+    'Renderer': '.renderer',
+    'render_async': '.async_renderer',
+    'render_all_async': '.async_renderer',
+    'AsyncRenderer': '.async_renderer',
+    'RenderProfile': '.profiling',
+    'profile_render': '.profiling',
+    'datetime_from_conf': '.utilities.config_parsing',
+    'duration_from_conf': '.utilities.config_parsing',
+    'parse_channels': '.utilities.parse_channels',
+    'parse_channels_set': '.utilities.parse_channels',
+    'get_apps': '.utilities.testing',
+    'apps_directory_to_dictionary': '.utilities.testing',
+    'render_app_with_test_config': '.utilities.testing',
+    'abort': '.utilities.trapping',
+    'abort_if': '.utilities.trapping',
+    'JcbError': '.utilities.trapping',
+    'get_environment': '.environment',
+    'clear_environment_cache': '.environment',
+    'set_environment_cache_size': '.environment',
+    'environment_cache_info': '.environment',
+    'get_archive_environment': '.environment',
+    'compile_template_archive': '.template_archive',
+    'TemplateArchive': '.template_archive',
+    'TemplateBundle': '.template_bundle',
+    'copy_tree': '.utilities.trees',
+    'share_subtrees': '.utilities.trees',
+    'PartialRender': '.partial',
+    'serialize': '.serializers',
+}
+
+
+def __getattr__(name):
+
+    """
+    Import a public function or class, or a submodule, the first time it is used.
+    """
+
+    if name in _lazy_imports:
+        value = getattr(importlib.import_module(_lazy_imports[name], __name__), name)
+    else:
+        try:
+            value = importlib.import_module(f'.{name}', __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f'{__name__}.{name}':
+                raise
+            raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from None
+
+    # Later uses find the value without calling this function
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
 
 
 # --------------------------------------------------------------------------------------------------
@@ -31,6 +90,11 @@ def version():
 __all__ = [
     'Renderer',
     'render',
+    'render_async',
+    'render_all_async',
+    'AsyncRenderer',
+    'RenderProfile',
+    'profile_render',
     'ObservationChronicle',
     'process_satellite_chronicles',
     'datetime_from_conf',
@@ -39,12 +103,25 @@ __all__ = [
     'parse_channels_set',
     'abort_if',
     'abort',
+    'JcbError',
     'version',
     '__version__',
     'get_jcb_path',
     'get_apps',
     'apps_directory_to_dictionary',
     'render_app_with_test_config',
+    'get_environment',
+    'clear_environment_cache',
+    'set_environment_cache_size',
+    'environment_cache_info',
+    'get_archive_environment',
+    'compile_template_archive',
+    'TemplateArchive',
+    'TemplateBundle',
+    'copy_tree',
+    'share_subtrees',
+    'PartialRender',
+    'serialize',
 ]
 
 
@@ -0,0 +1,197 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import asyncio
+import functools
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Rendering from asyncio code, e.g. an asyncio based workflow manager, without blocking the event
+loop. Setting up a Renderer reads the templates and chronicles and rendering runs Jinja2 and parses
+YAML, all of which blocks, so each of these runs in an executor (by default the thread pool of the
+event loop) while the event loop carries on. A Renderer can be shared by threads rendering at the
+same time, so an AsyncRenderer lets many renders of one warm Renderer run concurrently, with a
+bound on how many run at once.
+
+Jinja2's own async rendering (enable_async) is not used: it only helps templates that call async
+functions, which the jcb templates do not, while the template files would still be loaded and
+rendered on the event loop.
+"""
+
+# Default number of renders of an AsyncRenderer, or of render_all_async, that run at once
+default_max_concurrency = 4
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+async def run_in_executor(executor, function, *args, **kwargs):
+
+    """
+    Run a blocking function in an executor of the running event loop and return its result.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(executor, functools.partial(function, *args, **kwargs))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class AsyncRenderer():
+
+    """
+    An asyncio interface to a Renderer. It is created with the create coroutine so that setting up
+    the Renderer does not block the event loop:
+
+      renderer = await jcb.AsyncRenderer.create(dictionary_of_templates)
+      jedi_dicts = await asyncio.gather(*(renderer.render(algorithm) for algorithm in algorithms))
+
+    Attributes:
+        renderer (Renderer): The Renderer that renders in the executor.
+        executor (concurrent.futures.Executor): The executor, None for the default executor of the
+                                                event loop.
+        semaphore (asyncio.Semaphore): Bounds the number of renders that run at once.
+    """
+
+    def __init__(self, renderer, executor=None, max_concurrency=default_max_concurrency):
+        self.renderer = renderer
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    # ----------------------------------------------------------------------------------------------
+
+    @classmethod
+    async def create(cls, template_dict, executor=None, max_concurrency=default_max_concurrency):
+
+        """
+        Set up a Renderer in the executor.
+
+        Args:
+            template_dict (dict): The dictionary of templates.
+            executor (concurrent.futures.Executor): Optional executor, by default the default
+                                                    executor of the event loop. A thread pool is
+                                                    needed for the renders to share the Renderer.
+            max_concurrency (int): The maximum number of renders that run at once.
+
+        Returns:
+            AsyncRenderer: The asyncio interface to the Renderer.
+        """
+
+        renderer = await run_in_executor(executor, jcb.Renderer, template_dict)
+
+        return cls(renderer, executor, max_concurrency)
+
+    # ----------------------------------------------------------------------------------------------
+
+    async def render(self, algorithm):
+
+        """
+        Renders an algorithm, see Renderer.render.
+
+        Args:
+            algorithm (str): The name of the algorithm to assemble a YAML for.
+
+        Returns:
+            dict: The dictionary that can drive the JEDI executable.
+        """
+
+        async with self.semaphore:
+            return await run_in_executor(self.executor, self.renderer.render, algorithm)
+
+    # ----------------------------------------------------------------------------------------------
+
+    async def render_text(self, algorithm, output_format='yaml'):
+
+        """
+        Renders an algorithm and writes it out in one of the output formats, see
+        Renderer.render_text.
+        """
+
+        async with self.semaphore:
+            return await run_in_executor(self.executor, self.renderer.render_text, algorithm,
+                                         output_format)
+
+    # ----------------------------------------------------------------------------------------------
+
+    async def render_many(self, algorithms):
+
+        """
+        Renders several algorithms concurrently.
+
+        Args:
+            algorithms (list): The names of the algorithms.
+
+        Returns:
+            list: The rendered dictionaries in the order of the algorithms.
+        """
+
+        return list(await asyncio.gather(*(self.render(algorithm) for algorithm in algorithms)))
+
+    # ----------------------------------------------------------------------------------------------
+
+    async def close(self):
+
+        """
+        Stops the processes used for rendering the observations, if any.
+        """
+
+        await run_in_executor(self.executor, self.renderer.close)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+async def render_async(template_dict, executor=None):
+
+    """
+    Creates the JEDI configuration from a dictionary of templates without blocking the event
+    loop, see jcb.render.
+
+    Args:
+        template_dict (dict): A dictionary that must include an 'algorithm' key among the templates.
+        executor (concurrent.futures.Executor): Optional executor, by default the default executor
+                                                of the event loop.
+
+    Returns:
+        dict: The rendered JEDI dictionary.
+    """
+
+    return await run_in_executor(executor, jcb.render, template_dict)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+async def render_all_async(template_dicts, max_concurrency=default_max_concurrency, executor=None):
+
+    """
+    Creates the JEDI configurations for many dictionaries of templates concurrently, e.g. for the
+    tasks of a cycle, with at most max_concurrency renders running at once.
+
+    Args:
+        template_dicts (list): Dictionaries that must each include an 'algorithm' key.
+        max_concurrency (int): The maximum number of renders that run at once.
+        executor (concurrent.futures.Executor): Optional executor, by default the default executor
+                                                of the event loop.
+
+    Returns:
+        list: The rendered JEDI dictionaries in the order of the dictionaries of templates.
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def render_one(template_dict):
+        async with semaphore:
+            return await render_async(template_dict, executor)
+
+    return list(await asyncio.gather(*(render_one(template_dict)
+                                       for template_dict in template_dicts)))
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,331 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing.util
+import os
+import shutil
+import sys
+import time
+
+import jcb
+from jcb.fragment_cache import canonical_value
+from jcb.renderer_cache import RendererCache
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Rendering of many dictionaries of templates in one process, e.g. every member and cycle of an
+experiment. The dictionaries of templates are read from a directory, a multi document YAML or a
+JSONL stream and rendered by a pool of worker processes. Each worker keeps a Renderer for each of
+the setups it renders (see RendererCache), so dictionaries of templates that share their search
+paths reuse the compiled templates and the rendered observers.
+
+Identical dictionaries of templates are rendered once and the result is written for each of them.
+The distinct dictionaries of templates are rendered largest first, so that the longest renders do
+not finish last, and can be split into shards that are rendered by separate jobs, e.g. the tasks of
+a scheduler job array. The split only depends on the dictionaries of templates, so every job
+computes the same shards.
+"""
+
+# Extensions of the files read from a directory
+batch_file_extensions = ('.yaml', '.yml', '.json', '.jsonl')
+
+# The Renderers of a worker process of render_batch
+_worker_renderers = None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_batch_file(path, stream=None):
+
+    """
+    Read the dictionaries of templates in a YAML, JSON or JSONL file.
+
+    Args:
+        path (str): The path of the file, which also names the dictionaries of templates.
+        stream (file): Optional stream to read instead of the file.
+
+    Returns:
+        list: The name and the dictionary of templates of each document. A file with a single
+              document names it after the file, otherwise the index of the document is appended.
+    """
+
+    if stream is None:
+        with open(path, 'r') as f:
+            return read_batch_file(path, f)
+
+    if path.endswith('.jsonl') or path == '-':
+        documents = [json.loads(line) for line in stream if line.strip()]
+    else:
+        documents = [document for document in yaml_backend.safe_load_all(stream)
+                     if document is not None]
+
+    for index, document in enumerate(documents):
+        jcb.abort_if(not isinstance(document, dict),
+                     f'Document {index} of {path} is not a dictionary of templates.')
+
+    stem = 'stdin' if path == '-' else os.path.splitext(os.path.basename(path))[0]
+
+    if len(documents) == 1:
+        return [(stem, documents[0])]
+
+    return [(f'{stem}_{index:04d}', document) for index, document in enumerate(documents)]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_batch(source):
+
+    """
+    Read the dictionaries of templates of a batch.
+
+    Args:
+        source (str): A directory of YAML, JSON or JSONL files, a multi document YAML, a JSONL
+                      file, or '-' for a JSONL stream on standard input.
+
+    Returns:
+        list: The name and the dictionary of templates of each job.
+    """
+
+    if source == '-':
+        jobs = read_batch_file(source, sys.stdin)
+    elif os.path.isdir(source):
+        jobs = []
+        for file_name in sorted(os.listdir(source)):
+            if file_name.endswith(batch_file_extensions):
+                jobs += read_batch_file(os.path.join(source, file_name))
+    else:
+        jobs = read_batch_file(source)
+
+    names = [name for name, _ in jobs]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    jcb.abort_if(duplicates, lambda: f'The batch {source} has more than one dictionary of '
+                                     f'templates named {", ".join(duplicates)}.')
+
+    return jobs
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_shard(shard):
+
+    """
+    Parse a shard given as 'i/N', the i-th of N shards counting from 0.
+
+    Args:
+        shard (str): The shard.
+
+    Returns:
+        tuple: The index of the shard and the number of shards.
+    """
+
+    try:
+        index, count = (int(part) for part in shard.split('/'))
+    except ValueError:
+        jcb.abort(f'The shard {shard} is not of the form i/N.')
+
+    jcb.abort_if(not 0 <= index < count,
+                 f'The shard {shard} must satisfy 0 <= i < N.')
+
+    return index, count
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def estimated_size(template_dict):
+
+    """
+    Returns an estimate of the cost of rendering a dictionary of templates, the number of
+    observations it renders.
+    """
+
+    observations = template_dict.get('observations', 'all_observations')
+
+    if observations in ('all_observations', ['all_observations']):
+        obs_path = template_dict.get('app_path_observations')
+        if isinstance(obs_path, str) and os.path.isdir(obs_path):
+            return len(jcb.renderer.list_observations(obs_path))
+        return 0
+
+    return len(observations) if isinstance(observations, list) else 1
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def plan_batch(jobs, shard=(0, 1)):
+
+    """
+    Group identical dictionaries of templates and order the groups largest first.
+
+    Args:
+        jobs (list): The name and the dictionary of templates of each job.
+        shard (tuple): The index of the shard to return and the number of shards.
+
+    Returns:
+        list: The names and the dictionary of templates of each distinct dictionary of templates
+              in the shard, in the order they should be rendered.
+    """
+
+    groups = {}
+    for name, template_dict in jobs:
+        key = canonical_value(template_dict)
+        if key not in groups:
+            groups[key] = ([], template_dict)
+        groups[key][0].append(name)
+
+    # The order, and so the shards, only depend on the dictionaries of templates
+    ordered = sorted(groups.items(), key=lambda item: (-estimated_size(item[1][1]), item[0]))
+
+    index, count = shard
+    return [(sorted(names), template_dict) for _, (names, template_dict) in ordered[index::count]]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def initialize_worker():
+
+    """
+    Create the Renderers of a worker process, which are closed when the worker exits.
+    """
+
+    global _worker_renderers
+
+    _worker_renderers = RendererCache()
+    multiprocessing.util.Finalize(_worker_renderers, _worker_renderers.close, exitpriority=0)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_worker_job(template_dict, output_paths, output_format):
+
+    """
+    Render a dictionary of templates in a worker process, see render_batch_job.
+    """
+
+    return render_batch_job(template_dict, output_paths, _worker_renderers, False, output_format)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_batch_job(template_dict, output_paths, renderers, single_process=True,
+                     output_format='yaml'):
+
+    """
+    Render a dictionary of templates and write the result to each output path.
+
+    Args:
+        template_dict (dict): The dictionary of templates.
+        output_paths (list): The paths of the files to write.
+        renderers (RendererCache): The Renderers of the process.
+        single_process (bool): Whether the batch is rendered by this process alone. Otherwise the
+                               Renderer renders its observations itself rather than starting a
+                               pool of processes of its own.
+        output_format (str): The format of the files, see jcb.serializers.
+
+    Returns:
+        tuple: The time taken in seconds and the error message, or None if the render succeeded.
+    """
+
+    start = time.perf_counter()
+
+    try:
+        jcb.abort_if('algorithm' not in template_dict,
+                     'The dictionary of templates must have an algorithm key')
+
+        if not single_process:
+            template_dict = {**template_dict, 'jcb_workers': 1}
+
+        renderer = renderers.get(template_dict)
+        jedi_text = renderer.render_text(template_dict['algorithm'], output_format)
+
+        jcb.abort_if(jedi_text is None,
+                     f'Resolving the templates for {template_dict["algorithm"]} failed.')
+
+        # Identical dictionaries of templates get copies of the first file
+        with open(output_paths[0], 'w') as f:
+            f.write(jedi_text)
+        for output_path in output_paths[1:]:
+            shutil.copyfile(output_paths[0], output_path)
+
+        error = None
+
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+
+    return time.perf_counter() - start, error
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_batch(jobs, output_dir, workers=1, shard=(0, 1), output_format='yaml'):
+
+    """
+    Render a batch of dictionaries of templates, writing <name>.<format> in the output directory
+    for each of them.
+
+    Args:
+        jobs (list): The name and the dictionary of templates of each job (see read_batch).
+        output_dir (str): The directory to write the rendered configurations to.
+        workers (int): The number of worker processes. With one worker the batch is rendered by
+                       this process.
+        shard (tuple): The index of the shard to render and the number of shards.
+        output_format (str): The format of the files, see jcb.serializers.
+
+    Returns:
+        dict: A summary of the batch with the time taken and the error, if any, of each render.
+    """
+
+    start = time.perf_counter()
+
+    groups = plan_batch(jobs, shard)
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_paths = [[os.path.join(output_dir, f'{name}.{output_format}') for name in names]
+                    for names, _ in groups]
+
+    if workers > 1 and len(groups) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(groups)),
+                                 initializer=initialize_worker) as executor:
+            futures = [executor.submit(render_worker_job, template_dict, paths, output_format)
+                       for (_, template_dict), paths in zip(groups, output_paths)]
+            results = [future.result() for future in futures]
+    else:
+        # The Renderers, and the processes they render the observations with, are closed once
+        # the batch is rendered
+        with RendererCache() as renderers:
+            results = [render_batch_job(template_dict, paths, renderers, True, output_format)
+                       for (_, template_dict), paths in zip(groups, output_paths)]
+
+    renders = []
+    for (names, _), (seconds, error) in zip(groups, results):
+        render = {'names': names, 'seconds': round(seconds, 4),
+                  'status': 'ok' if error is None else 'failed'}
+        if error is not None:
+            render['error'] = error
+        renders.append(render)
+
+    return {
+        'shard': f'{shard[0]}/{shard[1]}',
+        'jobs': sum(len(names) for names, _ in groups),
+        'distinct': len(groups),
+        'failed': sum(1 for render in renders if render['status'] != 'ok'),
+        'workers': workers,
+        'seconds': round(time.perf_counter() - start, 4),
+        'renders': renders,
+    }
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,232 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import re
+import weakref
+
+from jcb.profiling import timed
+from jcb.template_analysis import set_template_dependencies, source_dependencies
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Removal of observer components from the observation templates before they are rendered. An
+algorithm only allows some of the components of an observer (see observer_components.yaml), so
+rather than rendering and parsing every component and then deleting those that are not allowed,
+the top level blocks of the observation template that hold components which are not allowed are
+removed from the source of the template.
+
+A block is only removed when this cannot change the rest of the document: the block must not
+contain Jinja2 statements, which could open or close a block that continues outside it, and must
+not define an anchor that is used elsewhere. A template that cannot be split into top level
+blocks safely is not pruned. The components are always removed again after parsing, so a template
+that is not pruned gives the same result.
+"""
+
+# A top level key of an observation template, e.g. 'obs filters:'
+top_level_key = re.compile(r'([A-Za-z_][\w .\-]*):(\s|$)')
+
+# Anchors defined in YAML, e.g. '&amsua_n19_channels'
+yaml_anchor = re.compile(r'&([^\s,\[\]{}]+)')
+
+# Included templates, e.g. '{% include ... %}', whose top level keys cannot be seen in the source
+template_statement = re.compile(r'\{%-?\s*(include|extends|import|from|call|block)\b')
+
+# Pruned templates for each template and set of components. None is stored when nothing can be
+# removed, since storing the template itself would keep it alive.
+_pruned_templates = weakref.WeakKeyDictionary()
+
+# Whether pruning removes every component that is not allowed, for each template and set of
+# components
+_complete_prunes = weakref.WeakKeyDictionary()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def top_level_blocks(source):
+
+    """
+    Split the source of a template into its top level YAML blocks.
+
+    Args:
+        source (str): The source of the template.
+
+    Returns:
+        list: The key (None for the text before the first key) and the text of each block, or
+              None if the source cannot be split safely.
+    """
+
+    blocks = [[None, []]]
+
+    for line in source.splitlines(keepends=True):
+
+        if line[:1] in ('', ' ', '\t', '\n', '\r', '-', '#') or line.startswith('{%'):
+            blocks[-1][1].append(line)
+            continue
+
+        match = top_level_key.match(line)
+        if match is None:
+            return None
+
+        blocks.append([match.group(1), [line]])
+
+    return [(key, ''.join(lines)) for key, lines in blocks]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def prune_source(source, components):
+
+    """
+    Remove the top level blocks that are not allowed from the source of an observation template.
+
+    Args:
+        source (str): The source of the template.
+        components (frozenset): The allowed components.
+
+    Returns:
+        str: The pruned source, or None if nothing could be removed.
+    """
+
+    # Comments and raw blocks could hide what looks like a top level key
+    if '{#' in source or 'raw %}' in source or 'raw -%}' in source:
+        return None
+
+    blocks = top_level_blocks(source)
+    if blocks is None:
+        return None
+
+    removable = [key is not None and key not in components and '{%' not in text and
+                 text.count('{{') == text.count('}}') for key, text in blocks]
+
+    if not any(removable):
+        return None
+
+    # Keep blocks that define anchors used by the blocks that are kept, until none are found
+    anchor_used = True
+    while anchor_used:
+        anchor_used = False
+        kept_text = ''.join(text for (_, text), remove in zip(blocks, removable) if not remove)
+        for index, (_, text) in enumerate(blocks):
+            anchors = yaml_anchor.findall(text) if removable[index] else []
+            if any(f'*{anchor}' in kept_text for anchor in anchors):
+                removable[index] = False
+                anchor_used = True
+
+    if not any(removable):
+        return None
+
+    return ''.join(text for (_, text), remove in zip(blocks, removable) if not remove)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def source_pruner(fragment_names, components):
+
+    """
+    Return a function that prunes the sources of the observation templates as pruned_template
+    does, so that a render can be planned from the sources that it renders (see
+    jcb.template_analysis.source_analysis).
+
+    Args:
+        fragment_names (set): Names of the observation templates.
+        components (frozenset): The allowed components.
+
+    Returns:
+        function: Returns the pruned source from the name and the source of a template.
+    """
+
+    def prune(name, source):
+        if name not in fragment_names:
+            return source
+        return prune_source(source, components) or source
+
+    return prune
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@timed('observer_pruning')
+def pruned_template(env, template, components):
+
+    """
+    Return the template with the observer components that are not allowed removed. The pruned
+    templates are compiled once and kept for as long as the template is.
+
+    Args:
+        env (jinja2.Environment): The environment the template was loaded with.
+        template (jinja2.Template): The observation template.
+        components (frozenset): The allowed components, or None if all are allowed.
+
+    Returns:
+        jinja2.Template: The pruned template, or the template if nothing can be removed.
+    """
+
+    if components is None or not env.loader.has_source_access:
+        return template
+
+    pruned = _pruned_templates.setdefault(template, {})
+
+    if components not in pruned:
+
+        source, filename, _ = env.loader.get_source(env, template.name)
+        pruned_source = prune_source(source, components)
+
+        if pruned_source is None:
+            pruned[components] = None
+        else:
+            code = env.compile(pruned_source, template.name, filename)
+            pruned[components] = env.template_class.from_code(env, code, template.globals)
+            set_template_dependencies(pruned[components],
+                                      source_dependencies(env, pruned_source))
+
+    return pruned[components] or template
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@timed('observer_pruning')
+def prunes_completely(env, template, components):
+
+    """
+    Returns True if pruning the template (see pruned_template) removes every top level block that
+    is not allowed, so that the rendered template holds no components that have to be removed
+    after parsing. A template whose top level keys cannot all be found in its source, e.g.
+    because they are written by an included template or an expression, is not pruned completely.
+
+    Args:
+        env (jinja2.Environment): The environment the template was loaded with.
+        template (jinja2.Template): The observation template.
+        components (frozenset): The allowed components.
+
+    Returns:
+        bool: Whether the pruned template only holds allowed components.
+    """
+
+    if not env.loader.has_source_access:
+        return False
+
+    complete = _complete_prunes.setdefault(template, {})
+
+    if components not in complete:
+
+        source = env.loader.get_source(env, template.name)[0]
+        pruned_source = prune_source(source, components) or source
+
+        blocks = None
+        if '{#' not in pruned_source and not template_statement.search(pruned_source):
+            blocks = top_level_blocks(pruned_source)
+
+        complete[components] = blocks is not None and \
+            all(key is None or key in components for key, _ in blocks)
+
+    return complete[components]
+
+
+# --------------------------------------------------------------------------------------------------
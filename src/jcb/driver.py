@@ -1,8 +1,15 @@
 # --------------------------------------------------------------------------------------------------
 
+import os
+import signal
+import sys
+
 import click
 import jcb
-import yaml
+
+# The output formats of jcb.serializers, spelled out so that the serializers and the YAML backend
+# are only imported by the commands that use them
+output_formats = ('yaml', 'json', 'jsonl')
 
 # --------------------------------------------------------------------------------------------------
 
@@ -35,7 +42,34 @@ def jcb_driver():
 @jcb_driver.command()
 @click.argument('dictionary_of_templates')
 @click.argument('jedi_yaml')
-def render(dictionary_of_templates, jedi_yaml):
+@click.option('--passthrough', is_flag=True, default=False,
+              help='Write the rendered text directly instead of parsing it and writing it out '
+                   'again. The text is only parsed when observer components have to be removed '
+                   'that cannot be removed from the templates before they are rendered.')
+@click.option('--server', 'server_socket', default=None,
+              help='Socket of a jcb server (see jcb serve) to render with. If the server cannot '
+                   'be reached the rendering is done by this process.')
+@click.option('--server-timeout', type=float, default=None,
+              help='Seconds to wait for the server to connect and to respond before rendering '
+                   'in this process, 120 by default.')
+@click.option('--cycles', default=None,
+              help='Render one configuration for each window beginning in START:END:STEP, e.g. '
+                   '2020-01-01T00:00:00Z:2020-12-31T18:00:00Z:PT6H. JEDI_YAML is formatted with '
+                   'the window beginning using strftime directives, e.g. hofx_%Y%m%d%H.yaml.')
+@click.option('--format', 'output_format', default=None,
+              type=click.Choice(output_formats),
+              help='Format of the JEDI configuration. JSONL writes the configuration without its '
+                   'observers on the first line and then one observer per line. Defaults to the '
+                   'format of the extension of JEDI_YAML, otherwise yaml.')
+@click.option('--profile', is_flag=True, default=False,
+              help='Print the time spent in each phase of the render and in each template, the '
+                   'calls of the observation chronicle functions and the peak memory. The result '
+                   'cache is not used.')
+@click.option('--profile-memory', is_flag=True, default=False,
+              help='With --profile, also trace the peak memory allocated by Python, which slows '
+                   'down the render several times over.')
+def render(dictionary_of_templates, jedi_yaml, passthrough, server_socket, server_timeout, cycles,
+           output_format, profile, profile_memory):
 
     """
     Create a new YAML file for driving a JEDI experiment using a dictionary of templates.
@@ -45,16 +79,441 @@ def render(dictionary_of_templates, jedi_yaml):
         jedi_yaml (str): YAML output file containing JEDI configuration. \n
     """
 
+    from jcb.utilities import yaml_backend
+
     # Open the dictionary of templates yaml into a dictionary
     with open(dictionary_of_templates, 'r') as f:
-        dictionary_of_templates = yaml.safe_load(f)
+        dictionary_of_templates = yaml_backend.safe_load(f)
+
+    if output_format is None:
+        output_format = jcb.serializers.format_from_path(jedi_yaml)
+
+    jcb.abort_if(passthrough and output_format != 'yaml',
+                 '--passthrough can only be used with the yaml format.')
+
+    # Render while profiling
+    if profile or profile_memory:
+        jcb.abort_if(cycles or server_socket, '--profile cannot be combined with --cycles or '
+                                              '--server.')
+        render_profile(dictionary_of_templates, jedi_yaml, passthrough, output_format,
+                       profile_memory)
+        return
+
+    # Render a sweep over cycles
+    if cycles:
+        jcb.abort_if(passthrough or server_socket,
+                     '--cycles cannot be combined with --passthrough or --server.')
+        render_cycles(dictionary_of_templates, jedi_yaml, cycles, output_format)
+        return
+
+    # Render with the server if one is running
+    if server_socket:
+        try:
+            jedi_text = jcb.server.render_with_server(
+                server_socket, dictionary_of_templates, output_format=output_format,
+                passthrough=passthrough, timeout=server_timeout or jcb.server.default_timeout)
+        except OSError:
+            pass
+        else:
+            with open(jedi_yaml, 'w') as f:
+                f.write(jedi_text)
+            return
+
+    # Make sure the dictionary of templates has the algorithm key
+    jcb.abort_if('algorithm' not in dictionary_of_templates,
+                 'The dictionary of templates must have an algorithm key')
+
+    # Read the result from the result cache if one is used
+    result_cache = jcb.result_cache.result_cache_for(dictionary_of_templates)
+    if result_cache is not None and not passthrough:
+        jedi_dict, observer_nesting = result_cache.render(dictionary_of_templates)
+        jcb.abort_if(jedi_dict is None, 'Rendering the dictionary of templates failed.')
+        with open(jedi_yaml, 'w') as f:
+            f.write(jcb.serialize(jedi_dict, output_format, observer_nesting))
+        return
+
+    renderer = jcb.Renderer(dictionary_of_templates)
+
+    if passthrough:
+        # Render straight to YAML
+        jedi_text = renderer.render_yaml(dictionary_of_templates['algorithm'])
+    else:
+        jedi_text = renderer.render_text(dictionary_of_templates['algorithm'], output_format)
 
-    # Call the jcb render function
-    jedi_dict = jcb.render(dictionary_of_templates)
+    jcb.abort_if(jedi_text is None, 'Rendering the dictionary of templates failed.')
 
-    # Write jedi_dict to yaml file
     with open(jedi_yaml, 'w') as f:
-        yaml.dump(jedi_dict, f, default_flow_style=False, sort_keys=False)
+        f.write(jedi_text)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_profile(dictionary_of_templates, jedi_yaml, passthrough=False, output_format='yaml',
+                   trace_memory=False):
+
+    """
+    Render a dictionary of templates while profiling and print the profile.
+
+    Args:
+        dictionary_of_templates (dict): The dictionary of templates.
+        jedi_yaml (str): The output file.
+        passthrough (bool): Whether the rendered text is written directly.
+        output_format (str): The format of the output file.
+        trace_memory (bool): Whether the peak memory allocated by Python is traced.
+    """
+
+    jcb.abort_if('algorithm' not in dictionary_of_templates,
+                 'The dictionary of templates must have an algorithm key')
+
+    algorithm = dictionary_of_templates['algorithm']
+
+    with jcb.RenderProfile(trace_memory) as profile:
+        with jcb.Renderer(dictionary_of_templates) as renderer:
+            if passthrough:
+                jedi_text = renderer.render_yaml(algorithm)
+            else:
+                jedi_text = renderer.render_text(algorithm, output_format)
+
+    jcb.abort_if(jedi_text is None, 'Rendering the dictionary of templates failed.')
+
+    with open(jedi_yaml, 'w') as f:
+        f.write(jedi_text)
+
+    click.echo(profile.table())
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_cycles(dictionary_of_templates, jedi_yaml, cycles, output_format='yaml'):
+
+    """
+    Render a dictionary of templates for a range of cycles, writing a file for each cycle.
+
+    Args:
+        dictionary_of_templates (dict): The dictionary of templates.
+        jedi_yaml (str): The output file, formatted with the beginning of each window.
+        cycles (str): The range of window beginnings, START:END:STEP.
+        output_format (str): The format of the output files.
+    """
+
+    window_begins = jcb.utilities.config_parsing.cycles_from_conf(cycles)
+
+    output_files = [window_begin.strftime(jedi_yaml) for window_begin in window_begins]
+    jcb.abort_if(len(set(output_files)) != len(output_files),
+                 f'The output file {jedi_yaml} must contain strftime directives, e.g. %Y%m%d%H, '
+                 f'that give a different file for each cycle.')
+
+    jcb.abort_if('algorithm' not in dictionary_of_templates,
+                 'The dictionary of templates must have an algorithm key')
+
+    algorithm = dictionary_of_templates['algorithm']
+
+    with jcb.Renderer(dictionary_of_templates) as renderer:
+        observer_nesting = renderer.observer_nesting(algorithm)
+        cycle_dicts = renderer.render_cycles(algorithm, window_begins)
+        for output_file, (window_begin, jedi_dict) in zip(output_files, cycle_dicts):
+
+            jcb.abort_if(jedi_dict is None, f'Rendering the cycle {window_begin} failed.')
+
+            with open(output_file, 'w') as f:
+                f.write(jcb.serialize(jedi_dict, output_format, observer_nesting))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.command('render-batch')
+@click.argument('source')
+@click.argument('output_dir')
+@click.option('--workers', default=1, show_default=True,
+              help='Number of worker processes rendering the batch.')
+@click.option('--shard', default='0/1', show_default=True,
+              help='Render only shard i of N, counting from 0, e.g. for the tasks of a job array.')
+@click.option('--summary', 'summary_path', default=None,
+              help='Path of the YAML summary of the batch. Defaults to batch_summary.yaml, or '
+                   'batch_summary_<i>_of_<N>.yaml for a shard, in the output directory.')
+@click.option('--format', 'output_format', default='yaml', show_default=True,
+              type=click.Choice(output_formats),
+              help='Format of the JEDI configurations.')
+def render_batch(source, output_dir, workers, shard, summary_path, output_format):
+
+    """
+    Render many dictionaries of templates, writing OUTPUT_DIR/<name>.<format> for each of them.
+
+    The dictionaries of templates are read from a directory of YAML, JSON or JSONL files, a multi
+    document YAML or a JSONL file, or from a JSONL stream on standard input when SOURCE is -.
+    Identical dictionaries of templates are rendered once, and dictionaries of templates with the
+    same search paths reuse the templates and observers rendered before. The time taken and the
+    error of each render are written to the summary, and the command fails if any render failed.
+
+    Arguments: \n
+        source (str): Directory, file or - containing the dictionaries of templates. \n
+        output_dir (str): Directory to write the JEDI configurations to. \n
+    """
+
+    from jcb.utilities import yaml_backend
+
+    shard = jcb.batch.parse_shard(shard)
+
+    jobs = jcb.batch.read_batch(source)
+    summary = jcb.batch.render_batch(jobs, output_dir, workers, shard, output_format)
+
+    if summary_path is None:
+        summary_name = 'batch_summary.yaml' if shard[1] == 1 else \
+            f'batch_summary_{shard[0]}_of_{shard[1]}.yaml'
+        summary_path = os.path.join(output_dir, summary_name)
+
+    with open(summary_path, 'w') as f:
+        yaml_backend.dump(summary, f, default_flow_style=False, sort_keys=False)
+
+    print(f'Rendered {summary["distinct"] - summary["failed"]} of {summary["distinct"]} distinct '
+          f'dictionaries of templates ({summary["jobs"]} jobs) in {summary["seconds"]:.2f} s')
+
+    jcb.abort_if(summary['failed'], f'{summary["failed"]} renders failed, see {summary_path}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.command()
+@click.argument('socket_path')
+@click.option('--max-renderers', default=8, show_default=True,
+              help='Maximum number of Renderers, one per template setup, kept in memory.')
+def serve(socket_path, max_renderers):
+
+    """
+    Run a render server on a Unix domain socket.
+
+    The server keeps the compiled templates, processed chronicles and rendered observers in memory
+    between requests, so that rendering with jcb render --server SOCKET_PATH only costs the render
+    itself. The server runs until it is interrupted.
+
+    Arguments: \n
+        socket_path (str): Path of the Unix domain socket to listen on. \n
+    """
+
+    server = jcb.server.create_server(socket_path, max_renderers)
+
+    print(f'jcb server listening on {socket_path}')
+
+    # Stop cleanly, removing the socket, when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.command()
+@click.argument('dictionary_of_templates')
+@click.argument('archive')
+def compile(dictionary_of_templates, archive):
+
+    """
+    Compile the templates used by a dictionary of templates into an archive.
+
+    The algorithm templates and the algorithm, model and observation directories of the app chosen
+    in the dictionary of templates are compiled ahead of time and stored in a single archive. A
+    Renderer will load the compiled templates from the archive when the dictionary of templates
+    contains jcb_template_archive: <archive>.
+
+    Arguments: \n
+        dictionary_of_templates (str): Path to a YAML containing the dictionary of templates. \n
+        archive (str): Path of the archive to write. \n
+    """
+
+    from jcb.utilities import yaml_backend
+
+    # Open the dictionary of templates yaml into a dictionary
+    with open(dictionary_of_templates, 'r') as f:
+        dictionary_of_templates = yaml_backend.safe_load(f)
+
+    # Compile the templates
+    template_names = jcb.compile_template_archive(dictionary_of_templates, archive)
+
+    print(f'Compiled {len(template_names)} templates into {archive}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.command()
+@click.argument('dictionary_of_templates')
+@click.option('--algorithm', 'algorithms', multiple=True,
+              help='Algorithm to plan, can be repeated. Defaults to the algorithm key of the '
+                   'dictionary of templates.')
+def deps(dictionary_of_templates, algorithms):
+
+    """
+    Report what rendering a dictionary of templates needs, without rendering.
+
+    For each algorithm the templates that will be loaded, the keys of the dictionary of templates
+    that will be read and the observers that are active are written as YAML. The command fails if
+    keys are missing from the dictionary of templates or included templates do not exist. Keys
+    that are only read by if branches that cannot be decided without rendering are listed as
+    conditional_keys and do not fail the command.
+
+    Arguments: \n
+        dictionary_of_templates (str): Path to a YAML containing the dictionary of templates. \n
+    """
+
+    from jcb.utilities import yaml_backend
+
+    # Open the dictionary of templates yaml into a dictionary
+    with open(dictionary_of_templates, 'r') as f:
+        dictionary_of_templates = yaml_backend.safe_load(f)
+
+    if not algorithms:
+        jcb.abort_if('algorithm' not in dictionary_of_templates,
+                     'The dictionary of templates must have an algorithm key or --algorithm must '
+                     'be given')
+        algorithms = [dictionary_of_templates['algorithm']]
+
+    renderer = jcb.Renderer(dictionary_of_templates)
+    plans = [renderer.plan(algorithm) for algorithm in algorithms]
+
+    print(yaml_backend.dump(plans, default_flow_style=False, sort_keys=False), end='')
+
+    # Fail once everything has been reported
+    for algorithm in algorithms:
+        renderer.validate(algorithm)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.command()
+@click.argument('trees', nargs=-1)
+def index(trees):
+
+    """
+    Write the manifest of trees of templates, so that rendering does not list their directories.
+
+    The manifest (jcb_index.json at the root of each tree) holds the files of each directory and
+    the parsed observer_components.yaml files. It is used while no file has been added, removed
+    or renamed in the directories it lists; run jcb index again after editing templates in the
+    tree. Defaults to the configuration directory of jcb.
+
+    Arguments: \n
+        trees (str): The roots of the trees of templates, e.g. a clone of a client. \n
+    """
+
+    for tree in trees or [jcb.renderer.get_config_path()]:
+        manifest = jcb.tree_index.write_index(tree)
+        files = sum(len(directory['files']) for directory in manifest['directories'].values())
+        print(f'Indexed {files} files in {len(manifest["directories"])} directories of {tree}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.command()
+@click.argument('archive')
+@click.argument('directories', nargs=-1, required=True)
+def bundle(archive, directories):
+
+    """
+    Bundle directories of templates into a single zip archive.
+
+    Each directory is stored under its name, or under NAME when given as NAME=DIRECTORY (an empty
+    NAME stores it at the top of the bundle). algorithm_path and the app_path_ keys of the
+    dictionary of templates can then be paths inside the bundle, e.g. ARCHIVE/algorithms, which
+    are read from the bundle with a single read.
+
+    Arguments: \n
+        archive (str): Path of the bundle to write, ending in .zip. \n
+        directories (str): The directories of templates, e.g. jcb-algorithms and a client. \n
+    """
+
+    named_directories = {}
+    for directory in directories:
+        name, separator, path = directory.rpartition('=')
+        if not separator:
+            name = os.path.basename(os.path.normpath(path))
+        jcb.abort_if(name in named_directories, f'Two directories are bundled as {name}.')
+        named_directories[name] = path
+
+    files = jcb.template_bundle.write_bundle(archive, named_directories)
+
+    print(f'Bundled {files} files into {archive}')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@jcb_driver.group()
+@click.option('--cache-dir', envvar='JCB_RESULT_CACHE_DIR', default=None,
+              help='The result cache directory. Defaults to the JCB_RESULT_CACHE_DIR environment '
+                   'variable.')
+@click.pass_context
+def cache(context, cache_dir):
+
+    """
+    Manage the cache of rendered configurations.
+
+    Rendered configurations are stored in the cache directory given by jcb_result_cache_dir in the
+    dictionary of templates or the JCB_RESULT_CACHE_DIR environment variable, and read back
+    instead of rendering when the dictionary of templates, the algorithm, the templates and the
+    observation chronicles are the same.
+    """
+
+    jcb.abort_if(not cache_dir, 'A cache directory must be given with --cache-dir or the '
+                                'JCB_RESULT_CACHE_DIR environment variable.')
+
+    max_size = os.environ.get(jcb.result_cache.result_cache_size_environment_variable) or \
+        jcb.result_cache.default_max_size
+    context.obj = jcb.result_cache.ResultCache(cache_dir, max_size)
+
+
+@cache.command()
+@click.pass_obj
+def stats(result_cache):
+
+    """
+    Report the number and size of the cached results and the hits and misses.
+    """
+
+    from jcb.utilities import yaml_backend
+
+    print(yaml_backend.dump(result_cache.stats(), default_flow_style=False, sort_keys=False),
+          end='')
+
+
+@cache.command()
+@click.option('--max-size', default=None,
+              help='Size to prune the cache to, e.g. 500M. Defaults to the JCB_RESULT_CACHE_SIZE '
+                   'environment variable, otherwise 1G.')
+@click.pass_obj
+def prune(result_cache, max_size):
+
+    """
+    Remove the least recently used results until the cache fits in its size.
+    """
+
+    removed = result_cache.prune(max_size)
+
+    print(f'Removed {removed} results from {result_cache.directory}')
+
+
+@cache.command()
+@click.pass_obj
+def clear(result_cache):
+
+    """
+    Remove all the results and reset the hit and miss counters.
+    """
+
+    result_cache.clear()
+
+    print(f'Cleared {result_cache.directory}')
 
 
 # --------------------------------------------------------------------------------------------------
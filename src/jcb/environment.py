@@ -0,0 +1,385 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from collections import OrderedDict
+import contextlib
+import contextvars
+import os
+import threading
+
+import jcb
+from jcb.fragment_cache import active_collector
+from jcb.profiling import phase, profiled_template
+from jcb.template_analysis import template_function_names
+from jcb.utilities.files import write_atomic
+import jinja2 as j2
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Process wide registry of Jinja2 environments. Creating a Jinja2 environment is cheap but every
+template that is compiled is stored in the cache of the environment that loaded it. When each
+Renderer creates its own environment all the compiled templates are thrown away when the Renderer
+goes out of scope. Keeping the environments in a registry keyed by the search paths means that
+Renderers using the same paths only pay the compile cost once per process. Jinja2 checks the
+modification time of each source file before reusing a compiled template (auto_reload) so edits to
+the templates are still picked up. Optionally the compiled templates can also be written to a
+cache directory so that they are shared between processes.
+
+Since an environment is shared, the functions of the observation chronicle of each Renderer are
+passed with the dictionary of templates when rendering. The environment also has globals of the
+same names that call the functions of the render running in the thread, so that templates that
+are imported without context, e.g. macros, can call them as well.
+"""
+
+# Maximum number of environments to hold on to. The least recently used environment is evicted
+# when the registry grows beyond this size.
+environment_cache_size = 16
+
+# Maximum number of compiled templates each environment will hold on to.
+template_cache_size = 2000
+
+# Environment variable that can be used to provide a directory for the bytecode cache.
+cache_dir_environment_variable = 'JCB_CACHE_DIR'
+
+# Registry of environments and a lock so that the registry can be shared between threads.
+_environments = OrderedDict()
+_environments_lock = threading.Lock()
+
+# The functions of the render that is running in the thread
+active_functions = contextvars.ContextVar('active_functions', default={})
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class TemplateFunction():
+
+    """
+    A global of the environment that calls the function of the same name of the render running in
+    the thread (see functions_for_render).
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+
+        function = active_functions.get().get(self.name)
+        if function is None:
+            raise j2.exceptions.UndefinedError(f"'{self.name}' is undefined")
+
+        return function(*args, **kwargs)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@contextlib.contextmanager
+def functions_for_render(functions):
+
+    """
+    Makes the functions of a render available through the globals of the environments while the
+    with block runs.
+
+    Args:
+        functions (dict): The functions by name.
+    """
+
+    token = active_functions.set(functions)
+    try:
+        yield
+    finally:
+        active_functions.reset(token)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class JcbEnvironment(j2.Environment):
+
+    """
+    The Jinja2 environment used by jcb, with the functions of the Renderers as globals (see
+    functions_for_render). When a render is collecting observations as fragments
+    (see jcb.fragment_cache) the included observation templates are replaced by placeholders. When
+    a render is profiled (see jcb.profiling) loading and compiling the templates is timed and the
+    included templates are timed when they are rendered.
+
+    Attributes:
+        template_dependencies (dict): Dependencies of each template, provided when the templates
+                                      are loaded without their source (see jcb.template_analysis).
+    """
+
+    template_dependencies = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.globals.update({name: TemplateFunction(name) for name in template_function_names})
+
+    def get_template(self, name, parent=None, globals=None):
+
+        with phase('template_load'):
+            template = super().get_template(name, parent, globals)
+
+        # Only includes (which have a parent) are intercepted
+        if parent is None:
+            return template
+
+        collector = active_collector.get()
+        if collector is not None:
+            intercepted = collector.intercept(template)
+            if intercepted is not template:
+                return intercepted
+
+        return profiled_template(template)
+
+    def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+
+        with phase('jinja_compile'):
+            return super().compile(source, name, filename, raw, defer_init)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class AtomicFileSystemBytecodeCache(j2.FileSystemBytecodeCache):
+
+    """
+    A Jinja2 bytecode cache that stores the compiled templates in a directory so that they can be
+    reused by other processes. The cache directory can be shared between many processes on many
+    nodes:
+
+      - Each file is written to a temporary file in the cache directory and then renamed into place
+        so that readers only ever see complete files.
+      - Files that cannot be read, for example because they were written by a different version of
+        Python or Jinja2, are ignored and the template is compiled again.
+      - Jinja2 stores a checksum of the template source with the bytecode so the cached bytecode is
+        invalidated when the content of the template changes.
+    """
+
+    def __init__(self, directory):
+
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory, pattern='jcb_%s.cache')
+
+    # ----------------------------------------------------------------------------------------------
+
+    def load_bytecode(self, bucket):
+
+        try:
+            super().load_bytecode(bucket)
+        except Exception:
+            # Unreadable files are treated as a cache miss
+            bucket.reset()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def dump_bytecode(self, bucket):
+
+        # The cache is an optimization so failing to write it is not an error
+        write_atomic(self._get_cache_filename(bucket), bucket.bytecode_to_string())
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def environment_key(search_paths, cache_dir=None):
+
+    """
+    Create the key used to identify an environment in the registry.
+
+    Args:
+        search_paths (list): The paths that Jinja2 will search for templates.
+        cache_dir (str): Optional directory for the bytecode cache.
+
+    Returns:
+        tuple: The resolved search paths and bytecode cache directory.
+    """
+
+    if cache_dir:
+        cache_dir = os.path.realpath(cache_dir)
+
+    return tuple(os.path.realpath(path) for path in search_paths), cache_dir
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def create_environment(search_paths, cache_dir=None, loader=None):
+
+    """
+    Create a new Jinja2 environment for a list of search paths.
+
+    Args:
+        search_paths (list): The paths that Jinja2 will search for templates.
+        cache_dir (str): Optional directory where compiled templates are cached between processes.
+        loader (jinja2.BaseLoader): Optional loader for the search paths, by default a
+                                    FileSystemLoader.
+
+    Returns:
+        jinja2.Environment: The environment.
+    """
+
+    bytecode_cache = AtomicFileSystemBytecodeCache(cache_dir) if cache_dir else None
+
+    return JcbEnvironment(loader=loader or j2.FileSystemLoader(list(search_paths)),
+                          undefined=j2.StrictUndefined,
+                          cache_size=template_cache_size,
+                          auto_reload=True,
+                          bytecode_cache=bytecode_cache)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_environment(search_paths, cache_dir=None):
+
+    """
+    Return the Jinja2 environment for a list of search paths, creating it if this is the first
+    time the paths have been seen in this process.
+
+    Args:
+        search_paths (list): The paths that Jinja2 will search for templates.
+        cache_dir (str): Optional directory where compiled templates are cached between processes.
+                         If not provided the JCB_CACHE_DIR environment variable is used if set.
+
+    Returns:
+        jinja2.Environment: The shared environment.
+    """
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(cache_dir_environment_variable)
+
+    # Search paths that are bundles or loaders (see jcb.template_bundle) are loaded from them
+    loaders = [jcb.template_bundle.template_loader(path) for path in search_paths]
+    if any(loader is not None for loader in loaders):
+        key = (tuple(getattr(loader, 'key', loader) if loader is not None else
+                     os.path.realpath(path) for path, loader in zip(search_paths, loaders)),
+               os.path.realpath(cache_dir) if cache_dir else None)
+        loader = j2.ChoiceLoader([loader if loader is not None else j2.FileSystemLoader(path)
+                                  for path, loader in zip(search_paths, loaders)])
+        return _get_or_create_environment(key, lambda: create_environment(search_paths, cache_dir,
+                                                                          loader=loader))
+
+    key = environment_key(search_paths, cache_dir)
+
+    # Templates in trees with up to date manifests (see jcb.tree_index) are opened at the paths in
+    # the manifests. The environment is replaced when a manifest is written again.
+    loader, signatures = jcb.tree_index.indexed_loader(key[0])
+    if loader is not None:
+        return _get_or_create_environment((key[0], (key[1], signatures)),
+                                          lambda: create_environment(*key, loader=loader))
+
+    return _get_or_create_environment(key, lambda: create_environment(*key))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_archive_environment(archive_path):
+
+    """
+    Return the Jinja2 environment for an archive of compiled templates (see jcb compile), creating
+    it if this is the first time the archive has been seen in this process.
+
+    Args:
+        archive_path (str): The path of the archive.
+
+    Returns:
+        jinja2.Environment: The shared environment.
+    """
+
+    archive_path = os.path.realpath(archive_path)
+
+    def create_archive_environment():
+        environment = JcbEnvironment(loader=j2.ModuleLoader(archive_path),
+                                     undefined=j2.StrictUndefined,
+                                     cache_size=template_cache_size)
+
+        # The archive has no template source so use the dependencies found during compilation
+        archive = jcb.TemplateArchive(archive_path)
+        environment.template_dependencies = archive.metadata.get('template_dependencies', {})
+
+        return environment
+
+    return _get_or_create_environment(((archive_path,), 'archive'), create_archive_environment)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _get_or_create_environment(key, create):
+
+    with _environments_lock:
+
+        # Reuse the environment and mark it as the most recently used
+        if key in _environments:
+            _environments.move_to_end(key)
+            return _environments[key]
+
+        # Create a new environment and evict the least recently used if needed
+        environment = create()
+        _environments[key] = environment
+        while len(_environments) > max(environment_cache_size, 1):
+            _environments.popitem(last=False)
+
+        return environment
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def set_environment_cache_size(size):
+
+    """
+    Change the maximum number of environments held in the registry. If the registry is larger
+    than the new size the least recently used environments are evicted.
+
+    Args:
+        size (int): The maximum number of environments.
+    """
+
+    global environment_cache_size
+
+    with _environments_lock:
+        environment_cache_size = size
+        while len(_environments) > max(environment_cache_size, 1):
+            _environments.popitem(last=False)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def clear_environment_cache():
+
+    """
+    Remove all the environments, and the templates they have compiled, from the registry.
+    """
+
+    with _environments_lock:
+        _environments.clear()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def environment_cache_info():
+
+    """
+    Return information about the environments currently held in the registry.
+
+    Returns:
+        dict: The maximum size, the current size and the search paths of each environment, with
+              the least recently used first.
+    """
+
+    with _environments_lock:
+        return {
+            'max_size': environment_cache_size,
+            'size': len(_environments),
+            'search_paths': [list(search_paths) for search_paths, _ in _environments],
+        }
+
+
+# --------------------------------------------------------------------------------------------------
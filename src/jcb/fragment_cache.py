@@ -0,0 +1,488 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import contextvars
+import json
+import threading
+import weakref
+
+from jcb.component_pruning import pruned_template, prunes_completely
+from jcb.profiling import phase, template_timer
+from jcb.template_analysis import template_variables
+from jcb.utilities import yaml_backend
+from jcb.utilities.trees import copy_tree
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Rendering of observations as separately cached fragments. When an algorithm template includes an
+observation template the include is replaced by a one line placeholder, and the template and the
+context of the include are recorded. The algorithm is then rendered and parsed without the
+observers, each observation is rendered and parsed on its own and the results are spliced into the
+place of the placeholders.
+
+The parsed observations are cached using the name of the template and the values of the variables
+that the template reads, so when one Renderer is used for several algorithms each distinct
+observer is only rendered and parsed once. When the document is written out as it is rendered
+(see FragmentCache.render_text) the rendered text of each observation is cached in the same way.
+"""
+
+# Key of the placeholder that replaces an observation in the algorithm
+fragment_marker = '__jcb_fragment__'
+
+# The collector of the render that is currently running. Context variables are local to a thread
+# so concurrent renders do not see each other's collectors.
+active_collector = contextvars.ContextVar('active_collector', default=None)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def canonical_value(value):
+
+    """
+    Return a string that identifies the value of a variable for use in a cache key.
+    """
+
+    try:
+        return json.dumps(value, sort_keys=True, default=repr)
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class FragmentPlaceholder():
+
+    """
+    Stands in for an included observation template. Jinja2 calls new_context and root_render_func
+    on the included template, here the context is recorded and the placeholder is rendered.
+    """
+
+    def __init__(self, template, collector):
+        self.template = template
+        self.collector = collector
+        self.name = template.name
+
+    def new_context(self, *args, **kwargs):
+        return self.template.new_context(*args, **kwargs)
+
+    def root_render_func(self, context):
+        yield self.collector.add(self.template, context)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class FragmentCollector():
+
+    """
+    Records the observation templates that are included while an algorithm is rendered.
+
+    Attributes:
+        env (jinja2.Environment): The environment the templates are loaded with.
+        fragment_names (set): Names of the templates that are rendered as fragments.
+        components (frozenset): The observer components the algorithm allows, or None if all are
+                                allowed. Observation templates are pruned to these components.
+        fragments (list): The template and context of each include, in the order they were found.
+    """
+
+    def __init__(self, env, fragment_names, components=None):
+        self.env = env
+        self.fragment_names = fragment_names
+        self.components = components
+        self.fragments = []
+
+    def intercept(self, template):
+        if template.name in self.fragment_names:
+            template = pruned_template(self.env, template, self.components)
+            return FragmentPlaceholder(template, self)
+        return template
+
+    def add(self, template, context):
+        self.fragments.append((template, context))
+        return f'{fragment_marker}: {len(self.fragments) - 1}'
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class IncompletePruning(Exception):
+
+    """
+    Raised to stop rendering an algorithm to text when an observation template cannot be pruned
+    completely, so that the rendered text would hold components that are not allowed.
+    """
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class FragmentTextCollector():
+
+    """
+    Renders the observation templates that are included while an algorithm is rendered to text,
+    taking the rendered text of each observation from the cache.
+
+    Attributes:
+        cache (FragmentCache): The cache of the rendered observations.
+        env (jinja2.Environment): The environment the templates are loaded with.
+        components (frozenset): The observer components the algorithm allows. Observation
+                                templates are pruned to these components.
+    """
+
+    def __init__(self, cache, env, components):
+        self.cache = cache
+        self.env = env
+        self.components = components
+
+    def intercept(self, template):
+        if template.name in self.cache.fragment_names:
+            if not prunes_completely(self.env, template, self.components):
+                raise IncompletePruning(template.name)
+            template = pruned_template(self.env, template, self.components)
+            return FragmentPlaceholder(template, self)
+        return template
+
+    def add(self, template, context):
+        return self.cache.fragment_text(self.env, template, context)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def splice_fragments(tree, fragments):
+
+    """
+    Replace the placeholders in a parsed document with the fragments.
+
+    Args:
+        tree: The parsed document containing placeholders.
+        fragments (list): The parsed fragment for each placeholder.
+
+    Returns:
+        The document with the fragments in place of the placeholders.
+        list: The number of times each placeholder was replaced.
+    """
+
+    used = [0] * len(fragments)
+
+    def replace(value):
+        if isinstance(value, dict):
+            if len(value) == 1 and fragment_marker in value:
+                index = value[fragment_marker]
+                if isinstance(index, int) and 0 <= index < len(fragments):
+                    used[index] += 1
+                    return copy_tree(fragments[index])
+            for key, item in value.items():
+                value[key] = replace(item)
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                value[index] = replace(item)
+        return value
+
+    return replace(tree), used
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class FragmentCache():
+
+    """
+    Cache of the rendered and parsed observations of a Renderer. The cache can be used by threads
+    rendering at the same time; a fragment that two threads need at once may be rendered by both.
+
+    Attributes:
+        fragment_names (set): Names of the templates that are rendered as fragments.
+        fragments (dict): The parsed fragments keyed by template and the values of the variables
+                          the template reads.
+        texts (dict): The rendered text of the fragments, with the same keys.
+        whole_templates (weakref.WeakSet): Algorithm templates that could not be assembled from
+                                           fragments, which are rendered in one piece from then on.
+        hits (int): The number of fragments that were found in the cache.
+        misses (int): The number of fragments that had to be rendered.
+    """
+
+    def __init__(self, fragment_names):
+        self.fragment_names = set(fragment_names)
+        self.fragments = {}
+        self.texts = {}
+        self.whole_templates = weakref.WeakSet()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def key(self, env, template, context):
+
+        """
+        Returns the cache key for rendering a template with a context and the variables that the
+        template reads, or None if they are not known.
+        """
+
+        variables = template_variables(env, template)
+
+        # If the variables are not known the whole context is used
+        key_variables = context.get_all().keys() if variables is None else variables
+
+        values = tuple((variable, canonical_value(context.resolve_or_missing(variable)))
+                       for variable in sorted(key_variables))
+
+        return (template, values), variables
+
+    # ----------------------------------------------------------------------------------------------
+
+    def discard(self, variables):
+
+        """
+        Remove the fragments that read any of the variables, e.g. because their values changed.
+
+        Args:
+            variables (set): The names of the variables.
+
+        Returns:
+            int: The number of fragments that were removed.
+        """
+
+        removed = 0
+        with self.lock:
+            for fragments in (self.fragments, self.texts):
+                keys = [key for key in fragments
+                        if any(variable in variables for variable, _ in key[1])]
+
+                for key in keys:
+                    del fragments[key]
+                removed += len(keys)
+
+        return removed
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_fragment(self, env, template, context, check_rendered):
+
+        """
+        Render and parse a template with the context of the include.
+        """
+
+        try:
+            with template_timer(template.name):
+                fragment_yaml = env.concat(template.root_render_func(context))
+        except Exception:
+            env.handle_exception()
+
+        check_rendered(fragment_yaml, template.name)
+
+        with phase('yaml_parse'):
+            return yaml_backend.safe_load(fragment_yaml)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def fragment_text(self, env, template, context):
+
+        """
+        Returns the rendered text of a template with the context of the include, rendering it if
+        it is not in the cache.
+        """
+
+        key, _ = self.key(env, template, context)
+
+        with self.lock:
+            text = self.texts.get(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if text is None:
+            with template_timer(template.name):
+                text = env.concat(template.root_render_func(context))
+            with self.lock:
+                self.texts[key] = text
+
+        return text
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get_fragments(self, env, requests, check_rendered, pool=None, components=None):
+
+        """
+        Returns the parsed fragment for each template and context, rendering those that are not
+        in the cache.
+
+        Args:
+            env (jinja2.Environment): The environment the templates were loaded with.
+            requests (list): The template and context of each fragment.
+            check_rendered (function): Called with each rendered string and the name of its
+                                        template to check it.
+            pool (FragmentPool): Optional pool of processes used to render the fragments.
+            components (frozenset): The observer components the templates were pruned to.
+
+        Returns:
+            list: The parsed fragments.
+        """
+
+        # Find the fragments that need to be rendered. The fragments of this render are kept
+        # here since other threads can discard them from the cache.
+        keys = []
+        found = {}
+        to_render = {}
+        rendered = {}
+        for template, context in requests:
+            key, variables = self.key(env, template, context)
+            keys.append(key)
+            with self.lock:
+                if key in found or key in to_render:
+                    self.hits += 1
+                elif key in self.fragments:
+                    self.hits += 1
+                    found[key] = self.fragments[key]
+                else:
+                    self.misses += 1
+                    to_render[key] = (template, context, variables)
+
+        # Render what can be rendered in the pool of processes
+        if pool is not None and len(to_render) > 1:
+            pool_keys = []
+            jobs = []
+            for key, (template, context, variables) in to_render.items():
+                worker_variables = pool.worker_variables(env, variables, context)
+                if worker_variables is not None:
+                    pool_keys.append(key)
+                    jobs.append((template.name, components, worker_variables))
+
+            with phase('observer_pool'):
+                pool_fragments = pool.render(jobs)
+
+            for key, fragment in zip(pool_keys, pool_fragments):
+                rendered[key] = fragment
+                del to_render[key]
+
+        # Render the remaining fragments here
+        for key, (template, context, _) in to_render.items():
+            rendered[key] = self.render_fragment(env, template, context, check_rendered)
+
+        with self.lock:
+            self.fragments.update(rendered)
+        found.update(rendered)
+
+        return [found[key] for key in keys]
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render(self, env, template, context, check_rendered, pool=None, components=None):
+
+        """
+        Render a template with the observations rendered as cached fragments.
+
+        Args:
+            env (jinja2.Environment): The environment the template was loaded with.
+            template (jinja2.Template): The algorithm template.
+            context (dict): The variables to render the template with.
+            check_rendered (function): Called with each rendered string and the name of its
+                                        template to check it.
+            pool (FragmentPool): Optional pool of processes used to render the fragments.
+            components (frozenset): Optional observer components that the algorithm allows. The
+                                    other components are removed from the observation templates
+                                    before they are rendered when this is safe.
+
+        Returns:
+            dict: The parsed document, or None if the document could not be assembled from
+                  fragments and has to be rendered in one piece.
+        """
+
+        # A template that could not be assembled from fragments before is not tried again
+        with self.lock:
+            if template in self.whole_templates:
+                return None
+
+        # Render the algorithm with placeholders for the observations
+        collector = FragmentCollector(env, self.fragment_names, components)
+        token = active_collector.set(collector)
+        try:
+            with template_timer(template.name):
+                skeleton_yaml = template.render(context)
+        finally:
+            active_collector.reset(token)
+
+        check_rendered(skeleton_yaml, template.name)
+
+        # Parse the algorithm and the observations. A fragment that cannot be parsed on its own,
+        # e.g. because it refers to an anchor elsewhere in the document, means the whole document
+        # has to be rendered in one piece.
+        try:
+            with phase('yaml_parse'):
+                skeleton = yaml_backend.safe_load(skeleton_yaml)
+            fragments = self.get_fragments(env, collector.fragments, check_rendered, pool,
+                                           components)
+        except yaml.YAMLError:
+            return self.render_whole(template)
+
+        # Put the observations in place of the placeholders
+        jedi_dict, used = splice_fragments(skeleton, fragments)
+
+        if any(count != 1 for count in used):
+            return self.render_whole(template)
+
+        return jedi_dict
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_whole(self, template):
+
+        """
+        Record that a template could not be assembled from fragments so that it is rendered in one
+        piece from then on.
+
+        Returns:
+            None: Returned by render in place of the document.
+        """
+
+        with self.lock:
+            self.whole_templates.add(template)
+
+        return None
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_text(self, env, template, context, check_rendered, components):
+
+        """
+        Render a template to text with the observations pruned to the components that the
+        algorithm allows before they are rendered, taking the text of the observations from the
+        cache. The text is not parsed, so this is only possible when every observation template
+        can be pruned completely (see jcb.component_pruning.prunes_completely).
+
+        Args:
+            env (jinja2.Environment): The environment the template was loaded with.
+            template (jinja2.Template): The algorithm template.
+            context (dict): The variables to render the template with.
+            check_rendered (function): Called with the rendered string and the name of the
+                                        template to check it.
+            components (frozenset): The observer components that the algorithm allows.
+
+        Returns:
+            str: The rendered text, or None if an observation template cannot be pruned
+                 completely and the components have to be removed after parsing.
+        """
+
+        collector = FragmentTextCollector(self, env, components)
+        token = active_collector.set(collector)
+        try:
+            with template_timer(template.name):
+                jedi_yaml = template.render(context)
+        except IncompletePruning:
+            return None
+        finally:
+            active_collector.reset(token)
+
+        check_rendered(jedi_yaml, template.name)
+
+        return jedi_yaml
+
+
+# --------------------------------------------------------------------------------------------------
@@ -1,11 +1,99 @@
 # --------------------------------------------------------------------------------------------------
 
 
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 import os
+import threading
 
 import jcb
-import yaml
+from jcb.profiling import phase, timed
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+# Parsed chronicle files, with the modification time and size of the file when it was read. The
+# chronicles are not modified after reading (processing works on a copy) so they can be shared by
+# all the ObservationChronicle objects of a long running process.
+_chronicle_files = {}
+
+
+def read_chronicle_file(path):
+
+    """
+    Read a chronicle file, reusing the parsed file if it has not changed since it was last read.
+
+    Args:
+        path (str): The path of the chronicle file.
+
+    Returns:
+        dict: The chronicle.
+    """
+
+    status = os.stat(path)
+    version = (status.st_mtime_ns, status.st_size)
+
+    cached = _chronicle_files.get(path)
+    if cached is None or cached[0] != version:
+        with open(path, 'r') as file:
+            cached = _chronicle_files[path] = (version, yaml_backend.safe_load(file))
+
+    return cached[1]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_bundled_chronicle(loader, name):
+
+    """
+    Read a chronicle file from a bundle or a loader (see jcb.template_bundle). Bundles do not
+    change so the parsed file is reused, files of other loaders are parsed each time.
+
+    Args:
+        loader (jinja2.BaseLoader): The loader of the chronicle directory.
+        name (str): The name of the chronicle file.
+
+    Returns:
+        dict: The chronicle.
+    """
+
+    key = (loader.key, name) if hasattr(loader, 'key') else None
+
+    cached = _chronicle_files.get(key)
+    if cached is None:
+        source, _, _ = loader.get_source(None, name)
+        cached = (None, yaml_backend.safe_load(source))
+        if key is not None:
+            _chronicle_files[key] = cached
+
+    return cached[1]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def window_from_conf(window_begin, window_length):
+
+    """
+    Convert the window of a dictionary of templates to datetime objects.
+
+    Args:
+        window_begin (str): The beginning of the window, e.g. 2024-01-01T00:00:00Z.
+        window_length (str): The ISO duration of the window, e.g. PT6H.
+
+    Returns:
+        datetime: The beginning of the window.
+        datetime: The end of the window.
+    """
+
+    # Convert the window_begin coming in as a string to a datetime object
+    window_begin = datetime.strptime(window_begin, '%Y-%m-%dT%H:%M:%SZ')
+
+    # Add window_length to window_begin
+    return window_begin, window_begin + jcb.duration_from_conf(window_length)
 
 
 # --------------------------------------------------------------------------------------------------
@@ -15,20 +103,24 @@ class ObservationChronicle():
 
     # ----------------------------------------------------------------------------------------------
 
+    @timed('chronicle_load')
     def __init__(self, chronicle_path, window_begin, window_length):
 
         # Keep the chronicle path
         self.chronicle_path = chronicle_path
 
-        # Convert the window_begin coming in as a string to a datetime object
-        self.window_begin = datetime.strptime(window_begin, '%Y-%m-%dT%H:%M:%SZ')
+        # Convert the window to datetime objects
+        self.window_begin, self.window_final = window_from_conf(window_begin, window_length)
 
-        # Add window_length to window_begin
-        self.window_final = self.window_begin + jcb.duration_from_conf(window_length)
+        # Dates at which any of the chronicles changes, found when first needed
+        self.change_points = None
 
-        # Save the most recent observer that was passed to the class. This can be used to avoid
-        # re-precessing the chronicles if the same observer is used multiple times.
-        self.last_observer = ''
+        # Processed satellite chronicles for each observer. The processing only depends on the
+        # observer and the window so the results are kept to avoid re-processing the chronicles
+        # each time the same observer is used. The lock lets threads rendering at the same time
+        # share the chronicle.
+        self.processed_satellites = {}
+        self.lock = threading.Lock()
 
         # Read all the chronicles into a dictionary where the key is the observation type and the
         # value is the chronicle dictionary
@@ -36,20 +128,85 @@ class ObservationChronicle():
         # Create dictionary of chronicles
         self.chronicles = {}
 
-        # If path does not exist there are not chronicles for this configuration
-        if not os.path.exists(chronicle_path):
+        # The chronicles can be in a bundle or a loader (see jcb.template_bundle)
+        loader = jcb.template_bundle.template_loader(chronicle_path)
+        if loader is not None:
+            for chronicle_file in loader.list_templates():
+                if '/' not in chronicle_file and chronicle_file.endswith('.yaml'):
+                    self.chronicles[chronicle_file[:-5]] = \
+                        read_bundled_chronicle(loader, chronicle_file)
             return
 
-        # List all the yaml files in the observation chronicle path
-        chronicle_files = [f for f in os.listdir(chronicle_path)
-                           if f.endswith('.yaml')]
+        # List all the yaml files in the observation chronicle path, from the manifest of the tree
+        # if it has an up to date one (see jcb.tree_index)
+        index = jcb.tree_index.fresh_index(chronicle_path)
+        if index is not None:
+            chronicle_files = [f for f in index.files(chronicle_path) if f.endswith('.yaml')]
+        elif os.path.exists(chronicle_path):
+            chronicle_files = [f for f in os.listdir(chronicle_path)
+                               if f.endswith('.yaml')]
+        else:
+            # If path does not exist there are not chronicles for this configuration
+            return
 
         # Read each chronicle file
         for chronicle_file in chronicle_files:
 
             # Read the YAML file
-            with open(os.path.join(chronicle_path, chronicle_file), 'r') as file:
-                self.chronicles[chronicle_file[:-5]] = yaml.safe_load(file)
+            self.chronicles[chronicle_file[:-5]] = \
+                read_chronicle_file(os.path.join(chronicle_path, chronicle_file))
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get_change_points(self):
+
+        """
+        Returns the sorted dates at which any of the chronicles changes: the commissioned and
+        decommissioned dates and the action dates of the chronicles.
+        """
+
+        if self.change_points is None:
+
+            change_points = set()
+            for obs_chronicle in self.chronicles.values():
+                for key in ('commissioned', 'decommissioned'):
+                    if obs_chronicle.get(key):
+                        change_points.add(jcb.datetime_from_conf(obs_chronicle[key]))
+                for chronicle in obs_chronicle.get('chronicles', []):
+                    change_points.add(jcb.datetime_from_conf(chronicle['action_date']))
+
+            self.change_points = sorted(change_points)
+
+        return self.change_points
+
+    # ----------------------------------------------------------------------------------------------
+
+    def epoch(self, window_begin=None, window_final=None):
+
+        """
+        Returns the epoch of a window, the position of its beginning and end among the change
+        points. The chronicles only compare the window with the change points, so the observers
+        that are used and their channel values are the same for all the windows of an epoch.
+
+        Args:
+            window_begin (datetime): Optional beginning of the window, by default the beginning
+                                     of the window of this chronicle.
+            window_final (datetime): Optional end of the window, by default the end of the window
+                                     of this chronicle.
+
+        Returns:
+            tuple: The epoch.
+        """
+
+        window_begin = window_begin or self.window_begin
+        window_final = window_final or self.window_final
+
+        change_points = self.get_change_points()
+
+        # Both sides of the end of the window are needed since it is compared with the action
+        # dates using <= and with the decommissioned dates using >
+        return (bisect_right(change_points, window_begin), bisect_left(change_points, window_final),
+                bisect_right(change_points, window_final), window_final > window_begin)
 
     # ----------------------------------------------------------------------------------------------
 
@@ -94,40 +251,39 @@ class ObservationChronicle():
 
     def __process_satellite__(self, observer):
 
-        # Only re-process the chronicle if the observer has changed
-        if self.last_observer != observer:
-
-            # Check that there is a chronicle for this type
-            jcb.abort_if(observer not in self.chronicles,
-                         f"No chronicle found for observation type {observer}. However templates "
-                         f"in the observation file require a chronicle.")
+        # Only process the chronicle the first time the observer is used
+        with self.lock:
+            if observer not in self.processed_satellites:
 
-            # Get the chronicle for the observation type
-            obs_chronicle = self.chronicles[observer]
+                # Check that there is a chronicle for this type
+                jcb.abort_if(observer not in self.chronicles,
+                             f"No chronicle found for observation type {observer}. However "
+                             f"templates in the observation file require a chronicle.")
 
-            # Abort if the window begin is after the decommissioned date
-            decommissioned_str = obs_chronicle.get('decommissioned', None)
-            if decommissioned_str:
-                decommissioned = jcb.datetime_from_conf(decommissioned_str)
-                jcb.abort_if(self.window_begin >= decommissioned,
-                             f"The window begin is after the decommissioned date for "
-                             f"observation type {observer}.")
+                # Get the chronicle for the observation type
+                obs_chronicle = self.chronicles[observer]
 
-            # Abort if the type is not satellite
-            jcb.abort_if(obs_chronicle['observer_type'] != 'satellite',
-                         f"Only satellite observation types are supported. The observation type "
-                         f"{observer} is listed as: {obs_chronicle['observer_type']}.")
+                # Abort if the window begin is after the decommissioned date
+                decommissioned_str = obs_chronicle.get('decommissioned', None)
+                if decommissioned_str:
+                    decommissioned = jcb.datetime_from_conf(decommissioned_str)
+                    jcb.abort_if(self.window_begin >= decommissioned,
+                                 f"The window begin is after the decommissioned date for "
+                                 f"observation type {observer}.")
 
-            # Process the satellite chronicle for this observer
-            self.sat_variables, self.sat_values = \
-                jcb.process_satellite_chronicles(observer, self.window_begin, self.window_final,
-                                                 obs_chronicle)
+                # Abort if the type is not satellite
+                jcb.abort_if(obs_chronicle['observer_type'] != 'satellite',
+                             f"Only satellite observation types are supported. The observation "
+                             f"type {observer} is listed as: {obs_chronicle['observer_type']}.")
 
-            # Update the last observer
-            self.last_observer = observer
+                # Process the satellite chronicle for this observer
+                with phase('chronicle_processing'):
+                    self.processed_satellites[observer] = \
+                        jcb.process_satellite_chronicles(observer, self.window_begin,
+                                                         self.window_final, obs_chronicle)
 
-        # Return the requested data
-        return self.sat_variables, self.sat_values
+            # Return the requested data
+            return self.processed_satellites[observer]
 
     # ----------------------------------------------------------------------------------------------
 
@@ -138,7 +294,8 @@ class ObservationChronicle():
 
         # Assert that 'simulated' is in the variables and get the index
         jcb.abort_if('simulated' not in sat_variables,
-                     f"Could not find 'simulated' in the variables for observer {observer}.")
+                     lambda: f"Could not find 'simulated' in the variables for observer "
+                             f"{observer}.")
         sim_idx = sat_variables.index('simulated')
 
         if variable_name_in == 'not_biascorrtd':
@@ -147,8 +304,8 @@ class ObservationChronicle():
             variable_name = variable_name_in
         # Assert that variable_name is in the variables and get the index
         jcb.abort_if(variable_name not in sat_variables,
-                     f"Could not find '{variable_name}' in "
-                     + "the variables for observer {observer}.")
+                     lambda: f"Could not find '{variable_name}' in "
+                             f"the variables for observer {observer}.")
         var_idx = sat_variables.index(variable_name)
 
         if variable_name_in == 'not_biascorrtd':
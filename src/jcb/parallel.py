@@ -0,0 +1,171 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from concurrent.futures import ProcessPoolExecutor
+import pickle
+import threading
+
+import jcb
+from jcb.component_pruning import pruned_template
+from jcb.environment import functions_for_render
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Rendering of the observations in a pool of processes. Each worker process creates its own Renderer
+from the dictionary of templates of the parent Renderer, so it has the same templates and the same
+observation chronicle. A fragment is then rendered in a worker using the values of the variables
+that the observation template reads, which are the only values the result can depend on.
+"""
+
+# The Renderer of the worker process
+_worker_renderer = None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def initialize_worker(template_dict):
+
+    """
+    Create the Renderer of a worker process.
+
+    Args:
+        template_dict (dict): The dictionary of templates of the parent Renderer.
+    """
+
+    global _worker_renderer
+
+    _worker_renderer = jcb.Renderer({**template_dict, 'jcb_workers': 1,
+                                     'jcb_fragment_cache': False})
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_fragment(template_name, components, variables):
+
+    """
+    Render and parse an observation template in a worker process.
+
+    Args:
+        template_name (str): The name of the observation template.
+        components (frozenset): The observer components to prune the template to, or None.
+        variables (dict): The variables that the template reads, except for the functions which
+                          are provided by the Renderer of the worker.
+
+    Returns:
+        The parsed observation.
+    """
+
+    renderer = _worker_renderer
+    template = pruned_template(renderer.env, renderer.env.get_template(template_name), components)
+
+    with functions_for_render(renderer.template_functions):
+        fragment_yaml = template.render({**renderer.template_functions, **renderer.template_dict,
+                                         **variables})
+
+    jcb.renderer.check_rendered(fragment_yaml, template_name)
+
+    return yaml_backend.safe_load(fragment_yaml)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class FragmentPool():
+
+    """
+    A pool of processes that render observation templates for a Renderer.
+
+    Attributes:
+        workers (int): The number of worker processes.
+        function_names (set): Names of the functions that the Renderer provides to the templates.
+    """
+
+    def __init__(self, template_dict, workers, function_names):
+
+        self.workers = workers
+        self.function_names = set(function_names)
+        self.template_dict = template_dict
+        self.executor = None
+        self.lock = threading.Lock()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def worker_variables(self, env, variables, context):
+
+        """
+        Returns the variables to send to a worker for rendering a template with a context, or None
+        if the template cannot be rendered by a worker.
+        """
+
+        if variables is None:
+            return None
+
+        worker_variables = {}
+
+        for variable in variables:
+
+            value = context.resolve_or_missing(variable)
+
+            # Functions are provided by the Renderer of the worker or by Jinja2
+            if callable(value) and (variable in self.function_names or variable in env.globals):
+                continue
+
+            # Values that cannot be sent to the worker mean the template is rendered here
+            try:
+                pickle.dumps(value)
+            except Exception:
+                return None
+
+            worker_variables[variable] = value
+
+        return worker_variables
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render(self, jobs):
+
+        """
+        Render observation templates in the pool.
+
+        Args:
+            jobs (list): The name of the template, the observer components to prune it to and the
+                         variables to send for each fragment.
+
+        Returns:
+            list: The parsed fragments in the order of the jobs.
+        """
+
+        # The pool is started by the first thread that needs it
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    initializer=initialize_worker,
+                                                    initargs=(self.template_dict,))
+            executor = self.executor
+
+        futures = [executor.submit(render_fragment, name, components, variables)
+                   for name, components, variables in jobs]
+
+        return [future.result() for future in futures]
+
+    # ----------------------------------------------------------------------------------------------
+
+    def shutdown(self):
+
+        """
+        Stop the worker processes.
+        """
+
+        with self.lock:
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            executor.shutdown()
+
+
+# --------------------------------------------------------------------------------------------------
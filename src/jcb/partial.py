@@ -0,0 +1,214 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import re
+
+import jcb
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Partial evaluation of a dictionary of templates with late bound keys, e.g. the member of an
+ensemble and the paths that depend on it. The algorithm is rendered once with a unique marker in
+place of the value of each late bound key, and the places in the result where the markers ended up
+are recorded. The configuration for particular values of the late bound keys is then produced by
+substituting the values at these places, without Jinja2, the observation chronicle or YAML parsing.
+
+This is only exact when the templates do nothing with the late bound keys except write them out,
+so every template of the render is checked to only use them as {{ key }}. The markers are integers,
+which YAML reads as integers when they are written out on their own and as part of a string
+otherwise, so that a value that is written out on its own can be read as YAML as it would have
+been. As a further check the algorithm is rendered a second time with other markers, which must
+give what substituting these markers into the first render gives.
+"""
+
+# The markers are this number plus the index of the key
+marker_base = 73190583000000
+
+# Second set of markers used for checking
+check_marker_base = 73190584000000
+
+# Text that the values of late bound keys cannot contain since it would change the YAML around them.
+# This includes the flow indicators, which end a value written in a flow collection, e.g. [a, b].
+forbidden_text = ['\n', '\'', '"', '\\', ': ', ' #', ',', '[', ']', '{', '}']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def find_sites(tree, markers):
+
+    """
+    Find the places in a parsed document where markers were written.
+
+    Args:
+        tree: The parsed document.
+        markers (dict): The key of each marker.
+
+    Returns:
+        list: The path to each place and the key of the marker (for a value that is a whole
+              marker) or the text with markers (for a string containing markers).
+    """
+
+    marker_texts = {str(marker): key for marker, key in markers.items()}
+    marker_pattern = re.compile('(' + '|'.join(marker_texts) + ')')
+    sites = []
+
+    def visit(value, path):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                jcb.abort_if(any(text in str(key) for text in marker_texts),
+                             f'The late bound keys cannot be used in the key {key}.')
+                visit(item, path + (key,))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                visit(item, path + (index,))
+        elif type(value) is int and value in markers:
+            sites.append((path, markers[value]))
+        elif isinstance(value, str) and any(text in value for text in marker_texts):
+            sites.append((path, [marker_texts.get(part, part)
+                                 for part in marker_pattern.split(value) if part]))
+
+    visit(tree, ())
+
+    return sites
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class PartialRender():
+
+    """
+    An algorithm rendered with late bound keys, see Renderer.render_partial.
+
+    Attributes:
+        algorithm (str): The name of the algorithm.
+        late_bound_keys (list): The keys whose values are given to finalize.
+        tree (dict): The rendered configuration with markers in place of the late bound keys.
+        sites (list): The path to each place in the tree that depends on the late bound keys and
+                      the key or the text with keys that the value there is made from.
+    """
+
+    def __init__(self, algorithm, late_bound_keys, tree, sites):
+        self.algorithm = algorithm
+        self.late_bound_keys = list(late_bound_keys)
+        self.tree = tree
+        self.sites = sites
+
+    # ----------------------------------------------------------------------------------------------
+
+    def finalize(self, values):
+
+        """
+        Produce the configuration for values of the late bound keys. Only the dictionaries and
+        lists on the paths to the places that depend on the late bound keys are copied, the rest
+        of the configuration is shared with the partial render and the other configurations
+        finalized from it. It should be copied (e.g. with jcb.copy_tree) before it is modified.
+
+        Args:
+            values (dict): The value of each late bound key.
+
+        Returns:
+            dict: The dictionary that can drive the JEDI executable.
+        """
+
+        missing = [key for key in self.late_bound_keys if key not in values]
+        jcb.abort_if(missing, lambda: f'Values are needed for the late bound keys '
+                                      f'{", ".join(missing)}.')
+
+        texts = {}
+        for key in self.late_bound_keys:
+            text = str(values[key])
+            jcb.abort_if(any(forbidden in text for forbidden in forbidden_text),
+                         lambda: f'The value {text!r} of the late bound key {key} cannot be '
+                                 f'substituted, it contains one of {forbidden_text}.')
+            texts[key] = text
+
+        # A value that is written out on its own is read as YAML, as it would have been
+        whole_values = {}
+
+        root = dict(self.tree)
+        copied = {(): root}
+
+        for path, parts in self.sites:
+
+            parent = root
+            for depth in range(1, len(path)):
+                if path[:depth] not in copied:
+                    copied[path[:depth]] = parent[path[depth - 1]] = \
+                        type(parent[path[depth - 1]])(parent[path[depth - 1]])
+                parent = copied[path[:depth]]
+
+            if isinstance(parts, str):
+                if parts not in whole_values:
+                    whole_values[parts] = yaml_backend.safe_load(texts[parts])
+                parent[path[-1]] = whole_values[parts]
+            else:
+                parent[path[-1]] = ''.join(texts.get(part, part) for part in parts)
+
+        return root
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_partial(renderer, algorithm, late_bound_keys):
+
+    """
+    Render an algorithm with late bound keys, see Renderer.render_partial.
+
+    Args:
+        renderer (Renderer): The Renderer.
+        algorithm (str): The name of the algorithm.
+        late_bound_keys (list): The keys whose values are given later.
+
+    Returns:
+        PartialRender: The partial render.
+    """
+
+    late_bound_keys = sorted(set(late_bound_keys))
+
+    fixed_keys = set(jcb.renderer.renderer_setup_keys + jcb.renderer.chronicle_keys +
+                     ['algorithm', 'observations', 'observation_from_jcb'])
+    fixed = [key for key in late_bound_keys if key in fixed_keys]
+    jcb.abort_if(fixed, lambda: f'The keys {", ".join(fixed)} cannot be late bound.')
+
+    jcb.abort_if(not renderer.env.loader.has_source_access,
+                 'Rendering with late bound keys needs the sources of the templates.')
+
+    # Every template of the render must only write out the late bound keys
+    plan = renderer.plan(algorithm)
+    jcb.abort_if(plan['unresolved_includes'],
+                 lambda: f'The templates of {algorithm} cannot be checked for rendering with late '
+                         f'bound keys since the includes {", ".join(plan["unresolved_includes"])} '
+                         f'cannot be determined without rendering.')
+
+    uses = [f'{name} line {line} uses {key}' for name in plan['templates']
+            for key, line in jcb.template_analysis.non_output_uses(renderer.env, name,
+                                                                   late_bound_keys)]
+    jcb.abort_if(uses, lambda: 'Late bound keys can only be written out, as {{ key }}, but '
+                               + ', '.join(uses) + '.')
+
+    # Render with the markers and then with the other markers, on top of the dictionary of
+    # templates so that the Renderer can go on being used by other threads meanwhile
+    trees = [renderer.render(algorithm, {key: base + index
+                                         for index, key in enumerate(late_bound_keys)})
+             for base in (marker_base, check_marker_base)]
+
+    jcb.abort_if(trees[0] is None, f'Resolving the templates for {algorithm} failed.')
+
+    markers = {marker_base + index: key for index, key in enumerate(late_bound_keys)}
+    partial = PartialRender(algorithm, late_bound_keys, trees[0], find_sites(trees[0], markers))
+
+    check_values = {key: check_marker_base + index for index, key in enumerate(late_bound_keys)}
+    jcb.abort_if(partial.finalize(check_values) != trees[1],
+                 f'The late bound keys {", ".join(late_bound_keys)} change the structure of the '
+                 f'rendered {algorithm}, so they cannot be substituted after rendering.')
+
+    return partial
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,416 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import contextlib
+import contextvars
+import functools
+import sys
+import time
+import tracemalloc
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Profiling of renders, to find where a slow render spends its time. While a RenderProfile is active
+in a thread (with profile: ...) the phases of setting up Renderers and rendering with them are
+timed, as is the rendering of each included template, and the calls of the functions of the
+observation chronicle are counted:
+
+  with jcb.RenderProfile() as profile:
+      jedi_dict = jcb.Renderer(template_dict).render('variational')
+  print(profile.table())
+
+The time of each phase and template is its own time, without the phases and templates it runs,
+e.g. a template's own time does not include the templates it includes or compiling them, so that
+the times add up to the time of the profile. The total time of a template includes its includes.
+When no profile is active the phases only cost looking up the active profile.
+
+Observations rendered in a pool of processes (jcb_workers) are timed together as the
+observer_pool phase. The peak resident memory of the process is always reported. The peak memory
+allocated by Python while the profile is active can also be traced with tracemalloc, but this slows
+down the profiled code several times over so it is not by default.
+"""
+
+# The profile of the thread, if one is active
+active_profile = contextvars.ContextVar('active_profile', default=None)
+
+# Name of the time that is not in any phase or template
+unaccounted = 'other'
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class CountedFunction():
+
+    """
+    A function made available to the templates whose calls are counted. It is shown like the
+    function it counts so that the keys of the fragment cache are the same as without profiling.
+    """
+
+    def __init__(self, profile, name, function):
+        self.profile = profile
+        self.name = name
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        self.profile.calls[self.name] = self.profile.calls.get(self.name, 0) + 1
+        return self.function(*args, **kwargs)
+
+    def __repr__(self):
+        return repr(self.function)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class ProfiledTemplate():
+
+    """
+    Stands in for an included template so that rendering it is timed. Jinja2 calls new_context and
+    root_render_func on the included template, everything else is passed to the template.
+    """
+
+    def __init__(self, template, profile):
+        self.template = template
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def root_render_func(self, context):
+        start = self.profile.start()
+        try:
+            yield from self.template.root_render_func(context)
+        finally:
+            self.profile.stop('templates', self.template.name, start)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class RenderProfile():
+
+    """
+    The time spent in each phase and template, the calls of the functions of the observation
+    chronicle and the peak memory of the renders done while the profile is active.
+
+    Attributes:
+        phases (dict): The calls, own seconds and total seconds of each phase.
+        templates (dict): The renders, own seconds and total seconds of each template.
+        calls (dict): The number of calls of each function made available to the templates.
+        seconds (float): The time the profile was active.
+        peak_memory (int): The peak memory allocated by Python while the profile was active, in
+                           bytes, or None if it was not traced.
+        peak_resident_memory (int): The peak resident memory of the process, in bytes, or None if
+                                    it is not known on this platform.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.templates = {}
+        self.calls = {}
+        self.seconds = 0.0
+        self.peak_memory = None
+        self.peak_resident_memory = None
+        self.stack = []
+        self.token = None
+
+    # ----------------------------------------------------------------------------------------------
+
+    def __enter__(self):
+
+        self.started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        elif self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        self.token = active_profile.set(self)
+        self.stack.append(0.0)
+        self.start_time = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *args):
+
+        seconds = time.perf_counter() - self.start_time
+        self.seconds += seconds
+        active_profile.reset(self.token)
+
+        # The time that was not in any phase or template
+        own_seconds = seconds - self.stack.pop()
+        timing = self.phases.setdefault(unaccounted, {'calls': 0, 'seconds': 0.0,
+                                                      'total_seconds': 0.0})
+        timing['calls'] += 1
+        timing['seconds'] += own_seconds
+        timing['total_seconds'] += own_seconds
+
+        self.peak_resident_memory = peak_resident_memory()
+
+        if self.trace_memory:
+            self.peak_memory = max(self.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+            if self.started_tracing:
+                tracemalloc.stop()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def start(self):
+
+        """
+        Starts timing a phase or template, returns the time it started.
+        """
+
+        self.stack.append(0.0)
+        return time.perf_counter()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def stop(self, kind, name, start):
+
+        """
+        Stops timing a phase or template started at start. Its time is taken out of the own time
+        of the phase or template it ran in.
+
+        Args:
+            kind (str): 'phases' or 'templates'.
+            name (str): The name of the phase or template.
+            start (float): The time returned by start.
+        """
+
+        seconds = time.perf_counter() - start
+        children = self.stack.pop()
+        if self.stack:
+            self.stack[-1] += seconds
+
+        timing = getattr(self, kind).setdefault(name, {'calls': 0, 'seconds': 0.0,
+                                                       'total_seconds': 0.0})
+        timing['calls'] += 1
+        timing['seconds'] += seconds - children
+        timing['total_seconds'] += seconds
+
+    # ----------------------------------------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def timer(self, kind, name):
+
+        """
+        Times the code run in the with block as a phase or template.
+        """
+
+        start = self.start()
+        try:
+            yield
+        finally:
+            self.stop(kind, name, start)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def rows(self):
+
+        """
+        Returns the phases and templates by own time, longest first.
+
+        Returns:
+            list: The kind ('phase' or 'template'), name, calls, own seconds and total seconds of
+                  each phase and template.
+        """
+
+        rows = [(kind[:-1], name, timing['calls'], timing['seconds'], timing['total_seconds'])
+                for kind in ['phases', 'templates']
+                for name, timing in getattr(self, kind).items()]
+
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def as_dict(self):
+
+        """
+        Returns the profile as a dictionary that can be written out as YAML or JSON.
+        """
+
+        return {
+            'seconds': self.seconds,
+            'phases': self.phases,
+            'templates': self.templates,
+            'calls': self.calls,
+            'peak_memory': self.peak_memory,
+            'peak_resident_memory': self.peak_resident_memory,
+        }
+
+    # ----------------------------------------------------------------------------------------------
+
+    def table(self, max_rows=None):
+
+        """
+        Returns the profile as a table of the phases and templates by own time, longest first,
+        followed by the function calls and the peak memory.
+
+        Args:
+            max_rows (int): Optional maximum number of phases and templates shown.
+
+        Returns:
+            str: The table.
+        """
+
+        rows = self.rows()[:max_rows]
+        width = max([len('name')] + [len(row[1]) for row in rows])
+
+        lines = [f'{"kind":<9}{"name":<{width}}  {"calls":>7}  {"own s":>9}  {"own %":>6}  '
+                 f'{"total s":>9}']
+        for kind, name, calls, seconds, total_seconds in rows:
+            percent = 100.0 * seconds / self.seconds if self.seconds else 0.0
+            lines.append(f'{kind:<9}{name:<{width}}  {calls:>7}  {seconds:>9.4f}  '
+                         f'{percent:>6.1f}  {total_seconds:>9.4f}')
+
+        lines.append(f'total {self.seconds:.4f} s')
+        for name, calls in sorted(self.calls.items()):
+            lines.append(f'{name} calls: {calls}')
+        if self.peak_memory is not None:
+            lines.append(f'peak memory: {self.peak_memory / 2**20:.1f} MiB')
+        if self.peak_resident_memory is not None:
+            lines.append(f'peak resident memory: {self.peak_resident_memory / 2**20:.1f} MiB')
+
+        return '\n'.join(lines)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def peak_resident_memory():
+
+    """
+    Returns the peak resident memory of the process in bytes, or None if it is not known.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Linux reports kilobytes and macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def phase(name):
+
+    """
+    Returns a context manager that times the code in its with block as a phase of the active
+    profile, or does nothing if no profile is active.
+    """
+
+    profile = active_profile.get()
+
+    return contextlib.nullcontext() if profile is None else profile.timer('phases', name)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def template_timer(name):
+
+    """
+    Returns a context manager that times rendering a template that is not included, e.g. the
+    algorithm template, if a profile is active, otherwise does nothing.
+    """
+
+    profile = active_profile.get()
+
+    return contextlib.nullcontext() if profile is None else profile.timer('templates', name)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def timed(name):
+
+    """
+    Decorator that times each call of a function as a phase of the active profile.
+    """
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = active_profile.get()
+            if profile is None:
+                return function(*args, **kwargs)
+            with profile.timer('phases', name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def profiled_template(template):
+
+    """
+    Returns an included template that is timed when rendered if a profile is active, otherwise the
+    template.
+    """
+
+    profile = active_profile.get()
+
+    return template if profile is None else ProfiledTemplate(template, profile)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def counted_functions(functions):
+
+    """
+    Returns the functions made available to the templates with their calls counted if a profile is
+    active, otherwise the functions.
+    """
+
+    profile = active_profile.get()
+    if profile is None:
+        return functions
+
+    return {name: CountedFunction(profile, name, function) for name, function in functions.items()}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def profile_render(template_dict, trace_memory=False):
+
+    """
+    Sets up a Renderer and renders the algorithm of a dictionary of templates, like jcb.render
+    without the result cache, while profiling.
+
+    Args:
+        template_dict (dict): A dictionary that must include an 'algorithm' key among the templates.
+        trace_memory (bool): Whether the peak memory allocated by Python is traced.
+
+    Returns:
+        dict: The rendered JEDI dictionary.
+        RenderProfile: The profile.
+    """
+
+    jcb.abort_if('algorithm' not in template_dict,
+                 'The dictionary of templates must have an algorithm key')
+
+    with RenderProfile(trace_memory) as profile:
+        with jcb.Renderer(template_dict) as renderer:
+            jedi_dict = renderer.render(template_dict['algorithm'])
+
+    return jedi_dict, profile
+
+
+# --------------------------------------------------------------------------------------------------
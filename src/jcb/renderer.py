@@ -1,11 +1,38 @@
 # --------------------------------------------------------------------------------------------------
 
 
+from collections import ChainMap
 import os
+import re
+import weakref
 
 import jcb
+from jcb.component_pruning import source_pruner
+from jcb.environment import functions_for_render
+from jcb.fragment_cache import FragmentCache
+from jcb.observation_chronicle.observation_chronicle import window_from_conf
+from jcb.parallel import FragmentPool
+from jcb.profiling import counted_functions, phase, template_timer, timed
+from jcb.template_analysis import plan_template
+from jcb.utilities import yaml_backend
 import jinja2 as j2
-import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+# Template directives that should not be left in a rendered string
+directive_pattern = re.compile(r'\{\{|\}\}')
+
+
+# Keys of the dictionary of templates that determine how a Renderer is set up, changing one of
+# them means the Renderer is set up again
+renderer_setup_keys = ['algorithm_path', 'app_path_algorithm', 'app_path_model',
+                       'app_path_observations', 'jcb_template_archive', 'jcb_cache_dir',
+                       'jcb_fragment_cache', 'jcb_workers']
+
+# Keys of the dictionary of templates that the observation chronicle is created from
+chronicle_keys = ['app_path_observation_chronicle', 'window_begin', 'window_length']
 
 
 # --------------------------------------------------------------------------------------------------
@@ -32,117 +59,364 @@ def get_nested_dict(nested_dict, keys):
 # --------------------------------------------------------------------------------------------------
 
 
+def get_config_path():
+
+    """
+    Returns the path of the configuration directory inside jcb.
+    """
+
+    return os.path.join(os.path.dirname(__file__), 'configuration')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_app_path(app_path):
+
+    """
+    Returns the full path to a directory of an app. Paths that are not absolute are relative to the
+    apps directory inside jcb. Jinja2 loaders (see jcb.template_bundle) are returned unchanged.
+
+    Args:
+        app_path (str): The path to the directory of the app.
+
+    Returns:
+        str: The full path to the directory.
+    """
+
+    if not isinstance(app_path, str) or os.path.isabs(app_path):
+        return app_path
+    else:
+        return os.path.join(get_config_path(), 'apps', app_path)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_search_paths(template_dict):
+
+    """
+    Determines the paths where Jinja2 will look for templates from the dictionary of templates.
+
+    Args:
+        template_dict (dict): A dictionary containing templates and their corresponding paths.
+
+    Returns:
+        str: The path with the algorithm files (top level templates).
+        list: The paths where Jinja2 will look for template files.
+        str: The path with the observation files, or None if the app does not use observations.
+    """
+
+    # Path with the algorithm files (top level templates), check for user provided algorithm path
+    algorithm_path_default = os.path.join(get_config_path(), 'algorithms')
+    algorithm_path = template_dict.get('algorithm_path', algorithm_path_default)
+
+    search_paths = [algorithm_path]
+
+    # Check to see if there is an app_path_algorithm in the template dictionary
+    app_path_algorithm = template_dict.get('app_path_algorithm')
+    if app_path_algorithm:
+        search_paths += [get_app_path(app_path_algorithm)]
+
+    # Path with model files if app needs model things
+    app_path_model = template_dict.get('app_path_model')
+    if app_path_model:
+        search_paths += [get_app_path(app_path_model)]
+
+    # Path with observation files if app needs obs things
+    obs_path = None
+    app_path_observations = template_dict.get('app_path_observations')
+    if app_path_observations:
+        obs_path = get_app_path(app_path_observations)
+        search_paths += [obs_path]
+
+    return algorithm_path, search_paths, obs_path
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def list_observations(obs_path):
+
+    """
+    Lists the observations in a directory of observation files.
+
+    Args:
+        obs_path (str): The path with the observation files.
+
+    Returns:
+        list: The names of the observation files with the .yaml.j2 extension removed.
+    """
+
+    # Get a list of all the observation files that end in .yaml.j2, from the bundle or loader (see
+    # jcb.template_bundle) or from the manifest of the tree if it has an up to date one (see
+    # jcb.tree_index)
+    loader = jcb.template_bundle.template_loader(obs_path)
+    index = None if loader is not None else jcb.tree_index.fresh_index(obs_path)
+    if loader is not None:
+        obs_files = [f for f in loader.list_templates() if '/' not in f and f.endswith('.yaml.j2')]
+    elif index is not None:
+        obs_files = [f for f in index.files(obs_path) if f.endswith('.yaml.j2')]
+    else:
+        obs_files = [f for f in os.listdir(obs_path) if
+                     os.path.isfile(os.path.join(obs_path, f)) and f.endswith('.yaml.j2')]
+
+    # Remove the .yaml.j2 extension from the observation list
+    return [f[:-8] for f in obs_files]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_observer_components(algorithm_path):
+
+    """
+    Reads observer_components.yaml from the algorithm path, which can be in a bundle or a loader
+    (see jcb.template_bundle), or takes it from the manifest of the tree if it has an up to date
+    one (see jcb.tree_index).
+
+    Args:
+        algorithm_path (str): The path with the algorithm files.
+
+    Returns:
+        dict: The observer components of each algorithm.
+    """
+
+    loader = jcb.template_bundle.template_loader(algorithm_path)
+    if loader is not None:
+        try:
+            source, _, _ = loader.get_source(None, 'observer_components.yaml')
+        except j2.TemplateNotFound:
+            jcb.abort(f'observer_components.yaml was not found in {algorithm_path}.')
+        return yaml_backend.safe_load(source)
+
+    index = jcb.tree_index.fresh_index(algorithm_path)
+    if index is not None:
+        observer_components = index.observer_components(algorithm_path)
+        if observer_components is not None:
+            return observer_components
+
+    with open(os.path.join(algorithm_path, 'observer_components.yaml'), 'r') as file:
+        return yaml_backend.safe_load(file)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def template_directive_lines(rendered, max_lines=5, snippet_length=80):
+
+    """
+    Finds the lines of a rendered string that still contain template directives.
+
+    Args:
+        rendered (str): The rendered string.
+        max_lines (int): The maximum number of lines to report.
+        snippet_length (int): The maximum length of the snippet of each line.
+
+    Returns:
+        list: The line number and a snippet of each line with a directive.
+    """
+
+    lines = []
+    line_start = 0
+    line_number = 1
+
+    for match in directive_pattern.finditer(rendered):
+
+        # Skip further directives on a line that was already reported
+        start = rendered.rfind('\n', 0, match.start()) + 1
+        if lines and start == line_start:
+            continue
+
+        line_number += rendered.count('\n', line_start, start)
+        line_start = start
+
+        end = rendered.find('\n', start)
+        snippet = rendered[start:end if end != -1 else len(rendered)].strip()
+        lines.append((line_number, snippet[:snippet_length]))
+
+        if len(lines) == max_lines:
+            break
+
+    return lines
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@timed('directive_scan')
+def check_rendered(jedi_dict_yaml, template_name=None):
+
+    """
+    Aborts if a rendered string still contains template directives. The error reports the line
+    numbers and a snippet of the offending lines rather than the whole string.
+
+    Args:
+        jedi_dict_yaml (str): The rendered string.
+        template_name (str): Optional name of the template that was rendered.
+    """
+
+    # Searching for the two directives separately is faster than one regular expression search
+    if '{{' not in jedi_dict_yaml and '}}' not in jedi_dict_yaml:
+        return
+
+    lines = template_directive_lines(jedi_dict_yaml)
+
+    description = f'The rendered template {template_name}' if template_name else \
+        'The rendered string'
+    report = '\n'.join(f'  line {line_number}: {snippet}' for line_number, snippet in lines)
+
+    jcb.abort(f'{description} still contains template directives:\n{report}',
+              template=template_name, lines=lines)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
 class Renderer():
 
     """
     A class to render templates using Jinja2 based on a provided dictionary of templates.
 
+    A Renderer can be shared by threads that render at the same time. The dictionary of templates
+    it is given is not modified, the keys that the Renderer sets (e.g. model_component) and those
+    changed with update are kept in a layer over it, and the algorithm being rendered is only put
+    in the variables of that render. Changing the Renderer with update, render_cycles or
+    render_partial should not be done while other threads are rendering with it.
+
     Attributes:
-        template_dict (dict): A dictionary containing the templates and relevant paths.
+        template_dict (ChainMap): The dictionary of templates, under the keys set by the Renderer.
         j2_search_paths (list): A list of paths where Jinja2 will look for template files.
     """
 
-    def __init__(self, template_dict: dict):
+    @timed('construction')
+    def __init__(self, template_dict: dict, workers: int = None):
 
         """
         Initializes the Renderer with a given template dictionary and sets up Jinja2 search paths.
 
         Args:
             template_dict (dict): A dictionary containing templates and their corresponding paths.
+            workers (int): Optional number of processes used to render the observations. If not
+                           provided jcb_workers from the template dictionary is used, default 1.
         """
 
-        # Keep the dictionary of templates around
-        self.template_dict = template_dict
+        # Keep the dictionary of templates around, with a layer for the keys that are set here.
+        # The keys changed with update are also kept apart so that setting up again starts from
+        # the dictionary of the caller and not from the keys set here.
+        self.template_dict = ChainMap({}, template_dict)
+        self.changed_keys = {}
+
+        # Check for a precompiled archive of the templates
+        # ------------------------------------------------
+        archive_path = self.template_dict.get('jcb_template_archive')
+        if archive_path:
+            self.template_archive = jcb.TemplateArchive(archive_path)
+            template_paths = self.template_archive.template_paths(self.template_dict)
+        else:
+            self.template_archive = None
+            template_paths = self.template_dict
 
         # Set the paths where jinja will look for files in the hierarchy
         # --------------------------------------------------------------
-        # Set the config path
-        config_path = os.path.join(os.path.dirname(__file__), 'configuration')
-
-        # Path with the algorithm files (top level templates)
-        algorithm_path_default = os.path.join(config_path, 'algorithms')
-
-        # Check for user provided algorithm path
-        algorithm_path = self.template_dict.get('algorithm_path', algorithm_path_default)
+        algorithm_path, self.j2_search_paths, obs_path = get_search_paths(template_paths)
 
         # Load observer_components from the algorithm path
-        observer_components = os.path.join(algorithm_path, 'observer_components.yaml')
-        with open(observer_components, 'r') as file:
-            self.observer_components = yaml.safe_load(file)
-
-        self.j2_search_paths = [algorithm_path]
-
-        # Check to see if there is an app_path_algorithm in the template dictionary
-        app_path_algorithm = self.template_dict.get('app_path_algorithm')
-        if app_path_algorithm:
-
-            # Check if app_path_algorithm is an absolute path
-            if os.path.isabs(app_path_algorithm):
-                self.j2_search_paths += [app_path_algorithm]
-            else:
-                self.j2_search_paths += [os.path.join(config_path, 'apps', app_path_algorithm)]
+        if self.template_archive:
+            self.observer_components = self.template_archive.observer_components
+        else:
+            self.observer_components = read_observer_components(algorithm_path)
 
         # Path with model files if app needs model things
-        app_path_model = self.template_dict.get('app_path_model')
+        app_path_model = template_paths.get('app_path_model')
         if app_path_model:
 
             # Take the last element of the path and set this to the model_component in the
             # dictionary. The path might end in a slash so split on / and take the last element.
-            self.template_dict['model_component'] = app_path_model.split('/')[-1] + '_'
-
-            # Check if app_path_model is an absolute path
-            if os.path.isabs(app_path_model):
-                self.j2_search_paths += [app_path_model]
+            # A loader (see jcb.template_bundle) gives the name of the model.
+            if isinstance(app_path_model, str):
+                model_name = app_path_model.split('/')[-1]
             else:
-                self.j2_search_paths += [os.path.join(config_path, 'apps', app_path_model)]
+                model_name = getattr(app_path_model, 'name', None)
+                jcb.abort_if(not model_name, 'A loader used for app_path_model must have a name '
+                                             'attribute, the name of the model.')
+            self.template_dict['model_component'] = model_name + '_'
 
         # Path with observation files if app needs obs things
-        app_path_observations = self.template_dict.get('app_path_observations')
-        if app_path_observations:
+        self.all_observations = []
+        if obs_path:
 
-            if os.path.isabs(app_path_observations):
-                obs_path = app_path_observations
+            # Get a list of all the observations
+            if self.template_archive:
+                self.all_observations = self.template_archive.observations
             else:
-                obs_path = os.path.join(config_path, 'apps', app_path_observations)
-
-            self.j2_search_paths += [obs_path]
-
-            # Get a list of all the observation files that end in .yaml.j2
-            obs_files = [f for f in os.listdir(obs_path) if
-                         os.path.isfile(os.path.join(obs_path, f)) and f.endswith('.yaml.j2')]
-
-            # Remove the .yaml.j2 extension from the observation list
-            all_observations = [f[:-8] for f in obs_files]
+                self.all_observations = list_observations(obs_path)
 
             # If self.template_dict['observations'] is 'all_observations' or ['all_observations']
             # or is not present then replace it with self.template_dict['all_observations']
             if 'observations' not in self.template_dict or \
                self.template_dict['observations'] == 'all_observations' or \
                self.template_dict['observations'] == ['all_observations']:
-                self.template_dict['observations'] = all_observations
+                self.template_dict['observations'] = self.all_observations
+
+        # Cache of the rendered observations, which are rendered as separate fragments unless
+        # jcb_fragment_cache is False in the dictionary of templates.
+        self.fragment_cache = None
+        if obs_path and self.template_dict.get('jcb_fragment_cache', True):
+            self.fragment_cache = FragmentCache(f'{observation}.yaml.j2'
+                                                for observation in self.all_observations)
+
+        # Get the Jinja2 environment
+        # --------------------------
+        # Environments are shared between Renderers with the same search paths so that templates
+        # are only compiled once per process. Compiled templates can also be cached on disk, using
+        # jcb_cache_dir or the JCB_CACHE_DIR environment variable, to share between processes.
+        # When an archive is used the templates are loaded already compiled.
+        if self.template_archive:
+            self.env = jcb.get_archive_environment(self.template_archive.path)
+        else:
+            cache_dir = self.template_dict.get('jcb_cache_dir')
+            self.env = jcb.get_environment(self.j2_search_paths, cache_dir)
+
+        # Functions made available to the templates
+        self.create_template_functions()
+
+        # Renders with late bound keys, see render_partial
+        self.partial_renders = {}
+
+        # Pool of processes for rendering the observations
+        # ------------------------------------------------
+        self.workers = workers
+        if workers is None:
+            workers = self.template_dict.get('jcb_workers', 1)
+
+        self.fragment_pool = None
+        if self.fragment_cache is not None and workers > 1:
+            self.fragment_pool = FragmentPool(self.template_dict, workers,
+                                              self.template_functions)
+            weakref.finalize(self, self.fragment_pool.shutdown)
 
-        # Create the Jinja2 environment
-        # -----------------------------
-        # print(f'Creating a Jinja2 environment for generating JEDI YAML configuration file. The '
-        #       f'following paths will be used for locating templated YAML files: ')
-        # for path in self.j2_search_paths:
-        #     print(f'  - {path}')
+    # ----------------------------------------------------------------------------------------------
 
-        self.env = j2.Environment(loader=j2.FileSystemLoader(self.j2_search_paths),
-                                  undefined=j2.StrictUndefined)
+    def create_template_functions(self):
 
-        # Default for the use_observer function in case no chronicle is being used
-        self.env.globals['use_observer'] = return_true
+        """
+        Creates the functions made available to the templates, including those of the observation
+        chronicle, which depend on the window in the dictionary of templates.
+        """
+
+        # Functions made available to the templates. These are passed with the template dictionary
+        # at render time since the environment is shared, and reached through the globals of the
+        # environment from templates imported without context (see jcb.environment).
+        # Default for the use_observer function in case no chronicle is being used.
+        self.template_functions = {'use_observer': return_true}
+        self.obs_chron = None
 
         # Path with observation chronicle files
         app_path_observation_chronicle = self.template_dict.get('app_path_observation_chronicle')
         if app_path_observation_chronicle:
 
-            if os.path.isabs(app_path_observation_chronicle):
-                path_observation_chronicle = app_path_observation_chronicle
-            else:
-                path_observation_chronicle = os.path.join(config_path, 'apps',
-                                                          app_path_observation_chronicle)
+            path_observation_chronicle = get_app_path(app_path_observation_chronicle)
 
             # print(f'If required an observation chronicle will be used from: ')
             # print(f' - {path_observation_chronicle}')
@@ -161,20 +435,266 @@ class Renderer():
                                                           window_length)
 
                 # Add global function for determining the use of a particular observer.
-                self.env.globals['use_observer'] = self.obs_chron.use_observer
+                self.template_functions['use_observer'] = self.obs_chron.use_observer
 
                 # Add global functions for retrieving the satellite channel dependant variables
-                self.env.globals['get_satellite_variable'] = self.obs_chron.get_satellite_variable
+                self.template_functions['get_satellite_variable'] = \
+                    self.obs_chron.get_satellite_variable
+
+    # ----------------------------------------------------------------------------------------------
+
+    def close(self):
+
+        """
+        Stops the processes used for rendering the observations, if any.
+        """
+
+        if self.fragment_pool is not None:
+            self.fragment_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def update(self, **changed_keys):
+
+        """
+        Changes keys of the dictionary of templates, e.g. the window and paths of a new cycle.
+        The observers are cached using the values of the keys that each observation template
+        reads, including through its includes, so the next render only renders again the
+        observers that read one of the changed keys. The observers that read them are removed
+        from the cache since they will not be used again.
+
+        Args:
+            **changed_keys: The keys of the dictionary of templates to change and their values.
+        """
+
+        self.changed_keys.update(changed_keys)
+
+        # Keys that change the templates or the way they are loaded mean setting up again, from
+        # the dictionary of the caller without the keys set by this Renderer (e.g. observations)
+        if any(key in renderer_setup_keys for key in changed_keys):
+            self.close()
+            self.__init__({**self.template_dict.maps[-1], **self.changed_keys}, self.workers)
+            return
+
+        self.template_dict.update(changed_keys)
+        self.partial_renders.clear()
+
+        if 'observations' in changed_keys and \
+           changed_keys['observations'] in ('all_observations', ['all_observations']):
+            self.template_dict['observations'] = self.all_observations
+
+        discard = set(changed_keys)
+
+        # The chronicle depends on the window. The functions of a new chronicle cannot be told
+        # apart from those of the old one in the cache, so observers reading them are removed.
+        # While the window stays in the same epoch of the chronicles the functions are kept.
+        if any(key in chronicle_keys for key in changed_keys) and \
+           not self.same_chronicle_epoch(changed_keys):
+            discard.update(self.template_functions)
+            self.create_template_functions()
+
+            # The worker processes are started again with the new chronicle when next needed
+            if self.fragment_pool is not None:
+                self.fragment_pool.shutdown()
+
+        if self.fragment_cache is not None:
+            self.fragment_cache.discard(discard)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def same_chronicle_epoch(self, changed_keys):
+
+        """
+        Returns True if the functions of the observation chronicle give the same results after the
+        keys changed, so that they and the observers that read them can be kept. This is the case
+        when only the window changed and the new window is in the same epoch of the chronicles as
+        the old one (see ObservationChronicle.epoch).
+
+        Args:
+            changed_keys (dict): The keys of the dictionary of templates that changed.
+
+        Returns:
+            bool: Whether the functions can be kept.
+        """
+
+        if 'app_path_observation_chronicle' in changed_keys:
+            return False
+
+        # Without a chronicle path the functions do not depend on the window
+        if self.obs_chron is None:
+            return not self.template_dict.get('app_path_observation_chronicle')
+
+        try:
+            window = window_from_conf(self.template_dict.get('window_begin'),
+                                      self.template_dict.get('window_length'))
+        except (TypeError, ValueError):
+            return False
+
+        return self.obs_chron.epoch(*window) == self.obs_chron.epoch()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_cycles(self, algorithm, window_begins, cycle_keys=None):
+
+        """
+        Renders an algorithm for a sequence of windows, e.g. the cycles of a reanalysis. Between
+        the change points of the observation chronicles the active observers and their channel
+        values do not change, so the observers are only rendered again when the chronicle epoch
+        changes or when they read a key that changes with the window.
+
+        Args:
+            algorithm (str): The name of the algorithm to assemble a YAML for.
+            window_begins (iterable): The beginning of each window as a datetime.
+            cycle_keys (function): Optional function that is called with the beginning of each
+                                   window and returns the other keys of the dictionary of
+                                   templates that change with the window, e.g. file prefixes.
+
+        Yields:
+            datetime: The beginning of the window.
+            dict: The dictionary that can drive the JEDI executable for the window.
+        """
+
+        for window_begin in window_begins:
+
+            cycle_dict = {'window_begin': window_begin.strftime('%Y-%m-%dT%H:%M:%SZ')}
+            if cycle_keys is not None:
+                cycle_dict.update(cycle_keys(window_begin))
+
+            changed_keys = {key: value for key, value in cycle_dict.items()
+                            if key not in self.template_dict or self.template_dict[key] != value}
+            if changed_keys:
+                self.update(**changed_keys)
+
+            yield window_begin, self.render(algorithm)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_partial(self, algorithm, late_bound_keys):
+
+        """
+        Renders an algorithm leaving out the values of late bound keys, e.g. the member of an
+        ensemble and the paths that depend on it. The configuration for particular values of the
+        keys is then produced by the finalize method of the result, which substitutes the values
+        without rendering. The templates must only write the late bound keys out, as {{ key }}.
+        The partial render is kept until the dictionary of templates is updated.
+
+        Args:
+            algorithm (str): The name of the algorithm to assemble a YAML for.
+            late_bound_keys (list): The keys whose values are given to finalize.
+
+        Returns:
+            PartialRender: The partial render.
+        """
+
+        key = (algorithm, frozenset(late_bound_keys))
+
+        if key not in self.partial_renders:
+            partial_render = jcb.partial.render_partial(self, algorithm, late_bound_keys)
+            self.partial_renders[key] = partial_render
+
+        return self.partial_renders[key]
+
+    # ----------------------------------------------------------------------------------------------
+
+    def plan(self, algorithm):
+
+        """
+        Finds what rendering an algorithm needs from the templates alone, without rendering. The
+        includes are followed from the algorithm template, evaluating the names of the included
+        templates from the dictionary of templates, so only the observers that are active are
+        part of the plan. The observation templates are analysed without the observer components
+        that the render removes before rendering them. Only the branches of if statements that
+        are taken are followed, and keys that are missing but only read by branches whose test
+        cannot be evaluated without rendering are reported as conditional keys.
+
+        Args:
+            algorithm (str): The name of the algorithm.
+
+        Returns:
+            dict: The templates that will be loaded, the keys of the dictionary of templates that
+                  will be read, those that are missing, those that are missing but may not be
+                  read, the included templates that do not exist, includes that cannot be
+                  determined without rendering and the observers.
+        """
+
+        values = {**self.template_dict, 'algorithm': algorithm}
+
+        components = self.allowed_components(algorithm)
+        prune = None
+        if self.fragment_cache is not None and components is not None:
+            prune = source_pruner(self.fragment_cache.fragment_names, components)
+
+        template_plan = plan_template(self.env, algorithm + '.yaml.j2', values,
+                                      self.template_functions, prune)
+
+        observations = self.template_dict.get('observations', [])
+        if not isinstance(observations, list):
+            observations = []
+
+        return {
+            'algorithm': algorithm,
+            'templates': template_plan.templates,
+            'keys': sorted(template_plan.variables),
+            'missing_keys': sorted(template_plan.variables - set(values) -
+                                   template_plan.optional),
+            'conditional_keys': sorted(template_plan.conditional - template_plan.variables -
+                                       set(values) - template_plan.optional),
+            'missing_templates': template_plan.missing_templates,
+            'unresolved_includes': [f'{name} line {line}' if line else name
+                                    for name, line in template_plan.unresolved],
+            'observers': [observation for observation in observations
+                          if f'{observation}.yaml.j2' in template_plan.templates],
+        }
 
     # ----------------------------------------------------------------------------------------------
 
-    def render(self, algorithm):
+    def validate(self, algorithm):
+
+        """
+        Aborts, before anything is rendered, if the dictionary of templates is missing keys that
+        an algorithm needs or the algorithm includes templates that do not exist. All the problems
+        are reported together.
+
+        Args:
+            algorithm (str): The name of the algorithm.
+
+        Returns:
+            dict: The plan of the algorithm (see plan).
+        """
+
+        plan = self.plan(algorithm)
+
+        problems = []
+        if plan['missing_keys']:
+            problems.append('the dictionary of templates is missing the keys: ' +
+                            ', '.join(plan['missing_keys']))
+        if plan['missing_templates']:
+            problems.append('the templates do not exist: ' +
+                            ', '.join(plan['missing_templates']))
+
+        jcb.abort_if(problems, lambda: f'The {algorithm} algorithm cannot be rendered since ' +
+                     ' and '.join(problems) + '.', algorithm=algorithm, plan=plan)
+
+        return plan
+
+    # ----------------------------------------------------------------------------------------------
+
+    @timed('render')
+    def render(self, algorithm, keys=None):
 
         """
         Renders a given algorithm.
 
         Args:
             algorithm (str): The name of the algorithm to assemble a YAML for.
+            keys (dict): Optional keys used in place of those of the dictionary of templates for
+                         this render only, without changing the Renderer.
 
         Returns:
             dict: The dictionary that can drive the JEDI executable.
@@ -185,33 +705,80 @@ class Renderer():
         # Load the algorithm template
         template = self.env.get_template(algorithm + '.yaml.j2')
 
-        # Make sure algorithm is in the template dictionary
-        self.template_dict['algorithm'] = algorithm
-
-        # Render the template hierarchy
+        # Render the template hierarchy, with the algorithm in the variables of this render
+        template_dict = self.template_dict if keys is None else ChainMap(keys, self.template_dict)
+        functions = counted_functions(self.template_functions)
+        context = {**functions, **template_dict, 'algorithm': algorithm}
         try:
-            jedi_dict_yaml = template.render(self.template_dict)
+            jedi_dict = None
+
+            # When possible the observations are rendered as fragments, which are cached so that
+            # each distinct observer is only rendered and parsed once by this Renderer.
+            if self.fragment_cache is not None:
+                with functions_for_render(functions):
+                    jedi_dict = self.fragment_cache.render(self.env, template, context,
+                                                           check_rendered, self.fragment_pool,
+                                                           self.allowed_components(algorithm))
+
+            if jedi_dict is None:
+                with template_timer(template.name), functions_for_render(functions):
+                    jedi_dict_yaml = template.render(context)
+
+                # Check that everything was rendered
+                check_rendered(jedi_dict_yaml, template.name)
+
+                # print(' ')
+
+                # Convert string form of the dictionary to a dictionary
+                with phase('yaml_parse'):
+                    jedi_dict = yaml_backend.safe_load(jedi_dict_yaml)
+
         except j2.exceptions.UndefinedError as e:
             print(f'Resolving templates for {algorithm} failed with the following exception: {e}')
             return None
 
-        # Check that everything was rendered
-        jcb.abort_if('{{' in jedi_dict_yaml, f'In template_string_jinja2 '
-                     f'the output string still contains template directives. '
-                     f'{jedi_dict_yaml}')
+        # Clean up the observers part of the dictionary if necessary. Should only have the
+        # components that the algorithm allows for.
+        self.prune_observer_components(algorithm, jedi_dict)
 
-        jcb.abort_if('}}' in jedi_dict_yaml, f'In template_string_jinja2 '
-                     f'the output string still contains template directives. '
-                     f'{jedi_dict_yaml}')
+        # Convert the rendered string to a dictionary
+        return jedi_dict
 
-        # print(' ')
+    # ----------------------------------------------------------------------------------------------
 
-        # Convert string form of the dictionary to a dictionary
-        jedi_dict = yaml.safe_load(jedi_dict_yaml)
+    def allowed_components(self, algorithm):
+
+        """
+        Returns the observer components that an algorithm allows, or None if all are allowed or
+        if the observation templates should not be pruned before rendering.
+
+        Args:
+            algorithm (str): The name of the algorithm.
+
+        Returns:
+            frozenset: The allowed observer components.
+        """
+
+        if algorithm not in self.observer_components or \
+           not self.template_dict.get('jcb_prune_observer_templates', True):
+            return None
+
+        return frozenset(self.observer_components[algorithm]['components'])
+
+    # ----------------------------------------------------------------------------------------------
+
+    @timed('observer_pruning')
+    def prune_observer_components(self, algorithm, jedi_dict):
+
+        """
+        Removes the observer components that an algorithm does not allow for, as listed in
+        observer_components.yaml.
+
+        Args:
+            algorithm (str): The name of the algorithm the dictionary was rendered for.
+            jedi_dict (dict): The rendered dictionary, which is modified in place.
+        """
 
-        # Clean up the observers part of the dictionary if necessary. Should only have the
-        # components that the algorithm allows for.
-        # --------------------------------------------------------------------------------
         if algorithm in self.observer_components:
             # Get the observer components for this algorithm
             observer_location = self.observer_components[algorithm]['observer_nesting']
@@ -232,8 +799,124 @@ class Renderer():
                 for key in keys_to_remove:
                     del observer[key]
 
-        # Convert the rendered string to a dictionary
-        return jedi_dict
+    # ----------------------------------------------------------------------------------------------
+
+    def render_text(self, algorithm, output_format='yaml'):
+
+        """
+        Renders a given algorithm and writes it out in one of the output formats, see
+        jcb.serializers.
+
+        Args:
+            algorithm (str): The name of the algorithm to assemble a configuration for.
+            output_format (str): One of 'yaml', 'json' or 'jsonl'.
+
+        Returns:
+            str: The configuration that can drive the JEDI executable.
+        """
+
+        jedi_dict = self.render(algorithm)
+        if jedi_dict is None:
+            return None
+
+        with phase('serialize'):
+            return jcb.serialize(jedi_dict, output_format, self.observer_nesting(algorithm))
+
+    # ----------------------------------------------------------------------------------------------
+
+    def observer_nesting(self, algorithm):
+
+        """
+        Returns the keys leading to the list of observers of an algorithm, as listed in
+        observer_components.yaml, or None if the algorithm is not listed.
+        """
+
+        return self.observer_components.get(algorithm, {}).get('observer_nesting')
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_yaml(self, algorithm):
+
+        """
+        Renders a given algorithm to YAML. The rendered text is returned as it is, without being
+        parsed and written out again, when the algorithm has no observer components to remove or
+        when every observation template can be pruned to the allowed components before it is
+        rendered. The rendered text of the observations is then taken from the fragment cache.
+        This is much faster for large configurations but the YAML keeps the layout of the
+        templates and is not checked to be valid YAML. Otherwise the components are removed from
+        the parsed dictionary, which is written out again.
+
+        Args:
+            algorithm (str): The name of the algorithm to assemble a YAML for.
+
+        Returns:
+            str: The YAML that can drive the JEDI executable.
+        """
+
+        # Load the algorithm template
+        template = self.env.get_template(algorithm + '.yaml.j2')
+
+        # Render the template hierarchy, with the algorithm in the variables of this render
+        functions = counted_functions(self.template_functions)
+        context = {**functions, **self.template_dict, 'algorithm': algorithm}
+        try:
+            jedi_dict_yaml = None
+
+            if algorithm not in self.observer_components:
+                with template_timer(template.name), functions_for_render(functions):
+                    jedi_dict_yaml = template.render(context)
+
+                # Check that everything was rendered
+                check_rendered(jedi_dict_yaml, template.name)
+
+            # The observer components can be removed from the text when every observation
+            # template is pruned completely before it is rendered
+            elif self.fragment_cache is not None and \
+                    self.allowed_components(algorithm) is not None:
+                with functions_for_render(functions):
+                    jedi_dict_yaml = self.fragment_cache.render_text(
+                        self.env, template, context, check_rendered,
+                        self.allowed_components(algorithm))
+
+        except j2.exceptions.UndefinedError as e:
+            print(f'Resolving templates for {algorithm} failed with the following exception: {e}')
+            return None
+
+        if jedi_dict_yaml is not None:
+            return jedi_dict_yaml
+
+        # Otherwise removing observer components needs the parsed dictionary
+        jedi_dict = self.render(algorithm)
+        if jedi_dict is None:
+            return None
+        with phase('serialize'):
+            return yaml_backend.dump(jedi_dict, default_flow_style=False, sort_keys=False)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render_many(self, algorithms, share_subtrees=True):
+
+        """
+        Renders several algorithms. The algorithms share the templates, the processed chronicles
+        and the rendered observers of this Renderer so each is only loaded, processed or rendered
+        once. By default identical sub-trees of the rendered dictionaries are also shared so that
+        they are only held in memory once, in which case a dictionary should be copied before it
+        is modified.
+
+        Args:
+            algorithms (list): The names of the algorithms to assemble YAMLs for.
+            share_subtrees (bool): Whether identical sub-trees of the results are shared.
+
+        Returns:
+            dict: The dictionary that can drive the JEDI executable for each algorithm.
+        """
+
+        jedi_dicts = {algorithm: self.render(algorithm) for algorithm in algorithms}
+
+        if share_subtrees:
+            jedi_dicts = jcb.share_subtrees(jedi_dicts)
+
+        return jedi_dicts
 
 
 # --------------------------------------------------------------------------------------------------
@@ -254,6 +937,11 @@ def render(template_dict: dict):
         Exception: If the 'algorithm' key is missing in the template dictionary.
     """
 
+    # Read the result from the result cache if one is used (see jcb.result_cache)
+    result_cache = jcb.result_cache.result_cache_for(template_dict)
+    if result_cache is not None:
+        return result_cache.render(template_dict)[0]
+
     # Create a jcb object
     jcb_object = Renderer(template_dict)
 
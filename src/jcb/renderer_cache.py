@@ -0,0 +1,127 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from collections import OrderedDict
+import threading
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Reuse of Renderers between dictionaries of templates. Processes that render many dictionaries of
+templates, such as the render server and batch rendering, keep a Renderer for each of the most
+recently used setups, i.e. the keys of the dictionary of templates that determine how a Renderer is
+set up (see renderer_setup_keys). The compiled templates, the processed chronicles and the rendered
+observers of the Renderer are then reused by the next dictionary with the same setup.
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def renderer_setup(template_dict):
+
+    """
+    Returns the setup of a dictionary of templates, the values of the keys that determine how a
+    Renderer is set up, as a string.
+    """
+
+    return repr([(key, template_dict.get(key)) for key in jcb.renderer.renderer_setup_keys])
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class RendererCache():
+
+    """
+    Keeps Renderers for the most recently used setups.
+
+    A dictionary of templates with the same setup and the same keys as an earlier one reuses its
+    Renderer, which is updated with the values that changed so that only the observers that depend
+    on them are rendered again.
+
+    The cache can be used by several threads, as long as they do not use the same setup at the
+    same time, since the Renderer of a setup is updated for each dictionary of templates.
+
+    Attributes:
+        max_renderers (int): The maximum number of Renderers that are kept.
+        renderers (OrderedDict): The dictionary of templates and the Renderer for each setup, the
+                                 most recently used last.
+    """
+
+    def __init__(self, max_renderers=8):
+        self.max_renderers = max_renderers
+        self.renderers = OrderedDict()
+        self.lock = threading.Lock()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get(self, template_dict):
+
+        """
+        Returns a Renderer for a dictionary of templates, reusing and updating a kept Renderer
+        when possible.
+
+        Args:
+            template_dict (dict): The dictionary of templates, which is not modified.
+
+        Returns:
+            Renderer: The Renderer.
+        """
+
+        setup = renderer_setup(template_dict)
+
+        with self.lock:
+            entry = self.renderers.pop(setup, None)
+
+        if entry is not None and set(entry[0]) == set(template_dict):
+            previous_dict, renderer = entry
+            changed_keys = {key: value for key, value in template_dict.items()
+                            if value != previous_dict[key]}
+            if changed_keys:
+                renderer.update(**changed_keys)
+        else:
+            if entry is not None:
+                entry[1].close()
+            renderer = jcb.Renderer(dict(template_dict))
+
+        evicted = []
+        with self.lock:
+            self.renderers[setup] = (dict(template_dict), renderer)
+            while len(self.renderers) > self.max_renderers:
+                evicted.append(self.renderers.popitem(last=False)[1][1])
+
+        for oldest_renderer in evicted:
+            oldest_renderer.close()
+
+        return renderer
+
+    # ----------------------------------------------------------------------------------------------
+
+    def close(self):
+
+        """
+        Close and forget all the Renderers.
+        """
+
+        with self.lock:
+            renderers = [renderer for _, renderer in self.renderers.values()]
+            self.renderers.clear()
+
+        for renderer in renderers:
+            renderer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.renderers)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,594 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import jcb
+from jcb.fragment_cache import canonical_value
+from jcb.utilities.files import write_atomic
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Content addressed cache of rendered configurations on disk. Workflows often render exactly the
+same configuration again, e.g. when a task is retried or an experiment is rerun, and then the
+rendered configuration can be read back instead of being rendered. The key of a result is a digest
+of everything that the render depends on:
+
+  - The dictionary of templates, without the jcb_ options that only change how it is rendered.
+  - The algorithm.
+  - The content of the files in the template search paths, or of the template archive.
+  - The content of the observation chronicle files.
+  - The version of jcb.
+
+The content of each file is hashed once and the digest is kept, with the modification time and
+size of the file, in an index in the cache directory, so that a lookup only has to list the files
+and read the ones that changed. This is the same check that Jinja2 makes before reusing a compiled
+template. The files of a directory with an up to date manifest (see jcb index) are taken from the
+manifest instead of being listed, and a process reuses the digest of a directory for
+tree_digest_lifetime seconds without checking the files again, so that rendering many
+configurations in a row does not stat the whole tree each time.
+
+The cache directory can be shared between many processes on many nodes. Results are written to a
+temporary file that is renamed into place so that readers only ever see complete files, and
+reading a result touches it so that the least recently used results are evicted first when the
+cache grows beyond its size. The size includes the file indexes and the counters of hits and
+misses. The counters are a small file that each process adds its hits and misses to about once a
+second, and when it exits, so they are approximate when processes add to them at the same time.
+The cache is an optimization so failing to read or write it is not an error. Results are stored
+as JSON, and a configuration that does not come back from JSON unchanged (e.g. one with dates) is
+not stored.
+"""
+
+# Environment variables that can be used to provide the directory and the size of the cache
+result_cache_dir_environment_variable = 'JCB_RESULT_CACHE_DIR'
+result_cache_size_environment_variable = 'JCB_RESULT_CACHE_SIZE'
+
+# Default size of the cache in bytes
+default_max_size = 1 << 30
+
+# Keys of the dictionary of templates that do not change the rendered configuration. The archive
+# is part of the key through its content.
+option_keys = ['jcb_cache_dir', 'jcb_fragment_cache', 'jcb_workers', 'jcb_template_archive',
+               'jcb_prune_observer_templates', 'jcb_result_cache_dir', 'jcb_result_cache_size']
+
+# Changing this invalidates all the results that are stored
+result_cache_version = 1
+
+# Suffixes of sizes
+size_suffixes = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+# Temporary files older than this (in seconds) were left behind by a process that died
+stale_temporary_age = 3600
+
+# Digests of the files read by this process, by path, with the modification time and size, and of
+# the directories, by path, with the time they were computed
+_file_digests = {}
+_tree_digests = {}
+
+# Time in seconds for which a process reuses the digest of a directory without checking its files
+tree_digest_lifetime = 1.0
+
+# Time in seconds between the writes of the hits and misses of a process to the counters file
+counters_interval = 1.0
+
+# Hits and misses of this process not yet added to each counters file, and the time each counters
+# file was last written
+_pending_counts = {}
+_counts_written = {}
+_pending_counts_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_counters(counters_path):
+
+    """
+    Returns the hits and misses in a counters file.
+    """
+
+    try:
+        with open(counters_path, 'r') as f:
+            counters = json.load(f)
+        return int(counters['hits']), int(counters['misses'])
+    except (OSError, ValueError, TypeError, KeyError):
+        return 0, 0
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_counts(counters_path=None):
+
+    """
+    Add the hits and misses counted by this process to a counters file, or to all of them.
+    """
+
+    with _pending_counts_lock:
+        paths = list(_pending_counts) if counters_path is None else [counters_path]
+        pending = {path: _pending_counts.pop(path) for path in paths if path in _pending_counts}
+        for path in pending:
+            _counts_written[path] = time.monotonic()
+
+    for path, (hits, misses) in pending.items():
+        written_hits, written_misses = read_counters(path)
+        write_atomic(path, json.dumps({'hits': written_hits + hits,
+                                       'misses': written_misses + misses}).encode('utf-8'))
+
+
+atexit.register(write_counts)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_size(size):
+
+    """
+    Parse a size in bytes, e.g. 500M or 2G.
+
+    Args:
+        size (int or str): The size, a number of bytes with an optional K, M, G or T suffix.
+
+    Returns:
+        int: The number of bytes.
+    """
+
+    text = str(size).strip().upper().rstrip('B')
+    suffix = text[-1:] if text[-1:] in size_suffixes else ''
+
+    try:
+        return int(float(text[:len(text) - len(suffix)]) * size_suffixes[suffix])
+    except ValueError:
+        jcb.abort(f'The cache size {size} is not a number of bytes, e.g. 500M or 2G.')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def json_exact(value):
+
+    """
+    Returns True if a value comes back from JSON unchanged.
+    """
+
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and json_exact(item) for key, item in value.items())
+    if isinstance(value, list):
+        return all(json_exact(item) for item in value)
+
+    return value is None or type(value) in (str, int, float, bool)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class ResultCache():
+
+    """
+    A cache of rendered configurations in a directory, see the module documentation.
+
+    Attributes:
+        directory (str): The cache directory.
+        max_size (int): The size in bytes that the results are pruned to.
+        prune_interval (int): The results are pruned after about one in this many results that
+                              are stored.
+        hits (int): The number of results found by this object.
+        misses (int): The number of results not found by this object.
+    """
+
+    def __init__(self, directory, max_size=default_max_size, prune_interval=16):
+
+        self.directory = os.path.abspath(directory)
+        self.max_size = parse_size(max_size)
+        self.prune_interval = prune_interval
+        self.hits = 0
+        self.misses = 0
+
+        self.results_directory = os.path.join(self.directory, 'results')
+        self.indexes_directory = os.path.join(self.directory, 'indexes')
+        self.counters_path = os.path.join(self.directory, 'counters')
+
+    # ----------------------------------------------------------------------------------------------
+
+    def result_path(self, key):
+        return os.path.join(self.results_directory, key[:2], key + '.json')
+
+    # ----------------------------------------------------------------------------------------------
+
+    def tree_digest(self, path):
+
+        """
+        Returns a digest of the names and content of the files in a directory, or of a file. Files
+        whose modification time and size have not changed since they were last hashed are not
+        read again, and a digest computed less than tree_digest_lifetime seconds ago is reused.
+
+        Args:
+            path (str): The directory or file.
+
+        Returns:
+            str: The digest.
+        """
+
+        path = os.path.abspath(path)
+
+        tree_digest = _tree_digests.get(path)
+        if tree_digest is not None and time.monotonic() - tree_digest[0] < tree_digest_lifetime:
+            return tree_digest[1]
+
+        if os.path.isfile(path):
+            file_paths = [path]
+        else:
+            # The files are listed from the manifest of the tree when it is up to date
+            manifest = jcb.tree_index.fresh_index(path)
+            file_paths = []
+            walk = manifest.walk(path) if manifest else os.walk(path)
+            for directory, subdirectories, files in walk:
+                subdirectories[:] = sorted(subdirectory for subdirectory in subdirectories
+                                           if not subdirectory.startswith('.') and
+                                           subdirectory != '__pycache__')
+                file_paths += [os.path.join(directory, name) for name in sorted(files)
+                               if not name.startswith('.') and
+                               name != jcb.tree_index.index_file_name]
+
+        index_path = os.path.join(self.indexes_directory,
+                                  hashlib.sha256(path.encode('utf-8')).hexdigest() + '.json')
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        digest = hashlib.sha256()
+        new_index = {}
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            # A digest is reused if the file has not changed
+            signature = [stat.st_mtime_ns, stat.st_size]
+            file_digest = _file_digests.get(file_path)
+            if file_digest is None or file_digest[:2] != signature:
+                file_digest = index.get(file_path)
+            if file_digest is None or file_digest[:2] != signature:
+                with open(file_path, 'rb') as f:
+                    file_digest = signature + [hashlib.sha256(f.read()).hexdigest()]
+
+            _file_digests[file_path] = new_index[file_path] = file_digest
+            digest.update(f'{os.path.relpath(file_path, path)}\0{file_digest[2]}\0'.encode('utf-8'))
+
+        if new_index != index:
+            write_atomic(index_path, json.dumps(new_index).encode('utf-8'))
+
+        _tree_digests[path] = (time.monotonic(), digest.hexdigest())
+
+        return digest.hexdigest()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def key(self, template_dict, algorithm):
+
+        """
+        Returns the key of the result of rendering an algorithm from a dictionary of templates.
+
+        Args:
+            template_dict (dict): The dictionary of templates.
+            algorithm (str): The name of the algorithm.
+
+        Returns:
+            str: The key, a hexadecimal digest, or None if the result cannot be cached because the
+                 templates come from a loader object (see jcb.template_bundle).
+        """
+
+        digest = hashlib.sha256()
+
+        def add(*parts):
+            for part in parts:
+                digest.update(f'{part}\0'.encode('utf-8'))
+
+        add(result_cache_version, jcb.__version__, algorithm,
+            canonical_value({key: value for key, value in template_dict.items()
+                             if key not in option_keys}))
+
+        # The templates come from the archive if there is one
+        archive_path = template_dict.get('jcb_template_archive')
+        if archive_path:
+            add('archive', self.tree_digest(archive_path))
+        else:
+            for search_path in jcb.renderer.get_search_paths(template_dict)[1]:
+                if not isinstance(search_path, str):
+                    return None
+                add('templates', self.tree_digest(jcb.template_bundle.bundle_file(search_path) or
+                                                  search_path), search_path)
+
+        chronicle_path = template_dict.get('app_path_observation_chronicle')
+        if chronicle_path:
+            chronicle_path = jcb.renderer.get_app_path(chronicle_path)
+            if not isinstance(chronicle_path, str):
+                return None
+            add('chronicle', self.tree_digest(jcb.template_bundle.bundle_file(chronicle_path) or
+                                              chronicle_path), chronicle_path)
+
+        return digest.hexdigest()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def count(self, event):
+
+        """
+        Count a hit or a miss in the counters of the cache directory, which are shared with the
+        other processes using the cache. The counts are added to the counters file at most about
+        once every counters_interval seconds, and when the process exits.
+
+        Args:
+            event (str): 'hits' or 'misses'.
+        """
+
+        with _pending_counts_lock:
+            hits, misses = _pending_counts.get(self.counters_path, (0, 0))
+            _pending_counts[self.counters_path] = (hits + (event == 'hits'),
+                                                   misses + (event == 'misses'))
+            written = _counts_written.get(self.counters_path)
+
+        if written is None or time.monotonic() - written >= counters_interval:
+            write_counts(self.counters_path)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get(self, key):
+
+        """
+        Returns a stored result, or None if there is no result with the key. The result is marked
+        as recently used.
+        """
+
+        path = self.result_path(key)
+
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            result = None
+
+        if result is None:
+            self.misses += 1
+            self.count('misses')
+        else:
+            self.hits += 1
+            self.count('hits')
+
+        return result
+
+    # ----------------------------------------------------------------------------------------------
+
+    def put(self, key, result):
+
+        """
+        Store a result. Results that would not come back from JSON unchanged are not stored.
+
+        Args:
+            key (str): The key of the result.
+            result (dict): The result.
+
+        Returns:
+            bool: Whether the result was stored.
+        """
+
+        if not json_exact(result):
+            return False
+
+        data = json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if not write_atomic(self.result_path(key), data):
+            return False
+
+        # The keys are uniformly distributed so this prunes after about one in prune_interval
+        if int(key[:8], 16) % self.prune_interval == 0:
+            self.prune()
+
+        return True
+
+    # ----------------------------------------------------------------------------------------------
+
+    def entries(self):
+
+        """
+        Returns the path, size and last use of each result, and removes the temporary files left
+        behind by processes that died while writing.
+        """
+
+        entries = []
+        now = time.time()
+
+        try:
+            subdirectories = [entry.path for entry in os.scandir(self.results_directory)
+                              if entry.is_dir()]
+        except OSError:
+            return entries
+
+        for subdirectory in subdirectories:
+            try:
+                files = list(os.scandir(subdirectory))
+            except OSError:
+                continue
+            for entry in files:
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith('.json'):
+                        entries.append((entry.path, stat.st_size, stat.st_mtime))
+                    elif now - stat.st_mtime > stale_temporary_age:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+        return entries
+
+    # ----------------------------------------------------------------------------------------------
+
+    def metadata_size(self):
+
+        """
+        Returns the size in bytes of the file indexes and the counters.
+        """
+
+        try:
+            paths = [entry.path for entry in os.scandir(self.indexes_directory)]
+        except OSError:
+            paths = []
+
+        size = 0
+        for path in [self.counters_path] + paths:
+            try:
+                size += os.stat(path).st_size
+            except OSError:
+                pass
+
+        return size
+
+    # ----------------------------------------------------------------------------------------------
+
+    def prune(self, max_size=None):
+
+        """
+        Remove the least recently used results until the cache, with the file indexes and the
+        counters, fits in a size.
+
+        Args:
+            max_size (int or str): The size in bytes, by default the size of the cache.
+
+        Returns:
+            int: The number of results that were removed.
+        """
+
+        max_size = self.max_size if max_size is None else parse_size(max_size)
+
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries) + self.metadata_size()
+
+        removed = 0
+        for path, entry_size, _ in entries:
+            if size <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            removed += 1
+
+        return removed
+
+    # ----------------------------------------------------------------------------------------------
+
+    def clear(self):
+
+        """
+        Remove all the results, the file indexes and the counters.
+        """
+
+        for directory in (self.results_directory, self.indexes_directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+        with _pending_counts_lock:
+            _pending_counts.pop(self.counters_path, None)
+
+        try:
+            os.remove(self.counters_path)
+        except OSError:
+            pass
+
+    # ----------------------------------------------------------------------------------------------
+
+    def stats(self):
+
+        """
+        Returns the number of results, the size of the cache and the hits and misses counted by
+        all the processes using the cache.
+        """
+
+        entries = self.entries()
+
+        write_counts(self.counters_path)
+        hits, misses = read_counters(self.counters_path)
+
+        return {
+            'directory': self.directory,
+            'results': len(entries),
+            'size': sum(entry[1] for entry in entries) + self.metadata_size(),
+            'max_size': self.max_size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+    # ----------------------------------------------------------------------------------------------
+
+    def render(self, template_dict, algorithm=None):
+
+        """
+        Render an algorithm from a dictionary of templates, reading the result from the cache if
+        it was rendered before and storing it otherwise.
+
+        Args:
+            template_dict (dict): The dictionary of templates.
+            algorithm (str): The algorithm, by default the algorithm key of the dictionary.
+
+        Returns:
+            dict: The rendered JEDI dictionary, or None if rendering failed.
+            list: The keys leading to the list of observers (see Renderer.observer_nesting).
+        """
+
+        if algorithm is None:
+            jcb.abort_if('algorithm' not in template_dict,
+                         'The dictionary of templates must have an algorithm key')
+            algorithm = template_dict['algorithm']
+
+        key = self.key(template_dict, algorithm)
+
+        result = None if key is None else self.get(key)
+        if result is not None:
+            return result['jedi_dict'], result['observer_nesting']
+
+        with jcb.Renderer(template_dict) as renderer:
+            jedi_dict = renderer.render(algorithm)
+            observer_nesting = renderer.observer_nesting(algorithm)
+
+        if jedi_dict is not None and key is not None:
+            self.put(key, {'jedi_dict': jedi_dict, 'observer_nesting': observer_nesting})
+
+        return jedi_dict, observer_nesting
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def result_cache_for(template_dict):
+
+    """
+    Returns the result cache chosen by a dictionary of templates, with jcb_result_cache_dir and
+    jcb_result_cache_size, or by the JCB_RESULT_CACHE_DIR and JCB_RESULT_CACHE_SIZE environment
+    variables, or None if no cache directory is given.
+    """
+
+    directory = template_dict.get('jcb_result_cache_dir') or \
+        os.environ.get(result_cache_dir_environment_variable)
+    if not directory:
+        return None
+
+    max_size = template_dict.get('jcb_result_cache_size') or \
+        os.environ.get(result_cache_size_environment_variable) or default_max_size
+
+    return ResultCache(directory, max_size)
+
+
+# --------------------------------------------------------------------------------------------------
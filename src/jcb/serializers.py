@@ -0,0 +1,148 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from datetime import date, datetime
+import json
+import os
+
+import jcb
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Writing rendered configurations out as YAML, JSON or JSONL. JEDI reads JSON as well as YAML, and
+the JSON encoder of the standard library is much faster than writing YAML, which matters for the
+largest configurations. JSONL writes the configuration with an empty list of observers on the first
+line and then one observer per line, for tools that process the observers independently; the
+observers belong in the list at the observer_nesting of the algorithm in observer_components.yaml.
+"""
+
+# Formats the rendered configurations can be written in
+output_formats = ['yaml', 'json', 'jsonl']
+
+# Format of each file extension
+format_extensions = {'.yaml': 'yaml', '.yml': 'yaml', '.json': 'json', '.jsonl': 'jsonl'}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def format_from_path(path, default='yaml'):
+
+    """
+    Returns the output format for a file from its extension.
+
+    Args:
+        path (str): The path of the file.
+        default (str): The format for other extensions.
+
+    Returns:
+        str: The output format.
+    """
+
+    return format_extensions.get(os.path.splitext(path)[1].lower(), default)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def json_default(value):
+
+    """
+    Convert the values that JSON does not have, the dates that YAML reads from timestamps. YAML
+    reads timestamps without a time zone as UTC.
+    """
+
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.isoformat() + 'Z'
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def to_json(jedi_dict):
+
+    """
+    Returns a configuration as JSON on a single line.
+    """
+
+    return json.dumps(jedi_dict, ensure_ascii=False, default=json_default)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def to_jsonl(jedi_dict, observer_nesting=None):
+
+    """
+    Returns a configuration as JSONL, the configuration with an empty list of observers on the
+    first line followed by a line for each observer.
+
+    Args:
+        jedi_dict (dict): The configuration, which is not modified.
+        observer_nesting (list): The keys leading to the list of observers. Without them, or if
+                                 the configuration has no observers there, the whole configuration
+                                 is written on one line.
+
+    Returns:
+        str: The JSONL.
+    """
+
+    # Copy the dictionaries on the way to the observers, which are replaced by an empty list
+    observers = None
+    if observer_nesting:
+        header = dict(jedi_dict)
+        parent = header
+        for key in observer_nesting[:-1]:
+            if not isinstance(parent.get(key), dict):
+                break
+            parent[key] = dict(parent[key])
+            parent = parent[key]
+        else:
+            if isinstance(parent.get(observer_nesting[-1]), list):
+                observers = parent[observer_nesting[-1]]
+                parent[observer_nesting[-1]] = []
+
+    if observers is None:
+        return to_json(jedi_dict) + '\n'
+
+    return ''.join(to_json(record) + '\n' for record in [header] + observers)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def serialize(jedi_dict, output_format='yaml', observer_nesting=None):
+
+    """
+    Write a rendered configuration out in one of the output formats.
+
+    Args:
+        jedi_dict (dict): The rendered configuration.
+        output_format (str): One of 'yaml', 'json' or 'jsonl'.
+        observer_nesting (list): The keys leading to the list of observers, used by JSONL.
+
+    Returns:
+        str: The configuration in the format.
+    """
+
+    jcb.abort_if(output_format not in output_formats,
+                 f'The format {output_format} is not one of {", ".join(output_formats)}.')
+
+    if output_format == 'json':
+        return to_json(jedi_dict) + '\n'
+    if output_format == 'jsonl':
+        return to_jsonl(jedi_dict, observer_nesting)
+
+    return yaml_backend.dump(jedi_dict, default_flow_style=False, sort_keys=False)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,340 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import jcb
+from jcb.renderer_cache import renderer_setup, RendererCache
+from jcb.serializers import output_formats
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+A long running render server on a Unix domain socket. The server keeps Renderers, and with them
+the compiled templates, the processed chronicles and the rendered observers, in memory between
+requests so that each request only costs the render itself.
+
+Each message is a YAML document followed by an optional payload of raw text, preceded by their
+lengths as 8 byte big endian integers. YAML is used rather than JSON so that dictionaries of
+templates read from YAML, which can contain dates, are sent unchanged. A request holds the
+dictionary of templates and optionally the algorithm, the format of the result (see serializers)
+and whether to use passthrough rendering. The response has a status ('ok' or 'error') and an error
+message, the rendered configuration is sent as the payload so that it is not quoted and parsed.
+
+The server handles each connection in its own thread, so that requests for different setups (see
+RendererCache) are rendered at the same time. The paths of a request are made absolute by the
+client, since the server runs in another working directory.
+"""
+
+# Format of the lengths that precede each message
+message_header = struct.Struct('>QQ')
+
+# Default time in seconds that a client waits for the server to connect and to respond before
+# rendering itself
+default_timeout = 120.0
+
+# Keys of the dictionary of templates whose paths are relative to the working directory. App paths
+# that are not absolute are relative to the jcb apps directory (see jcb.renderer.get_app_path).
+path_keys = ['algorithm_path', 'jcb_cache_dir', 'jcb_template_archive', 'jcb_result_cache_dir']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def send_message(sock, message, payload=''):
+
+    """
+    Send a message over a socket.
+
+    Args:
+        sock (socket.socket): The connected socket.
+        message (dict): The message.
+        payload (str): Optional text sent with the message.
+    """
+
+    data = yaml_backend.dump(message, sort_keys=False).encode('utf-8')
+    payload = payload.encode('utf-8')
+
+    sock.sendall(message_header.pack(len(data), len(payload)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def receive_exactly(sock, size):
+
+    """
+    Receive a number of bytes from a socket.
+    """
+
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('The connection was closed before the message was received.')
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b''.join(chunks)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def receive_message(sock):
+
+    """
+    Receive a message from a socket.
+
+    Args:
+        sock (socket.socket): The connected socket.
+
+    Returns:
+        dict: The message.
+        str: The text sent with the message.
+    """
+
+    size, payload_size = message_header.unpack(receive_exactly(sock, message_header.size))
+
+    message = yaml_backend.safe_load(receive_exactly(sock, size).decode('utf-8'))
+    payload = receive_exactly(sock, payload_size).decode('utf-8')
+
+    return message, payload
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_request(renderer, request):
+
+    """
+    Render the configuration asked for by a request.
+
+    Args:
+        renderer (Renderer): The Renderer for the dictionary of templates of the request.
+        request (dict): The request.
+
+    Returns:
+        str: The rendered configuration in the format of the request.
+    """
+
+    algorithm = request.get('algorithm') or request['template_dict'].get('algorithm')
+    output_format = request.get('format', 'yaml')
+
+    jcb.abort_if(algorithm is None, 'The dictionary of templates must have an algorithm key')
+    jcb.abort_if(output_format not in output_formats,
+                 f'The format {output_format} is not one of {", ".join(output_formats)}.')
+
+    if output_format == 'yaml' and request.get('passthrough'):
+        result = renderer.render_yaml(algorithm)
+    else:
+        result = renderer.render_text(algorithm, output_format)
+
+    jcb.abort_if(result is None, f'Resolving the templates for {algorithm} failed.')
+
+    return result
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    """
+    Serves renders over a Unix domain socket. Each request is handled in its own thread.
+
+    Renderers are kept for the most recently used setups and reused by later requests (see
+    RendererCache). Since the Renderer of a setup is updated for each request, requests with the
+    same setup are rendered one at a time, while requests with other setups go ahead.
+
+    Attributes:
+        renderers (RendererCache): The Renderers that are kept.
+        setup_locks (list): Locks taken while rendering, chosen by the setup of the request.
+        requests (int): The number of requests that were handled.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_renderers=8):
+
+        self.renderers = RendererCache(max_renderers)
+        self.setup_locks = [threading.Lock() for _ in range(max(max_renderers, 1))]
+        self.requests = 0
+        self.requests_lock = threading.Lock()
+
+        super().__init__(socket_path, RenderRequestHandler)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def handle_request_message(self, request):
+
+        """
+        Returns the response to a request and the rendered configuration.
+        """
+
+        with self.requests_lock:
+            self.requests += 1
+
+        try:
+            setup = renderer_setup(request['template_dict'])
+            with self.setup_locks[hash(setup) % len(self.setup_locks)]:
+                renderer = self.renderers.get(request['template_dict'])
+                return {'status': 'ok'}, render_request(renderer, request)
+        except Exception as e:
+            return {'status': 'error', 'message': f'{type(e).__name__}: {e}'}, ''
+
+    # ----------------------------------------------------------------------------------------------
+
+    def server_close(self):
+
+        super().server_close()
+
+        self.renderers.close()
+
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class RenderRequestHandler(socketserver.BaseRequestHandler):
+
+    """
+    Handles one connection to the render server, which carries one request.
+    """
+
+    def handle(self):
+
+        try:
+            request, _ = receive_message(self.request)
+        except ConnectionError:
+            return
+        except Exception as e:
+            response, result = {'status': 'error', 'message': f'The request could not be read: '
+                                                              f'{e}'}, ''
+        else:
+            response, result = self.server.handle_request_message(request)
+
+        send_message(self.request, response, result)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def server_running(socket_path):
+
+    """
+    Returns True if a server is accepting connections on a socket.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+
+    return True
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def create_server(socket_path, max_renderers=8):
+
+    """
+    Create a render server on a socket. A socket file left behind by a server that is no longer
+    running is removed.
+
+    Args:
+        socket_path (str): The path of the Unix domain socket.
+        max_renderers (int): The maximum number of Renderers that are kept.
+
+    Returns:
+        RenderServer: The server, which is started with serve_forever.
+    """
+
+    if os.path.exists(socket_path):
+        jcb.abort_if(server_running(socket_path),
+                     f'A jcb server is already running on {socket_path}.')
+        os.remove(socket_path)
+
+    return RenderServer(socket_path, max_renderers)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def absolute_paths(template_dict):
+
+    """
+    Returns a copy of a dictionary of templates with its paths resolved in the working directory
+    of this process, and its app paths resolved as the Renderer resolves them.
+    """
+
+    template_dict = dict(template_dict)
+
+    for key, value in template_dict.items():
+        if not isinstance(value, str):
+            continue
+        if key.startswith('app_path_'):
+            template_dict[key] = jcb.renderer.get_app_path(value)
+        elif key in path_keys:
+            template_dict[key] = os.path.abspath(value)
+
+    return template_dict
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_with_server(socket_path, template_dict, algorithm=None, output_format='yaml',
+                       passthrough=False, timeout=default_timeout):
+
+    """
+    Render a dictionary of templates using a render server.
+
+    Args:
+        socket_path (str): The path of the Unix domain socket of the server.
+        template_dict (dict): The dictionary of templates.
+        algorithm (str): Optional algorithm, by default the algorithm key of the dictionary.
+        output_format (str): The format of the result, 'yaml', 'json' or 'jsonl'.
+        passthrough (bool): Whether the server writes the rendered text without parsing it when
+                            it can (see Renderer.render_yaml).
+        timeout (float): Time in seconds to wait for the server to connect and for each part of
+                         the response, None to wait for as long as it takes.
+
+    Returns:
+        str: The rendered configuration.
+
+    Raises:
+        OSError: If the server cannot be reached or does not respond in time, in which case the
+                 caller can render itself.
+        JcbError: If the server could not render the dictionary of templates.
+    """
+
+    request = {'template_dict': absolute_paths(template_dict), 'algorithm': algorithm,
+               'format': output_format, 'passthrough': passthrough}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        send_message(sock, request)
+        response, result = receive_message(sock)
+
+    jcb.abort_if(response.get('status') != 'ok',
+                 lambda: f'The jcb server could not render the dictionary of templates: '
+                         f'{response.get("message")}')
+
+    return result
+
+
+# --------------------------------------------------------------------------------------------------
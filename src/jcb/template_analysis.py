@@ -0,0 +1,727 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import functools
+import itertools
+import operator
+import weakref
+
+import jinja2 as j2
+from jinja2 import meta, nodes
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Analysis of the templates. Jinja2 can report, from the abstract syntax tree of a template, the
+variables that the template reads from the context and the other templates that it includes. This
+is used to decide which keys of the dictionary of templates a template depends on.
+
+The abstract syntax trees are also used to plan a render: starting from a template, the includes
+are followed, evaluating the names of dynamically included templates from the dictionary of
+templates and the loops of the templates, to find all the templates that a render loads and all
+the keys of the dictionary of templates that it reads, without rendering anything.
+"""
+
+# Functions that the Renderers pass to the templates with the dictionary of templates. They are
+# also globals of the environments (see jcb.environment) but are read from the context.
+template_function_names = ['use_observer', 'get_satellite_variable']
+
+# Tests and filters that mean a variable does not have to be in the dictionary of templates
+optional_tests = ['defined', 'undefined']
+optional_filters = ['default', 'd']
+
+# Comparisons of the tests of if statements that are evaluated when planning a render
+compare_operators = {'eq': operator.eq, 'ne': operator.ne, 'lt': operator.lt, 'lteq': operator.le,
+                     'gt': operator.gt, 'gteq': operator.ge,
+                     'in': lambda left, right: left in right,
+                     'notin': lambda left, right: left not in right}
+
+# Dependencies of each template object. Weak references are used so that templates that are
+# reloaded, because the source was changed, are not kept alive by this cache.
+_dependencies = weakref.WeakKeyDictionary()
+
+# Source, abstract syntax tree and variables of the templates of each environment
+_source_analyses = weakref.WeakKeyDictionary()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class ContextTrackingCodeGenerator(meta.TrackingCodeGenerator):
+
+    """
+    Finds the variables that a template reads from the context like
+    jinja2.meta.find_undeclared_variables, including the functions of the Renderers although
+    they are globals of the environment.
+    """
+
+    def enter_frame(self, frame):
+
+        super().enter_frame(frame)
+
+        for action, name in frame.symbols.loads.values():
+            if action == 'resolve' and name in template_function_names:
+                self.undeclared_identifiers.add(name)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def undeclared_variables(ast):
+
+    """
+    Return the variables that a template reads from the context, see ContextTrackingCodeGenerator.
+    """
+
+    code_generator = ContextTrackingCodeGenerator(ast.environment)
+    code_generator.visit(ast)
+
+    return code_generator.undeclared_identifiers
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def source_dependencies(env, source):
+
+    """
+    Find the dependencies of a template from its source.
+
+    Args:
+        env (jinja2.Environment): The environment used to parse the source.
+        source (str): The source of the template.
+
+    Returns:
+        dict: 'variables', the sorted list of variables the template reads from the context, and
+              'includes', the sorted list of templates it includes or None if any of the includes
+              cannot be determined without rendering.
+    """
+
+    ast = env.parse(source)
+
+    includes = list(meta.find_referenced_templates(ast))
+    if None in includes:
+        includes = None
+    else:
+        includes = sorted(set(includes))
+
+    return {'variables': sorted(undeclared_variables(ast)), 'includes': includes}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def template_dependencies(env, template):
+
+    """
+    Return the direct dependencies of a template (see source_dependencies). When the environment
+    cannot provide the source of the template, e.g. for compiled archives, the dependencies that
+    were found when the archive was compiled are used.
+
+    Args:
+        env (jinja2.Environment): The environment the template was loaded with.
+        template (jinja2.Template): The template.
+
+    Returns:
+        dict: The dependencies of the template, or None if they are not known.
+    """
+
+    dependencies = _dependencies.get(template)
+
+    if dependencies is None:
+
+        precomputed = getattr(env, 'template_dependencies', None)
+        if precomputed is not None:
+            dependencies = precomputed.get(template.name)
+        elif env.loader.has_source_access:
+            source, _, _ = env.loader.get_source(env, template.name)
+            dependencies = source_dependencies(env, source)
+
+        if dependencies is None:
+            return None
+
+        _dependencies[template] = dependencies
+
+    return dependencies
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def set_template_dependencies(template, dependencies):
+
+    """
+    Set the direct dependencies of a template that was not compiled from the source the loader
+    provides for its name, e.g. because the source was modified before compiling.
+
+    Args:
+        template (jinja2.Template): The template.
+        dependencies (dict): The dependencies of the template (see source_dependencies).
+    """
+
+    _dependencies[template] = dependencies
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def template_variables(env, template):
+
+    """
+    Return all the variables that a template reads from the context, including through the
+    templates that it includes.
+
+    Args:
+        env (jinja2.Environment): The environment the template was loaded with.
+        template (jinja2.Template): The template.
+
+    Returns:
+        set: The variables, or None if they cannot be determined without rendering.
+    """
+
+    variables = set()
+    visited = set()
+    to_visit = [template]
+
+    while to_visit:
+
+        template = to_visit.pop()
+        if template.name in visited:
+            continue
+        visited.add(template.name)
+
+        dependencies = template_dependencies(env, template)
+        if dependencies is None or dependencies['includes'] is None:
+            return None
+
+        variables.update(dependencies['variables'])
+        to_visit += [env.get_template(name) for name in dependencies['includes']]
+
+    return variables
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def source_analysis(env, name, prune=None):
+
+    """
+    Return the abstract syntax tree of a template and the variables it reads from the context,
+    from the source of the template and without compiling it. The result is kept for as long as
+    the source of the template does not change.
+
+    Args:
+        env (jinja2.Environment): The environment, which must provide the source of templates.
+        name (str): The name of the template.
+        prune (function): Optional function called with the name and the source of the template
+                          that returns the source that is rendered, e.g. without the observer
+                          components that are not allowed (see jcb.component_pruning).
+
+    Returns:
+        jinja2.nodes.Template: The abstract syntax tree.
+        set: The variables the template reads from the context.
+
+    Raises:
+        jinja2.TemplateNotFound: If the template does not exist.
+    """
+
+    source, _, _ = env.loader.get_source(env, name)
+
+    # A pruned source is kept apart from the source of the template
+    key = name
+    if prune is not None:
+        pruned_source = prune(name, source)
+        if pruned_source != source:
+            key, source = (name, 'pruned'), pruned_source
+
+    analyses = _source_analyses.setdefault(env, {})
+    analysis = analyses.get(key)
+
+    if analysis is None or analysis[0] != source:
+        ast = env.parse(source)
+        analysis = analyses[key] = (source, ast, undeclared_variables(ast))
+
+    return analysis[1], analysis[2]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def non_output_uses(env, name, variables):
+
+    """
+    Find the uses of variables in a template other than as a whole output expression, i.e. other
+    than {{ variable }}. Variables that are only output can be substituted in the rendered text
+    without rendering again.
+
+    Args:
+        env (jinja2.Environment): The environment, which must provide the source of templates.
+        name (str): The name of the template.
+        variables (set): The names of the variables.
+
+    Returns:
+        list: The variable and line of each other use.
+    """
+
+    ast, undeclared = source_analysis(env, name)
+
+    if not undeclared & set(variables):
+        return []
+
+    outputs = set(id(node) for output in ast.find_all(nodes.Output) for node in output.nodes
+                  if isinstance(node, nodes.Name))
+
+    return [(node.name, node.lineno) for node in ast.find_all(nodes.Name)
+            if node.name in variables and (node.ctx != 'load' or id(node) not in outputs)]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class TemplatePlan():
+
+    """
+    The templates that rendering a template loads and the keys that it reads, found from the
+    abstract syntax trees of the templates without rendering.
+
+    Variables that are set by the templates, e.g. loop variables, are followed through the
+    includes. Their possible values are kept when they can be determined, so that the names of
+    dynamically included templates can be evaluated. An if statement that calls one of the
+    functions provided to the templates with a loop variable, e.g. use_observer(observation), is
+    evaluated for each value of the loop variable. The tests of other if statements are evaluated
+    from the dictionary of templates, and only the branch that is taken is followed. When a test
+    cannot be evaluated without rendering every branch is followed, and the keys that only these
+    branches read are conditional.
+
+    Attributes:
+        templates (list): The names of the templates that are loaded, in the order found.
+        variables (set): The keys of the dictionary of templates that are read.
+        conditional (set): The keys that are only read by branches that may not be taken.
+        optional (set): The keys that are tested with 'is defined' or given a default.
+        missing_templates (list): Templates that are included but do not exist.
+        unresolved (list): The template and line of includes whose names could not be evaluated.
+    """
+
+    def __init__(self, env, values, functions, prune=None):
+
+        """
+        Args:
+            env (jinja2.Environment): The environment the templates are loaded with.
+            values (dict): The dictionary of templates.
+            functions (dict): The functions provided to the templates.
+            prune (function): Optional function that returns the source of a template that is
+                              rendered (see source_analysis).
+        """
+
+        self.env = env
+        self.values = values
+        self.functions = functions
+        self.prune = prune
+
+        self.templates = []
+        self.variables = set()
+        self.conditional = set()
+        self.optional = set()
+        self.missing_templates = []
+        self.unresolved = []
+
+        self.visited = set()
+        self.current_template = None
+        self.current_variables = set()
+        self.conditional_depth = 0
+
+    # ----------------------------------------------------------------------------------------------
+
+    def add_template(self, name, bindings):
+
+        """
+        Add a template that is loaded with the variables set by the templates that include it.
+        """
+
+        try:
+            if self.env.loader.has_source_access:
+                ast, variables = source_analysis(self.env, name, self.prune)
+            else:
+                ast = None
+                dependencies = template_dependencies(self.env, self.env.get_template(name)) or {}
+                variables = set(dependencies.get('variables', []))
+        except j2.TemplateNotFound:
+            if name not in self.missing_templates:
+                self.missing_templates.append(name)
+            return
+
+        # Templates are visited again only when a variable they read from the includer changed,
+        # or when they are no longer only included by branches that may not be taken
+        key = (name, self.conditional_depth > 0,
+               tuple((variable, repr(bindings[variable]))
+                     for variable in sorted(variables) if variable in bindings))
+        if key in self.visited:
+            return
+        self.visited.add(key)
+
+        if name not in self.templates:
+            self.templates.append(name)
+
+        parent = (self.current_template, self.current_variables)
+        self.current_template = name
+        self.current_variables = variables
+
+        if ast is not None:
+            self.visit(ast, dict(bindings))
+        else:
+            # Without the syntax tree every key the template reads is read
+            for variable in variables:
+                self.add_variable(variable, bindings)
+            if dependencies.get('includes') is None:
+                self.unresolved.append((name, None))
+            else:
+                for include in dependencies['includes']:
+                    self.add_template(include, bindings)
+
+        self.current_template, self.current_variables = parent
+
+    # ----------------------------------------------------------------------------------------------
+
+    def add_variable(self, name, bindings):
+
+        """
+        Add a key of the dictionary of templates that is read, unless it is set by the templates.
+        """
+
+        if name in bindings or name in self.functions or name not in self.current_variables:
+            return
+
+        if self.conditional_depth:
+            self.conditional.add(name)
+        else:
+            self.variables.add(name)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def template_exists(self, name):
+
+        """
+        Returns True if a template can be loaded.
+        """
+
+        try:
+            if self.env.loader.has_source_access:
+                self.env.loader.get_source(self.env, name)
+            else:
+                self.env.get_template(name)
+        except (j2.TemplateNotFound, TypeError):
+            return False
+        return True
+
+    # ----------------------------------------------------------------------------------------------
+
+    def evaluate(self, node, bindings):
+
+        """
+        Returns the list of possible values of an expression, or None if they cannot be found
+        without rendering.
+        """
+
+        if isinstance(node, nodes.Const):
+            return [node.value]
+
+        if isinstance(node, nodes.Name):
+            if node.name in bindings:
+                return bindings[node.name]
+            if node.name in self.values:
+                return [self.values[node.name]]
+            return None
+
+        if isinstance(node, nodes.Test) and node.name in optional_tests and \
+           isinstance(node.node, nodes.Name) and not node.args:
+            if node.node.name in bindings:
+                return None
+            return [(node.node.name in self.values) == (node.name == 'defined')]
+
+        if isinstance(node, (nodes.Compare, nodes.Not, nodes.And, nodes.Or, nodes.Call)):
+            return self.evaluate_operation(node, bindings)
+
+        if isinstance(node, (nodes.Add, nodes.Concat, nodes.List, nodes.Tuple)):
+
+            operands = node.items if isinstance(node, (nodes.List, nodes.Tuple)) else \
+                node.nodes if isinstance(node, nodes.Concat) else [node.left, node.right]
+
+            possible = [self.evaluate(operand, bindings) for operand in operands]
+            if any(values is None for values in possible):
+                return None
+
+            results = []
+            for combination in itertools.product(*possible):
+                if isinstance(node, nodes.List):
+                    results.append(list(combination))
+                elif isinstance(node, nodes.Tuple):
+                    results.append(combination)
+                elif isinstance(node, nodes.Concat):
+                    results.append(''.join(str(value) for value in combination))
+                else:
+                    try:
+                        results.append(functools.reduce(operator.add, combination))
+                    except TypeError:
+                        return None
+            return results
+
+        return None
+
+    # ----------------------------------------------------------------------------------------------
+
+    def evaluate_operation(self, node, bindings):
+
+        """
+        Returns the list of possible values of a comparison, a logical operation or a call of one
+        of the functions provided to the templates, or None if they cannot be found without
+        rendering.
+        """
+
+        if isinstance(node, nodes.Compare):
+            operands = [node.expr] + [operand.expr for operand in node.ops]
+        elif isinstance(node, nodes.Not):
+            operands = [node.node]
+        elif isinstance(node, (nodes.And, nodes.Or)):
+            operands = [node.left, node.right]
+        elif isinstance(node.node, nodes.Name) and node.node.name in self.functions and \
+                not node.kwargs and node.dyn_args is None and node.dyn_kwargs is None:
+            operands = node.args
+        else:
+            return None
+
+        possible = [self.evaluate(operand, bindings) for operand in operands]
+        if any(values is None for values in possible):
+            return None
+
+        results = []
+        try:
+            for combination in itertools.product(*possible):
+                if isinstance(node, nodes.Compare):
+                    result = all(compare_operators[operand.op](left, right) for operand, left, right
+                                 in zip(node.ops, combination, combination[1:]))
+                elif isinstance(node, nodes.Not):
+                    result = not combination[0]
+                elif isinstance(node, nodes.And):
+                    result = combination[0] and combination[1]
+                elif isinstance(node, nodes.Or):
+                    result = combination[0] or combination[1]
+                else:
+                    result = self.functions[node.node.name](*combination)
+                results.append(result)
+        except Exception:
+            return None
+
+        return results
+
+    # ----------------------------------------------------------------------------------------------
+
+    def branch_taken(self, test, bindings):
+
+        """
+        Returns True or False if the test of an if statement is true, or false, for all the
+        possible values of the variables, or None if this cannot be found without rendering.
+        """
+
+        values = self.evaluate(test, bindings)
+        if not values:
+            return None
+
+        try:
+            truths = set(bool(value) for value in values)
+        except Exception:
+            return None
+
+        return truths.pop() if len(truths) == 1 else None
+
+    # ----------------------------------------------------------------------------------------------
+
+    def visit_branch(self, body, bindings, conditional):
+
+        """
+        Visit the body of a branch, whose keys are conditional if the branch may not be taken.
+        """
+
+        self.conditional_depth += conditional
+        try:
+            for child in body:
+                self.visit(child, bindings)
+        finally:
+            self.conditional_depth -= conditional
+
+    # ----------------------------------------------------------------------------------------------
+
+    def loop_items(self, node, bindings):
+
+        """
+        Returns the possible items of a loop, or None if they cannot be found without rendering.
+        """
+
+        iterables = self.evaluate(node, bindings)
+        if iterables is None or \
+           not all(isinstance(iterable, (list, tuple, str)) for iterable in iterables):
+            return None
+
+        return [item for iterable in iterables for item in iterable]
+
+    # ----------------------------------------------------------------------------------------------
+
+    def filter_bindings(self, test, bindings):
+
+        """
+        Returns the variables for the body of an if statement. When the test calls a function
+        provided to the templates with a variable with known values, only the values for which the
+        function returns True are kept.
+        """
+
+        if isinstance(test, nodes.Call) and isinstance(test.node, nodes.Name) and \
+           test.node.name in self.functions and len(test.args) == 1 and not test.kwargs and \
+           isinstance(test.args[0], nodes.Name) and bindings.get(test.args[0].name) is not None:
+
+            function = self.functions[test.node.name]
+            variable = test.args[0].name
+
+            try:
+                values = [value for value in bindings[variable] if function(value)]
+            except Exception:
+                return bindings
+
+            return {**bindings, variable: values}
+
+        return bindings
+
+    # ----------------------------------------------------------------------------------------------
+
+    def resolve(self, node, bindings):
+
+        """
+        Yields the possible names of an included template and the variables the template is
+        included with, evaluating the name separately for each value of the loop variables it
+        uses. The name is None if it cannot be evaluated.
+        """
+
+        names = {name.name for name in node.find_all(nodes.Name)}
+        if isinstance(node, nodes.Name):
+            names.add(node.name)
+
+        loop_variables = [name for name in sorted(names)
+                          if bindings.get(name) is not None and len(bindings[name]) > 1]
+
+        for combination in itertools.product(*(bindings[name] for name in loop_variables)):
+
+            include_bindings = {**bindings, **{name: [value] for name, value in
+                                               zip(loop_variables, combination)}}
+
+            values = self.evaluate(node, include_bindings)
+            for value in [None] if values is None else values:
+                yield value, include_bindings
+
+    # ----------------------------------------------------------------------------------------------
+
+    def visit(self, node, bindings):
+
+        """
+        Visit a node of an abstract syntax tree with the variables set by the templates.
+        """
+
+        if isinstance(node, nodes.For):
+            self.visit(node.iter, bindings)
+            loop_bindings = {**bindings, 'loop': None}
+            for target in [node.target] + list(node.target.find_all(nodes.Name)):
+                if isinstance(target, nodes.Name):
+                    loop_bindings[target.name] = None
+            if isinstance(node.target, nodes.Name):
+                loop_bindings[node.target.name] = self.loop_items(node.iter, bindings)
+            if node.test is not None:
+                self.visit(node.test, loop_bindings)
+            for child in node.body:
+                self.visit(child, loop_bindings)
+            for child in node.else_:
+                self.visit(child, bindings)
+
+        elif isinstance(node, nodes.If):
+
+            # Whether a branch before the current one may have been taken
+            conditional = False
+
+            for branch in [node] + node.elif_:
+                self.visit_branch([branch.test], bindings, conditional)
+                taken = self.branch_taken(branch.test, bindings)
+                if taken is False:
+                    continue
+
+                # A test that keeps some values of a loop variable is taken for those values
+                body_bindings = self.filter_bindings(branch.test, bindings)
+                filtered = body_bindings is not bindings
+
+                self.visit_branch(branch.body, body_bindings,
+                                  conditional or (taken is None and not filtered))
+                if taken:
+                    return
+                conditional = True
+
+            self.visit_branch(node.else_, bindings, conditional)
+
+        elif isinstance(node, nodes.Assign):
+            self.visit(node.node, bindings)
+            for target in [node.target] + list(node.target.find_all(nodes.Name)):
+                if isinstance(target, nodes.Name):
+                    bindings[target.name] = None
+            if isinstance(node.target, nodes.Name):
+                bindings[node.target.name] = self.evaluate(node.node, bindings)
+
+        elif isinstance(node, (nodes.Include, nodes.Extends, nodes.Import, nodes.FromImport)):
+            self.visit(node.template, bindings)
+            with_context = isinstance(node, (nodes.Include, nodes.Extends)) or node.with_context
+            for name, include_bindings in self.resolve(node.template, bindings):
+
+                # A list of names means the first template that exists
+                if isinstance(name, (list, tuple)) and name:
+                    name = next((item for item in name if self.template_exists(item)), name[-1])
+
+                if isinstance(name, str):
+                    self.add_template(name, include_bindings if with_context else {})
+                elif name is not None or not getattr(node, 'ignore_missing', False):
+                    self.unresolved.append((self.current_template, node.lineno))
+
+        else:
+            if isinstance(node, nodes.Name) and node.ctx == 'load':
+                self.add_variable(node.name, bindings)
+            if isinstance(node, nodes.Test) and node.name in optional_tests and \
+               isinstance(node.node, nodes.Name):
+                self.optional.add(node.node.name)
+            if isinstance(node, nodes.Filter) and node.name in optional_filters and \
+               isinstance(node.node, nodes.Name):
+                self.optional.add(node.node.name)
+            for child in node.iter_child_nodes():
+                self.visit(child, bindings)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def plan_template(env, name, values, functions, prune=None):
+
+    """
+    Find the templates that rendering a template loads and the keys of the dictionary of
+    templates that it reads, without rendering (see TemplatePlan).
+
+    Args:
+        env (jinja2.Environment): The environment the templates are loaded with.
+        name (str): The name of the template.
+        values (dict): The dictionary of templates.
+        functions (dict): The functions provided to the templates.
+        prune (function): Optional function that returns the source of a template that is
+                          rendered (see source_analysis).
+
+    Returns:
+        TemplatePlan: The templates and keys.
+    """
+
+    plan = TemplatePlan(env, values, functions, prune)
+    plan.add_template(name, {})
+
+    return plan
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,190 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import importlib.util
+import marshal
+import os
+import tempfile
+import zipfile
+
+import jcb
+from jcb.template_analysis import source_dependencies
+from jcb.utilities import yaml_backend
+from jcb.utilities.files import set_file_mode
+import jinja2 as j2
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Ahead of time compilation of the templates. All the templates that a dictionary of templates can
+reach (the algorithm files and the algorithm, model and observation directories of the app) are
+compiled to Python modules and stored in a single zip archive. Each module is stored as source and
+as bytecode so that the bytecode is used when the archive is read by the same version of Python and
+the source otherwise. The archive also holds the information that the Renderer would otherwise read
+from the directories (the list of observations and observer_components.yaml).
+"""
+
+# Name of the file inside the archive that holds the information about the archive.
+archive_metadata_file = 'jcb_archive.yaml'
+
+# Keys in the dictionary of templates that determine which templates are in the archive.
+archive_path_keys = ['algorithm_path', 'app_path_algorithm', 'app_path_model',
+                     'app_path_observations']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_compiled_module(zip_file, name, module_source):
+
+    """
+    Write a compiled template to the archive as Python source and as unchecked hash based
+    bytecode.
+
+    Args:
+        zip_file (ZipFile): The archive being written.
+        name (str): The name of the module without extension.
+        module_source (str): The Python source code that Jinja2 generated for the template.
+    """
+
+    source_bytes = module_source.encode('utf-8')
+    code = compile(source_bytes, f'{name}.py', 'exec', dont_inherit=True)
+
+    # Header for hash based bytecode that is not checked against the source
+    header = importlib.util.MAGIC_NUMBER + (0b01).to_bytes(4, 'little') + \
+        importlib.util.source_hash(source_bytes)
+
+    zip_file.writestr(f'{name}.py', source_bytes)
+    zip_file.writestr(f'{name}.pyc', header + marshal.dumps(code))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compile_template_archive(template_dict, archive_path):
+
+    """
+    Compile all the templates that can be reached from a dictionary of templates into an archive.
+
+    Args:
+        template_dict (dict): A dictionary containing templates and their corresponding paths.
+        archive_path (str): The path of the archive to write.
+
+    Returns:
+        list: The names of the templates that were compiled.
+    """
+
+    algorithm_path, search_paths, obs_path = jcb.renderer.get_search_paths(template_dict)
+
+    # Read the observer components and the list of observations
+    observer_components = jcb.renderer.read_observer_components(algorithm_path)
+
+    observations = jcb.renderer.list_observations(obs_path) if obs_path else []
+
+    # Environment used only for compiling the templates
+    env = j2.Environment(loader=j2.FileSystemLoader(search_paths),
+                         undefined=j2.StrictUndefined)
+    template_names = env.list_templates(extensions=['j2'])
+
+    # Read the templates and find their dependencies since the archive will not have the source
+    sources = {}
+    template_dependencies = {}
+    for name in template_names:
+        sources[name] = env.loader.get_source(env, name)
+        template_dependencies[name] = source_dependencies(env, sources[name][0])
+
+    metadata = {
+        'jcb_version': jcb.version(),
+        'template_paths': {key: template_dict[key] for key in archive_path_keys
+                           if template_dict.get(key)},
+        'observations': observations,
+        'observer_components': observer_components,
+        'templates': template_names,
+        'template_dependencies': template_dependencies,
+    }
+
+    # Write to a temporary file and then move into place so the archive is never seen incomplete
+    archive_dir = os.path.dirname(os.path.abspath(archive_path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=archive_dir, suffix='.tmp')
+
+    try:
+        with os.fdopen(file_descriptor, 'wb') as f:
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                for name in template_names:
+                    source, filename, _ = sources[name]
+                    module_source = env.compile(source, name, filename, raw=True,
+                                                defer_init=True)
+                    module_name = j2.ModuleLoader.get_template_key(name)
+                    write_compiled_module(zip_file, module_name, module_source)
+
+                zip_file.writestr(archive_metadata_file,
+                                  yaml_backend.dump(metadata, sort_keys=False))
+
+            set_file_mode(f, temporary_path)
+
+        os.replace(temporary_path, archive_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    return template_names
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class TemplateArchive():
+
+    """
+    An archive of compiled templates written by compile_template_archive.
+
+    Attributes:
+        path (str): The path of the archive.
+        observations (list): The observations that were available when the archive was compiled.
+        observer_components (dict): The observer components for each algorithm.
+    """
+
+    def __init__(self, path):
+
+        self.path = os.path.realpath(path)
+
+        jcb.abort_if(not zipfile.is_zipfile(self.path),
+                     f'The template archive {path} does not exist or is not a zip archive.')
+
+        with zipfile.ZipFile(self.path, 'r') as zip_file:
+            jcb.abort_if(archive_metadata_file not in zip_file.namelist(),
+                         f'The template archive {path} was not created by jcb compile.')
+            self.metadata = yaml_backend.safe_load(zip_file.read(archive_metadata_file))
+
+        self.observations = self.metadata['observations']
+        self.observer_components = self.metadata['observer_components']
+
+    # ----------------------------------------------------------------------------------------------
+
+    def template_paths(self, template_dict):
+
+        """
+        Returns the template paths that the archive was compiled with, checking that they do not
+        conflict with the paths in the dictionary of templates.
+
+        Args:
+            template_dict (dict): A dictionary containing templates and their corresponding paths.
+
+        Returns:
+            dict: The paths of the templates in the archive.
+        """
+
+        archive_paths = self.metadata['template_paths']
+
+        for key in archive_path_keys:
+            if key in template_dict:
+                jcb.abort_if(template_dict[key] != archive_paths.get(key),
+                             f'The dictionary of templates has {key}: {template_dict[key]} but '
+                             f'the template archive {self.path} was compiled with '
+                             f'{key}: {archive_paths.get(key)}.')
+
+        return archive_paths
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,310 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import io
+import os
+import re
+import threading
+import zipfile
+
+import jcb
+from jcb.utilities.files import write_atomic
+import jinja2 as j2
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Bundles of template sources. A client and jcb-algorithms can be shipped as a single zip archive
+(see jcb bundle), which is read with one read and served from memory, instead of as thousands of
+small files that each cost metadata operations on a parallel file system. A bundle also makes the
+deployed templates immutable.
+
+algorithm_path and the app_path_ keys of the dictionary of templates can be paths inside a bundle,
+written like the paths that zipimport understands, e.g. /opt/jcb/gdas.zip/apps/gdas/observations.
+They can also be any Jinja2 loader, e.g. TemplateBundle(files={...}).loader('observations') for
+templates held in memory, in which case the observations are the templates that the loader lists
+at its top level. A loader used for app_path_model must have a name attribute, the name of the
+model (the last directory of a path).
+
+Unlike archives of compiled templates (see jcb compile) a bundle holds the sources, so it does not
+depend on the version of Python or Jinja2 and the templates can be checked before rendering.
+"""
+
+# Paths inside a bundle: the archive and the path inside it
+bundle_path_pattern = re.compile(r'^(.*?\.zip)(?:/+(.*?))?/*$')
+
+# Bundles read by this process by path
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_bundle(archive_path, directories):
+
+    """
+    Write the templates of directories to a bundle.
+
+    Args:
+        archive_path (str): The path of the bundle, which must end in .zip.
+        directories (dict): The directory to store under each name in the bundle.
+
+    Returns:
+        int: The number of files in the bundle.
+    """
+
+    jcb.abort_if(not archive_path.endswith('.zip'),
+                 f'The bundle {archive_path} must have the .zip extension.')
+
+    data = io.BytesIO()
+    files = 0
+
+    with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, directory in directories.items():
+            jcb.abort_if(not os.path.isdir(directory), f'{directory} is not a directory.')
+            for path, subdirectories, file_names in os.walk(directory, followlinks=True):
+                subdirectories[:] = sorted(subdirectory for subdirectory in subdirectories
+                                           if not subdirectory.startswith('.') and
+                                           subdirectory != '__pycache__')
+                for file_name in sorted(file_names):
+                    if file_name.startswith('.') or file_name == jcb.tree_index.index_file_name:
+                        continue
+                    relative_path = os.path.relpath(os.path.join(path, file_name), directory)
+                    member = '/'.join([name] + relative_path.split(os.sep) if name else
+                                      relative_path.split(os.sep))
+                    zip_file.write(os.path.join(path, file_name), member)
+                    files += 1
+
+    jcb.abort_if(not write_atomic(archive_path, data.getvalue()),
+                 f'The bundle {archive_path} could not be written.')
+
+    return files
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class TemplateBundle():
+
+    """
+    Template sources held in memory, read from a zip archive or given as a dictionary.
+
+    Attributes:
+        path (str): The path of the archive, or None for a bundle given as a dictionary.
+        key (tuple): Identifies the content of the bundle, used for the environment registry.
+        directories (dict): The subdirectories and files of each directory, '' being the top.
+    """
+
+    def __init__(self, path=None, files=None):
+
+        jcb.abort_if((path is None) == (files is None),
+                     'A bundle is read from a path or given as a dictionary of files.')
+
+        self.path = None if path is None else os.path.abspath(path)
+        self.sources = {}
+
+        if path is not None:
+            # The whole archive is read at once and decompressed when each file is used
+            try:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                stat = os.stat(self.path)
+                self.zip_file = zipfile.ZipFile(io.BytesIO(data), 'r')
+            except (OSError, zipfile.BadZipFile):
+                jcb.abort(f'The bundle {path} does not exist or is not a zip archive.')
+            self.key = (self.path, stat.st_mtime_ns, stat.st_size)
+            names = [name for name in self.zip_file.namelist() if not name.endswith('/')]
+        else:
+            self.zip_file = None
+            self.key = ('bundle', id(self))
+            self.sources = {name.strip('/'): source for name, source in files.items()}
+            names = list(self.sources)
+
+        self.lock = threading.Lock()
+
+        # Directory listing in the order of the archive
+        self.directories = {'': ([], [])}
+        for name in names:
+            parts = name.split('/')
+            for depth in range(len(parts)):
+                directory = '/'.join(parts[:depth])
+                subdirectories, directory_files = self.directories.setdefault(directory, ([], []))
+                if depth == len(parts) - 1:
+                    directory_files.append(parts[-1])
+                elif parts[depth] not in subdirectories:
+                    subdirectories.append(parts[depth])
+                    self.directories.setdefault('/'.join(parts[:depth + 1]), ([], []))
+
+    # ----------------------------------------------------------------------------------------------
+
+    def __reduce__(self):
+
+        # Bundles are sent to the processes that render the observations without the archive
+        if self.path is not None:
+            return (get_bundle, (self.path,))
+        return (TemplateBundle, (None, self.sources))
+
+    # ----------------------------------------------------------------------------------------------
+
+    def read(self, name):
+
+        """
+        Returns the text of a file in the bundle, or None if there is no such file.
+        """
+
+        with self.lock:
+            if name not in self.sources:
+                if self.zip_file is None:
+                    return None
+                try:
+                    self.sources[name] = self.zip_file.read(name).decode('utf-8')
+                except KeyError:
+                    return None
+            return self.sources[name]
+
+    # ----------------------------------------------------------------------------------------------
+
+    def files(self, directory=''):
+
+        """
+        Returns the names of the files in a directory of the bundle.
+        """
+
+        jcb.abort_if(directory not in self.directories,
+                     lambda: f'The bundle {self.path or "in memory"} has no directory {directory}.')
+
+        return list(self.directories[directory][1])
+
+    # ----------------------------------------------------------------------------------------------
+
+    def loader(self, directory=''):
+
+        """
+        Returns a Jinja2 loader for the templates in a directory of the bundle.
+        """
+
+        directory = directory.strip('/')
+        jcb.abort_if(directory not in self.directories,
+                     lambda: f'The bundle {self.path or "in memory"} has no directory {directory}.')
+
+        return BundleLoader(self, directory)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class BundleLoader(j2.BaseLoader):
+
+    """
+    A Jinja2 loader for the templates in a directory of a bundle. The bundle does not change so
+    the loaded templates are always up to date.
+
+    Attributes:
+        bundle (TemplateBundle): The bundle.
+        directory (str): The directory in the bundle.
+        name (str): The last part of the directory, which is the model for app_path_model.
+        key (tuple): Identifies the bundle and directory, used for the environment registry.
+    """
+
+    def __init__(self, bundle, directory):
+        self.bundle = bundle
+        self.directory = directory
+        self.name = directory.split('/')[-1] if directory else None
+        self.key = (bundle.key, directory)
+
+    def member(self, template):
+        name = '/'.join(j2.loaders.split_template_path(template))
+        return f'{self.directory}/{name}' if self.directory else name
+
+    def get_source(self, environment, template):
+
+        member = self.member(template)
+        source = self.bundle.read(member)
+        if source is None:
+            raise j2.TemplateNotFound(template)
+
+        return source, f'{self.bundle.path or "bundle"}/{member}', lambda: True
+
+    def list_templates(self):
+
+        templates = []
+        prefix_length = len(self.directory) + 1 if self.directory else 0
+        for directory, (_, files) in self.bundle.directories.items():
+            if directory == self.directory or \
+               directory.startswith(self.directory + '/') or not self.directory:
+                prefix = directory[prefix_length:] + '/' if directory != self.directory else ''
+                templates += [prefix + name for name in files]
+
+        return sorted(templates)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_bundle(path):
+
+    """
+    Returns the bundle at a path, which is only read again when the file changes.
+    """
+
+    path = os.path.abspath(path)
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        jcb.abort(f'The bundle {path} does not exist.')
+
+    with _bundles_lock:
+        bundle = _bundles.get(path)
+    if bundle is not None and bundle.key == (path, stat.st_mtime_ns, stat.st_size):
+        return bundle
+
+    bundle = TemplateBundle(path)
+    with _bundles_lock:
+        _bundles[path] = bundle
+
+    return bundle
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def bundle_file(path):
+
+    """
+    Returns the archive that a path is inside, or None if the path is not inside a bundle.
+    """
+
+    if not isinstance(path, str):
+        return None
+
+    match = bundle_path_pattern.match(path)
+    if match is None or not os.path.isfile(match.group(1)):
+        return None
+
+    return match.group(1)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def template_loader(path):
+
+    """
+    Returns the Jinja2 loader for algorithm_path or an app_path_ key of the dictionary of templates
+    when it is a loader or a path inside a bundle, or None when it is a directory.
+    """
+
+    if isinstance(path, j2.BaseLoader):
+        return path
+
+    archive_path = bundle_file(path)
+    if archive_path is None:
+        return None
+
+    return get_bundle(archive_path).loader(bundle_path_pattern.match(path).group(2) or '')
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,432 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import json
+import os
+import threading
+
+import jcb
+from jcb.utilities import yaml_backend
+from jcb.utilities.files import write_atomic
+import jinja2 as j2
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Manifests of template trees, written by jcb index, so that setting up a Renderer does not list
+directories and look for each template in every search path. On parallel file systems such as
+Lustre and GPFS these metadata operations, not reading the files, are the slow part.
+
+The manifest is written at the root of a tree (e.g. the configuration directory of jcb or a client)
+and holds the files of each directory under the root in the order they are listed, the modification
+time of each directory and the parsed observer_components.yaml files. The observations of a
+directory and the map from template names to paths for a list of search paths are resolved from
+the file listing. A manifest is used for a directory under its root while the modification time of
+the directory and of the directories below it are the ones recorded, which changes whenever a file
+is added, removed or renamed, so that checking a manifest costs a handful of stats. Editing a file
+in place does not change the directory, but the templates loaded through a manifest are still
+checked for changes with their modification time, as Jinja2 does for any template, and the parsed
+observer_components.yaml files are only used while the file has not changed.
+"""
+
+# Name of the manifest at the root of a tree
+index_file_name = 'jcb_index.json'
+
+# Changing this means manifests written before are not used
+index_format = 1
+
+# Manifests read by this process by path, with the modification time and size of the file, the
+# manifest found for each directory, and the modification time of each directory that is not in an
+# indexed tree, so that trees without a manifest are not searched again on each lookup.
+_indexes = {}
+_index_locations = {}
+_missing_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_index(tree_path):
+
+    """
+    Write the manifest of a tree of templates.
+
+    Args:
+        tree_path (str): The root of the tree.
+
+    Returns:
+        dict: The manifest.
+    """
+
+    root = os.path.abspath(tree_path)
+    jcb.abort_if(not os.path.isdir(root), f'The tree {tree_path} is not a directory.')
+
+    directories = {}
+    observer_components = {}
+
+    def visit(path, relative_path):
+
+        # The modification time is read before listing so that a change during the listing is seen
+        mtime_ns = os.stat(path).st_mtime_ns
+
+        files = []
+        subdirectories = []
+        for name in os.listdir(path):
+            if name.startswith('.') or name == '__pycache__' or \
+               (relative_path == '.' and name == index_file_name):
+                continue
+            if os.path.isdir(os.path.join(path, name)):
+                subdirectories.append(name)
+            elif os.path.isfile(os.path.join(path, name)):
+                files.append(name)
+
+        directories[relative_path] = {'mtime_ns': mtime_ns, 'files': files,
+                                      'subdirectories': subdirectories}
+
+        # Observer components that can be stored as JSON
+        if 'observer_components.yaml' in files:
+            stat = os.stat(os.path.join(path, 'observer_components.yaml'))
+            with open(os.path.join(path, 'observer_components.yaml'), 'r') as f:
+                components = yaml_backend.safe_load(f)
+            if json.loads(json.dumps(components, default=repr)) == components:
+                observer_components[relative_path] = {'mtime_ns': stat.st_mtime_ns,
+                                                      'size': stat.st_size,
+                                                      'components': components}
+
+        for name in subdirectories:
+            visit(os.path.join(path, name), name if relative_path == '.' else
+                  f'{relative_path}/{name}')
+
+    visit(root, '.')
+
+    manifest = {
+        'format': index_format,
+        'jcb_version': jcb.version(),
+        'directories': directories,
+        'observer_components': observer_components,
+    }
+
+    index_path = os.path.join(root, index_file_name)
+    jcb.abort_if(not write_atomic(index_path, json.dumps(manifest).encode('utf-8')),
+                 f'The manifest {index_path} could not be written.')
+
+    # Directories that had no manifest may be in this tree now
+    _missing_indexes.clear()
+
+    return manifest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class TreeIndex():
+
+    """
+    The manifest of a tree of templates, see write_index.
+
+    Attributes:
+        root (str): The root of the tree.
+        signature (tuple): The path, modification time and size of the manifest file.
+        directories (dict): The modification time, files and subdirectories of each directory, by
+                            path relative to the root.
+        components (dict): The observer components of each directory that has them.
+    """
+
+    def __init__(self, root, signature, manifest):
+        self.root = root
+        self.signature = signature
+        self.directories = manifest['directories']
+        self.components = manifest['observer_components']
+
+    # ----------------------------------------------------------------------------------------------
+
+    def relative_path(self, path):
+
+        """
+        Returns the path of a directory relative to the root, or None if it is not in the tree.
+        """
+
+        relative_path = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+        return relative_path if relative_path in self.directories else None
+
+    # ----------------------------------------------------------------------------------------------
+
+    def directories_below(self, relative_path):
+
+        """
+        Returns a directory and the directories below it, as paths relative to the root.
+        """
+
+        paths = [relative_path]
+        for path in paths:
+            prefix = '' if path == '.' else path + '/'
+            paths += [prefix + name for name in self.directories[path]['subdirectories']]
+
+        return paths
+
+    # ----------------------------------------------------------------------------------------------
+
+    def fresh(self, path):
+
+        """
+        Returns True if the manifest is up to date for a directory and the directories below it.
+        """
+
+        relative_path = self.relative_path(path)
+        if relative_path is None:
+            return False
+
+        for directory in self.directories_below(relative_path):
+            try:
+                if os.stat(os.path.join(self.root, directory)).st_mtime_ns != \
+                   self.directories[directory]['mtime_ns']:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    # ----------------------------------------------------------------------------------------------
+
+    def files(self, path):
+
+        """
+        Returns the names of the files in a directory, in the order they were listed.
+        """
+
+        return list(self.directories[self.relative_path(path)]['files'])
+
+    # ----------------------------------------------------------------------------------------------
+
+    def templates(self, path):
+
+        """
+        Returns the path of each template in a directory, including those in the directories below
+        it, by the name that Jinja2 loads it with from the directory.
+        """
+
+        relative_path = self.relative_path(path)
+        templates = {}
+
+        for directory in self.directories_below(relative_path):
+            if directory == relative_path:
+                prefix = ''
+            elif relative_path == '.':
+                prefix = directory + '/'
+            else:
+                prefix = directory[len(relative_path) + 1:] + '/'
+            for name in self.directories[directory]['files']:
+                templates[prefix + name] = os.path.join(self.root, directory, name)
+
+        return templates
+
+    # ----------------------------------------------------------------------------------------------
+
+    def walk(self, path):
+
+        """
+        Walks a directory from the top down like os.walk.
+        """
+
+        relative_path = self.relative_path(path)
+        for directory in self.directories_below(relative_path):
+            entry = self.directories[directory]
+            yield os.path.normpath(os.path.join(self.root, directory)), \
+                list(entry['subdirectories']), list(entry['files'])
+
+    # ----------------------------------------------------------------------------------------------
+
+    def observer_components(self, path):
+
+        """
+        Returns the parsed observer_components.yaml of a directory, or None if it is not in the
+        manifest or has changed since.
+        """
+
+        entry = self.components.get(self.relative_path(path))
+        if entry is None:
+            return None
+
+        try:
+            stat = os.stat(os.path.join(path, 'observer_components.yaml'))
+        except OSError:
+            return None
+
+        if (stat.st_mtime_ns, stat.st_size) != (entry['mtime_ns'], entry['size']):
+            return None
+
+        return entry['components']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_index(index_path):
+
+    """
+    Returns the manifest at a path, which is only read again when it changes, or None if there is
+    no manifest that this version of jcb can use.
+    """
+
+    try:
+        stat = os.stat(index_path)
+    except OSError:
+        return None
+
+    signature = (index_path, stat.st_mtime_ns, stat.st_size)
+
+    with _indexes_lock:
+        index = _indexes.get(index_path)
+    if index is not None and index.signature == signature:
+        return index
+
+    try:
+        with open(index_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(manifest, dict) or manifest.get('format') != index_format:
+        return None
+
+    index = TreeIndex(os.path.dirname(index_path), signature, manifest)
+    with _indexes_lock:
+        _indexes[index_path] = index
+
+    return index
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def find_index(path):
+
+    """
+    Returns the manifest of the tree that a directory is in, looking in the directory and the
+    directories above it, or None if the directory is not in an indexed tree. A directory that is
+    not in an indexed tree is only searched again when its modification time changes (e.g. when
+    jcb index writes a manifest in it) or when this process writes a manifest, so a manifest
+    written above it by another process is used by this process once the directory changes.
+    """
+
+    path = os.path.abspath(path)
+
+    index_path = _index_locations.get(path)
+    if index_path is not None:
+        index = read_index(index_path)
+        if index is not None and index.relative_path(path) is not None:
+            return index
+
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    if _missing_indexes.get(path) == mtime_ns:
+        return None
+
+    directory = path
+    while True:
+        index = read_index(os.path.join(directory, index_file_name))
+        if index is not None and index.relative_path(path) is not None:
+            _index_locations[path] = os.path.join(directory, index_file_name)
+            _missing_indexes.pop(path, None)
+            return index
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            _missing_indexes[path] = mtime_ns
+            return None
+        directory = parent
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def fresh_index(path):
+
+    """
+    Returns the manifest of the tree that a directory is in if it is up to date for the directory,
+    otherwise None.
+    """
+
+    index = find_index(path)
+
+    return index if index is not None and index.fresh(path) else None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class IndexedLoader(j2.BaseLoader):
+
+    """
+    A Jinja2 loader that opens each template at the path found from manifests, without looking for
+    it in each search path. Whether the list of templates is up to date is decided by the manifests
+    (see jcb.environment.get_environment). Like FileSystemLoader each loaded template is reloaded
+    when its modification time changes, so templates edited in place are picked up.
+
+    Attributes:
+        templates (dict): The path of each template by name.
+    """
+
+    def __init__(self, templates):
+        self.templates = templates
+
+    def get_source(self, environment, template):
+
+        name = '/'.join(j2.loaders.split_template_path(template))
+        path = self.templates.get(name)
+        if path is None:
+            raise j2.TemplateNotFound(template)
+
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                source = f.read()
+        except FileNotFoundError:
+            raise j2.TemplateNotFound(template) from None
+
+        def uptodate():
+            try:
+                return os.path.getmtime(path) == mtime
+            except OSError:
+                return False
+
+        return source, path, uptodate
+
+    def list_templates(self):
+        return sorted(self.templates)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def indexed_loader(search_paths):
+
+    """
+    Returns a loader for search paths that are all in up to date manifests, and the signatures of
+    the manifests, or None if a search path is not.
+
+    Args:
+        search_paths (list): The paths that Jinja2 will search for templates.
+
+    Returns:
+        IndexedLoader: The loader, or None.
+        tuple: The signatures of the manifests.
+    """
+
+    indexes = [fresh_index(path) for path in search_paths]
+    if not search_paths or None in indexes:
+        return None, None
+
+    # The first search path with a template is used, as FileSystemLoader does
+    templates = {}
+    for path, index in zip(reversed(search_paths), reversed(indexes)):
+        templates.update(index.templates(path))
+
+    return IndexedLoader(templates), tuple(sorted(set(index.signature for index in indexes)))
+
+
+# --------------------------------------------------------------------------------------------------
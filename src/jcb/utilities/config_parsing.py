@@ -130,3 +130,36 @@ def duration_from_conf(iso_duration_input):
 
 
 # --------------------------------------------------------------------------------------------------
+
+
+def cycles_from_conf(cycles):
+
+    """
+    Convert a range of cycles given as START:END:STEP to a list of datetime objects. START and END
+    are datetimes, in any form accepted by datetime_from_conf, and STEP is an ISO duration, e.g.
+    2020-01-01T00:00:00Z:2020-12-31T18:00:00Z:PT6H. END is included if it falls on a step.
+
+    Args:
+        cycles (str): The range of cycles.
+
+    Returns:
+        list: The datetime of each cycle.
+    """
+
+    # The datetimes can contain colons themselves, END starts at the colon followed by its year
+    match = re.fullmatch(r'(\d{4}.*?):(\d{4}.*):(P[^:]+)', cycles)
+    jcb.abort_if(match is None,
+                 f"The cycles \'{cycles}\' are not of the form START:END:STEP.")
+
+    start, end, step = match.groups()
+    start = datetime_from_conf(start)
+    end = datetime_from_conf(end)
+    step = duration_from_conf(step)
+
+    jcb.abort_if(step <= timedelta(0), f"The step of the cycles \'{cycles}\' must be positive.")
+    jcb.abort_if(end < start, f"The cycles \'{cycles}\' end before they start.")
+
+    return [start + index * step for index in range((end - start) // step + 1)]
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,105 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import tempfile
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_umask():
+
+    """
+    Returns the umask of the process. Linux reports it in /proc, elsewhere it can only be read by
+    setting it, which is done once when this module is imported.
+    """
+
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    umask = os.umask(0o022)
+    os.umask(umask)
+
+    return umask
+
+
+# The umask of the process, read once so that files are not written with a temporarily changed
+# umask while other threads create files
+process_umask = read_umask()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def set_file_mode(file, path):
+
+    """
+    Gives a temporary file, which is only readable by its owner, the mode of a file created with
+    open, i.e. 0o666 without the bits of the umask of the process.
+
+    Args:
+        file: The open file.
+        path (str): The path of the file, used where the mode of an open file cannot be set.
+    """
+
+    mode = 0o666 & ~process_umask
+
+    if hasattr(os, 'fchmod'):
+        os.fchmod(file.fileno(), mode)
+    else:
+        os.chmod(path, mode)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_atomic(path, data):
+
+    """
+    Write a file by writing a temporary file next to it and renaming it into place, so that
+    readers only ever see complete files.
+
+    Args:
+        path (str): The path of the file.
+        data (bytes): The content of the file.
+
+    Returns:
+        bool: Whether the file was written, failing to write is not an error.
+    """
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=os.path.basename(path), suffix='.tmp')
+    except OSError:
+        return False
+
+    try:
+        with os.fdopen(file_descriptor, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+            # Temporary files are only readable by the owner, use the umask like a normal file
+            set_file_mode(f, temporary_path)
+
+        os.replace(temporary_path, path)
+    except BaseException as e:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        if not isinstance(e, OSError):
+            raise
+        return False
+
+    return True
+
+
+# --------------------------------------------------------------------------------------------------
@@ -17,6 +17,11 @@ def get_apps():
     # Path to the apps
     apps_path = os.path.join(jcb_path, 'configuration', 'apps')
 
+    # Use the manifest of the tree if it has an up to date one (see jcb.tree_index)
+    index = jcb.tree_index.fresh_index(apps_path)
+    if index is not None:
+        return next(index.walk(apps_path))[1]
+
     # Return list of apps
     return [app for app in os.listdir(apps_path) if os.path.isdir(os.path.join(apps_path, app))]
 
@@ -41,7 +46,11 @@ def apps_directory_to_dictionary():
 
     directory_dict = {}
 
-    for dirpath, _, filenames in os.walk(apps_path):
+    # Use the manifest of the tree if it has an up to date one (see jcb.tree_index)
+    index = jcb.tree_index.fresh_index(apps_path)
+    walk = index.walk if index is not None else os.walk
+
+    for dirpath, _, filenames in walk(apps_path):
         yaml_j2_files = [f for f in filenames if f.endswith('.yaml.j2')]
         if yaml_j2_files:
             relative_path = os.path.relpath(dirpath, apps_path)
@@ -68,9 +77,9 @@ def render_app_with_test_config(app_test_config):
     # --------------------------------------------------
     # Algorithm does not need to be in the dictionary of templates
     algorithm = app_test_config['algorithm']
-    del app_test_config['algorithm']
 
-    jcb_obj = jcb.Renderer(app_test_config)
+    jcb_obj = jcb.Renderer({key: value for key, value in app_test_config.items()
+                            if key != 'algorithm'})
     jedi_dict_2 = jcb_obj.render(algorithm)
 
     # Assert that the output is a dictionary
@@ -1,28 +1,64 @@
 # --------------------------------------------------------------------------------------------------
 
 
-def abort_if(condition: bool, message: str):
+from typing import Callable, Union
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+Error trapping for jcb. The message of an error can be given as a function that returns the
+message, so that messages that are expensive to build are only built when the error happens.
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class JcbError(ValueError):
+
+    """
+    The error raised when jcb aborts. It is a ValueError so existing handlers keep working.
+
+    Attributes:
+        message (str): The message of the error.
+        context (dict): Structured information about the error, e.g. the template that failed.
+    """
+
+    def __init__(self, message: str, **context):
+        super().__init__(message)
+        self.message = message
+        self.context = context
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def abort_if(condition: bool, message: Union[str, Callable[[], str]], **context):
 
     """
-    Raises a ValueError if the condition is True.
+    Raises a JcbError if the condition is True. The message is only evaluated, when it is a
+    function, if the condition is True.
     """
 
     if condition:
-        print("\033[31m" + message + "\033[0m")
-        raise ValueError(message)
+        abort(message, **context)
 
 
 # --------------------------------------------------------------------------------------------------
 
 
-def abort(message: str):
+def abort(message: Union[str, Callable[[], str]], **context):
 
     """
-    Raises a ValueError with the message.
+    Raises a JcbError with the message and any keyword arguments as the context of the error.
     """
 
+    if callable(message):
+        message = message()
+
     print("\033[31m" + message + "\033[0m")
-    raise ValueError(message)
+    raise JcbError(message, **context)
 
 
 # --------------------------------------------------------------------------------------------------
@@ -0,0 +1,80 @@
+# --------------------------------------------------------------------------------------------------
+
+"""
+Utilities for the trees of dictionaries, lists and scalars that are produced by parsing YAML.
+"""
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def copy_tree(value):
+
+    """
+    Copy a tree of dictionaries and lists. The scalars are immutable so they are not copied. This
+    is much faster than copy.deepcopy.
+
+    Args:
+        value: The tree to copy.
+
+    Returns:
+        A copy of the tree.
+    """
+
+    if isinstance(value, dict):
+        return {key: copy_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_tree(item) for item in value]
+    return value
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def share_subtrees(value):
+
+    """
+    Make identical sub-trees of a tree the same object, so that they are only held in memory once.
+    The tree is processed from the leaves up; once the children of a dictionary or list have been
+    shared, two containers are identical when they hold the same child objects in the same order.
+
+    Note that after sharing, modifying one part of the tree can modify other parts of it. The tree
+    should be copied (see copy_tree) before it is modified.
+
+    Args:
+        value: The tree.
+
+    Returns:
+        The tree with identical sub-trees shared.
+    """
+
+    shared = {}
+
+    def share(value):
+
+        if isinstance(value, dict):
+            items = [(key, share(item)) for key, item in value.items()]
+            key = (dict, tuple((type(item_key), item_key, id(item)) for item_key, item in items))
+            if key not in shared:
+                shared[key] = dict(items)
+            return shared[key]
+
+        if isinstance(value, list):
+            items = [share(item) for item in value]
+            key = (list, tuple(id(item) for item in items))
+            if key not in shared:
+                shared[key] = items
+            return shared[key]
+
+        # Floats are compared by representation so that 0.0 and -0.0 are kept apart. Scalars that
+        # cannot be used as keys are left as they are.
+        try:
+            key = (type(value), repr(value) if isinstance(value, float) else value)
+            return shared.setdefault(key, value)
+        except TypeError:
+            return value
+
+    return share(value)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,130 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+"""
+YAML parsing and emission for jcb. When PyYAML has been built with libyaml the C loader and dumper
+are used since they are many times faster than the pure Python implementations, otherwise the pure
+Python implementations are used. The pure Python implementation can be forced by setting the
+JCB_YAML_BACKEND environment variable to 'python'.
+"""
+
+# Environment variable for choosing the backend
+backend_environment_variable = 'JCB_YAML_BACKEND'
+
+# Whether the libyaml classes are available in this installation of PyYAML
+libyaml_available = hasattr(yaml, 'CSafeLoader') and hasattr(yaml, 'CSafeDumper')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def use_libyaml():
+
+    """
+    Returns True if the libyaml backend should be used.
+    """
+
+    return libyaml_available and os.environ.get(backend_environment_variable, '') != 'python'
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_safe_loader():
+
+    """
+    Returns the fastest available safe loader class.
+    """
+
+    return yaml.CSafeLoader if use_libyaml() else yaml.SafeLoader
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_safe_dumper():
+
+    """
+    Returns the fastest available safe dumper class.
+    """
+
+    return yaml.CSafeDumper if use_libyaml() else yaml.SafeDumper
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def backend_name():
+
+    """
+    Returns the name of the backend that is in use, 'libyaml' or 'python'.
+    """
+
+    return 'libyaml' if use_libyaml() else 'python'
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def safe_load(stream):
+
+    """
+    Parse a YAML document into Python objects, equivalent to yaml.safe_load.
+
+    Args:
+        stream (str or file): The YAML document.
+
+    Returns:
+        The Python objects represented by the document.
+    """
+
+    return yaml.load(stream, Loader=get_safe_loader())
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def safe_load_all(stream):
+
+    """
+    Parse all the YAML documents in a stream, equivalent to yaml.safe_load_all.
+
+    Args:
+        stream (str or file): The YAML documents.
+
+    Returns:
+        generator: The Python objects represented by each document.
+    """
+
+    return yaml.load_all(stream, Loader=get_safe_loader())
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def dump(data, stream=None, **kwargs):
+
+    """
+    Write Python objects as YAML, equivalent to yaml.safe_dump. The output is the same for the two
+    backends.
+
+    Args:
+        data: The Python objects to write.
+        stream (file): Optional stream to write to. If not provided the YAML is returned.
+        **kwargs: Any of the options accepted by yaml.dump, e.g. sort_keys.
+
+    Returns:
+        str: The YAML if no stream was provided, otherwise None.
+    """
+
+    return yaml.dump(data, stream, Dumper=get_safe_dumper(), **kwargs)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,65 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import subprocess
+import sys
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def imported_modules(code):
+
+    """
+    Run code in a new interpreter and return the top level packages that were imported.
+    """
+
+    result = subprocess.run([sys.executable, '-c', code + '\nimport sys\n'
+                             'print(" ".join(sorted({m.split(".")[0] for m in sys.modules})))'],
+                            capture_output=True, text=True, check=True)
+
+    return set(result.stdout.split())
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_import_does_not_load_dependencies():
+
+    heavy_packages = {'jinja2', 'yaml', 'click', 'markupsafe'}
+
+    assert not imported_modules('import jcb') & heavy_packages
+    assert not imported_modules('import jcb\njcb.parse_channels("1-3")\n'
+                                'jcb.duration_from_conf("PT6H")') & heavy_packages
+    assert {'jinja2', 'yaml'} <= imported_modules('import jcb\njcb.Renderer')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_driver_import_does_not_load_dependencies():
+
+    # The command line tool only loads the packages that the command it runs needs
+    assert not imported_modules('import jcb.driver') & {'jinja2', 'yaml', 'markupsafe'}
+
+    import jcb.driver
+    import jcb.serializers
+    assert jcb.driver.output_formats == tuple(jcb.serializers.output_formats)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_public_names():
+
+    for name in jcb.__all__:
+        assert getattr(jcb, name) is not None
+        assert name in dir(jcb)
+
+    # Submodules are also imported when first used
+    assert jcb.renderer.Renderer is jcb.Renderer
+
+
+# --------------------------------------------------------------------------------------------------
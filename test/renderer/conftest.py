@@ -0,0 +1,202 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import textwrap
+
+import pytest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+'''
+A small template tree laid out in the same way as jcb-algorithms and a jcb client. This allows the
+renderer to be tested without the clients having been cloned.
+'''
+
+algorithm_files = {
+    'observer_components.yaml': '''
+        hofx4d:
+          observer_nesting: [observations, observers]
+          components: [obs space, obs operator]
+        variational:
+          observer_nesting: [cost function, observations, observers]
+          components: [obs space, obs operator, obs filters, obs bias]
+    ''',
+    'hofx4d.yaml.j2': '''
+        geometry:
+        {% filter indent(width=2) %}
+        {% include model_component + 'geometry.yaml.j2' %}
+        {% endfilter %}
+        time window:
+          begin: '{{window_begin}}'
+          length: '{{window_length}}'
+        observations:
+          observers:
+          {% for observation_from_jcb in observations %}
+          {% if use_observer(observation_from_jcb) %}
+          - {% filter indent(width=4) %}
+        {% include observation_from_jcb + '.yaml.j2' %}
+            {% endfilter %}
+          {% endif %}
+          {% endfor %}
+    ''',
+    'variational.yaml.j2': '''
+        cost function:
+          cost type: 3D-Var
+          geometry:
+        {% filter indent(width=4) %}
+        {% include model_component + 'geometry.yaml.j2' %}
+        {% endfilter %}
+          time window:
+            begin: '{{window_begin}}'
+            length: '{{window_length}}'
+          observations:
+            observers:
+            {% for observation_from_jcb in observations %}
+            {% if use_observer(observation_from_jcb) %}
+            - {% filter indent(width=6) %}
+        {% include observation_from_jcb + '.yaml.j2' %}
+              {% endfilter %}
+            {% endif %}
+            {% endfor %}
+        variational:
+          minimizer:
+            algorithm: DRPCG
+    ''',
+    'converttostructuredgrid.yaml.j2': '''
+        geometry:
+        {% filter indent(width=2) %}
+        {% include model_component + 'geometry.yaml.j2' %}
+        {% endfilter %}
+        output: '{{atmosphere_output_path}}'
+    ''',
+}
+
+model_files = {
+    'atmosphere_geometry.yaml.j2': '''
+        fms initialization:
+          namelist filename: '{{atmosphere_namelist}}'
+        layout: [{{atmosphere_layout_x}}, {{atmosphere_layout_y}}]
+    ''',
+}
+
+observation_files = {
+    'aircraft.yaml.j2': '''
+        obs space:
+          name: aircraft
+          obsdatain:
+            engine:
+              type: H5File
+              obsfile: '{{obs_path}}/{{observation_from_jcb}}.nc'
+          simulated variables: [airTemperature, windEastward]
+        obs operator:
+          name: VertInterp
+        obs filters:
+        - filter: Bounds Check
+          minvalue: 100
+        obs bias: {}
+    ''',
+    'sondes.yaml.j2': '''
+        obs space:
+          name: sondes
+          obsdatain:
+            engine:
+              type: H5File
+              obsfile: '{{obs_path}}/{{observation_from_jcb}}.nc'
+          simulated variables: [airTemperature]
+        obs operator:
+          name: VertInterp
+        obs filters:
+        - filter: Background Check
+          threshold: 3.0
+    ''',
+    'amsua_n19.yaml.j2': '''
+        obs space:
+          name: amsua_n19
+          obsdatain:
+            engine:
+              type: H5File
+              obsfile: '{{obs_path}}/{{observation_from_jcb}}.nc'
+          channels: &amsua_n19_channels {{ get_satellite_variable('amsua_n19', 'simulated') }}
+        obs operator:
+          name: CRTM
+          channels: *amsua_n19_channels
+        obs filters:
+        - filter: Bounds Check
+          channels: *amsua_n19_channels
+          action:
+            name: reject
+        - filter: Perform Action
+          error parameter vector: [{{ get_satellite_variable('amsua_n19', 'error') }}]
+    ''',
+}
+
+chronicle_files = {
+    'amsua_n19.yaml': '''
+        commissioned: 2009-04-14T00:00:00
+        observer_type: satellite
+        channel_variables:
+          simulated: min
+          active: min
+          error: max
+        channel_values:
+          1:  [ 1,  1,  2.50 ]
+          2:  [ 1,  1,  2.20 ]
+          3:  [ 1,  1,  2.00 ]
+          4:  [ 1,  1,  0.55 ]
+        chronicles:
+        - action_date: "2020-01-01T00:00:00"
+          justification: 'Channel 4 removed'
+          channel_values:
+            4:  [ 0,  1,  0.55 ]
+    ''',
+}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_files(path, files):
+    os.makedirs(path, exist_ok=True)
+    for name, contents in files.items():
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(textwrap.dedent(contents).lstrip('\n'))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def template_tree(tmp_path):
+
+    """
+    Write the template tree to a temporary directory and return a dictionary of templates that
+    renders it.
+    """
+
+    write_files(os.path.join(tmp_path, 'algorithms'), algorithm_files)
+    write_files(os.path.join(tmp_path, 'app', 'model', 'atmosphere'), model_files)
+    write_files(os.path.join(tmp_path, 'app', 'observations', 'atmosphere'), observation_files)
+    write_files(os.path.join(tmp_path, 'app', 'observation_chronicle', 'atmosphere'),
+                chronicle_files)
+
+    return {
+        'algorithm_path': os.path.join(tmp_path, 'algorithms'),
+        'app_path_model': os.path.join(tmp_path, 'app', 'model', 'atmosphere'),
+        'app_path_observations': os.path.join(tmp_path, 'app', 'observations', 'atmosphere'),
+        'app_path_observation_chronicle': os.path.join(tmp_path, 'app', 'observation_chronicle',
+                                                       'atmosphere'),
+        'observations': ['aircraft', 'amsua_n19', 'sondes'],
+        'window_begin': '2021-01-01T00:00:00Z',
+        'window_length': 'PT6H',
+        'obs_path': '/data/obs',
+        'atmosphere_namelist': 'fmsmpp.nml',
+        'atmosphere_layout_x': 2,
+        'atmosphere_layout_y': 3,
+        'atmosphere_output_path': '/data/output',
+    }
+
+
+# --------------------------------------------------------------------------------------------------
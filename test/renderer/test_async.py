@@ -0,0 +1,56 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import asyncio
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def run(coroutine):
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_async(template_tree):
+
+    template_dicts = [{**template_tree, 'algorithm': algorithm}
+                      for algorithm in ['variational', 'hofx4d', 'converttostructuredgrid'] * 3]
+    expected = [jcb.render(template_dict) for template_dict in template_dicts]
+
+    assert run(jcb.render_async(template_dicts[0])) == expected[0]
+    assert run(jcb.render_all_async(template_dicts, max_concurrency=2)) == expected
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_async_renderer(template_tree):
+
+    algorithms = ['variational', 'hofx4d', 'converttostructuredgrid'] * 10
+    renderer = jcb.Renderer(dict(template_tree))
+    expected = [renderer.render(algorithm) for algorithm in algorithms]
+
+    async def render():
+        async_renderer = await jcb.AsyncRenderer.create(dict(template_tree), max_concurrency=3)
+        results = await async_renderer.render_many(algorithms)
+        text = await async_renderer.render_text('variational', 'json')
+        await async_renderer.close()
+        return results, text
+
+    results, text = run(render())
+
+    assert results == expected
+    assert text == renderer.render_text('variational', 'json')
+
+
+# --------------------------------------------------------------------------------------------------
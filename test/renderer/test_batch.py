@@ -0,0 +1,139 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import json
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.batch import plan_batch, read_batch, render_batch
+from jcb.driver import jcb_driver
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def batch_jobs(template_tree):
+
+    """
+    A batch of hofx and variational configurations for three cycles, with one repeated.
+    """
+
+    jobs = []
+    for cycle in range(3):
+        for algorithm in ['hofx4d', 'variational']:
+            jobs.append((f'{algorithm}_{cycle}', {**template_tree, 'algorithm': algorithm,
+                                                  'obs_path': f'/data/obs/{cycle}'}))
+
+    jobs.append(('variational_repeat', dict(jobs[1][1])))
+
+    return jobs
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_read_batch(tmp_path, template_tree):
+
+    jobs = batch_jobs(template_tree)
+
+    # The same batch as a multi document YAML, a JSONL file and a directory
+    with open(os.path.join(tmp_path, 'batch.yaml'), 'w') as f:
+        yaml.safe_dump_all([template_dict for _, template_dict in jobs], f)
+    with open(os.path.join(tmp_path, 'batch.jsonl'), 'w') as f:
+        f.writelines(json.dumps(template_dict) + '\n' for _, template_dict in jobs)
+    os.makedirs(os.path.join(tmp_path, 'batch'))
+    for name, template_dict in jobs:
+        with open(os.path.join(tmp_path, 'batch', f'{name}.yaml'), 'w') as f:
+            yaml.safe_dump(template_dict, f)
+
+    template_dicts = [template_dict for _, template_dict in jobs]
+
+    yaml_jobs = read_batch(os.path.join(tmp_path, 'batch.yaml'))
+    assert [name for name, _ in yaml_jobs][:2] == ['batch_0000', 'batch_0001']
+    assert [template_dict for _, template_dict in yaml_jobs] == template_dicts
+
+    jsonl_jobs = read_batch(os.path.join(tmp_path, 'batch.jsonl'))
+    assert [template_dict for _, template_dict in jsonl_jobs] == template_dicts
+
+    assert sorted(read_batch(os.path.join(tmp_path, 'batch'))) == sorted(jobs)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_plan_batch(template_tree):
+
+    jobs = batch_jobs(template_tree)
+
+    # The repeated dictionary of templates is rendered once
+    groups = plan_batch(jobs)
+    assert len(groups) == 6
+    assert ['variational_0', 'variational_repeat'] in [names for names, _ in groups]
+
+    # Larger renders come first
+    small = ('small', {**template_tree, 'algorithm': 'hofx4d', 'observations': ['sondes']})
+    assert plan_batch(jobs + [small])[-1][0] == ['small']
+
+    # The shards split the batch, whatever the order of the jobs
+    shards = [plan_batch(list(reversed(jobs)), (index, 4)) for index in range(4)]
+    assert sorted(names for shard in shards for names, _ in shard) == \
+        sorted(names for names, _ in groups)
+    assert shards[1] == plan_batch(jobs, (1, 4))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_batch(tmp_path, template_tree, monkeypatch):
+
+    jobs = batch_jobs(template_tree) + [('broken', {**template_tree, 'algorithm': 'unknown'})]
+    output_dir = os.path.join(tmp_path, 'output')
+
+    summary = render_batch(jobs, output_dir, workers=2)
+
+    assert summary['jobs'] == 8
+    assert summary['distinct'] == 7
+    assert summary['failed'] == 1
+    failed, = [render for render in summary['renders'] if render['status'] == 'failed']
+    assert failed['names'] == ['broken']
+    assert 'unknown' in failed['error']
+
+    for name, template_dict in jobs[:-1]:
+        with open(os.path.join(output_dir, f'{name}.yaml')) as f:
+            assert yaml.safe_load(f) == jcb.render(dict(template_dict))
+
+    # The Renderers of a batch rendered by this process are closed once it is rendered
+    closed = []
+    monkeypatch.setattr(jcb.renderer.Renderer, 'close', lambda renderer: closed.append(renderer))
+    summary = render_batch(jobs[:2], output_dir)
+    assert summary['failed'] == 0
+    assert closed
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_batch_driver(tmp_path, template_tree):
+
+    batch = os.path.join(tmp_path, 'batch.jsonl')
+    with open(batch, 'w') as f:
+        f.writelines(json.dumps(template_dict) + '\n'
+                     for _, template_dict in batch_jobs(template_tree))
+
+    output_dir = os.path.join(tmp_path, 'output')
+    for shard in ['0/2', '1/2']:
+        result = CliRunner().invoke(jcb_driver, ['render-batch', batch, output_dir,
+                                                 '--shard', shard])
+        assert result.exit_code == 0, result.output
+
+    assert len([name for name in os.listdir(output_dir) if name.startswith('batch_0')]) == 7
+
+    with open(os.path.join(output_dir, 'batch_summary_1_of_2.yaml')) as f:
+        summary = yaml.safe_load(f)
+    assert summary['shard'] == '1/2'
+    assert summary['failed'] == 0
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,113 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import textwrap
+
+import jcb
+from jcb.component_pruning import prune_source
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+components = frozenset(['obs space', 'obs operator'])
+
+
+def dedent(source):
+    return textwrap.dedent(source).lstrip('\n')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_prune_source():
+
+    source = dedent('''
+        obs space:
+          name: aircraft
+        obs filters:
+        - filter: Bounds Check
+          minvalue: {{minvalue}}
+        obs operator:
+          name: VertInterp
+        obs bias: {}
+    ''')
+
+    assert prune_source(source, components) == dedent('''
+        obs space:
+          name: aircraft
+        obs operator:
+          name: VertInterp
+    ''')
+
+    # Nothing to remove
+    assert prune_source(source, components | {'obs filters', 'obs bias'}) is None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_blocks_that_are_kept():
+
+    # Blocks with statements and blocks that define anchors used elsewhere are kept
+    source = dedent('''
+        obs filters:
+        - filter: Bounds Check
+          channels: &channels 1-15
+        obs space:
+          channels: *channels
+        obs bias:
+        {% if use_bias %}
+          input file: bias.nc
+        {% endif %}
+        get values: {}
+    ''')
+
+    assert prune_source(source, components) == source.replace('get values: {}\n', '')
+
+    # Keys that are not plain text mean the template is not pruned
+    assert prune_source("'obs space': {}\nobs bias: {}\n", components) is None
+    assert prune_source("{{key}}: {}\nobs bias: {}\n", components) is None
+    assert prune_source("obs space: {}\n{# obs bias #}\nobs bias: {}\n", components) is None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_pruned_render_matches_full_render(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    unpruned = jcb.Renderer({**template_tree, 'jcb_prune_observer_templates': False})
+
+    for algorithm in ['hofx4d', 'variational', 'hofx4d']:
+        assert renderer.render(algorithm) == unpruned.render(algorithm)
+
+    # The hofx observers are rendered pruned, the variational observers in full, and the second
+    # render of hofx uses the cached observers
+    assert (renderer.fragment_cache.misses, renderer.fragment_cache.hits) == (6, 3)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_disallowed_components_not_rendered(template_tree):
+
+    # A filter that cannot be rendered is not a problem for an algorithm that does not use it
+    obs_file = os.path.join(template_tree['app_path_observations'], 'sondes.yaml.j2')
+    with open(obs_file, 'a') as f:
+        f.write("obs bias:\n  input file: '{{undefined_bias_path}}'\n")
+
+    hofx = jcb.Renderer(dict(template_tree)).render('hofx4d')
+
+    assert hofx['observations']['observers'][2] == {
+        'obs space': {
+            'name': 'sondes',
+            'obsdatain': {'engine': {'type': 'H5File', 'obsfile': '/data/obs/sondes.nc'}},
+            'simulated variables': ['airTemperature'],
+        },
+        'obs operator': {'name': 'VertInterp'},
+    }
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,80 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from datetime import datetime
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+from jcb.utilities.config_parsing import cycles_from_conf
+import pytest
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_cycles_from_conf():
+
+    assert cycles_from_conf('2019-12-31T12:00:00Z:2020-01-01T06:00:00Z:PT6H') == \
+        [datetime(2019, 12, 31, 12), datetime(2019, 12, 31, 18), datetime(2020, 1, 1, 0),
+         datetime(2020, 1, 1, 6)]
+    assert len(cycles_from_conf('2020010100:2020010223:PT6H')) == 8
+
+    with pytest.raises(jcb.JcbError):
+        cycles_from_conf('2020-01-01T00:00:00Z:PT6H')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_cycles(template_tree):
+
+    # Channel 4 of amsua_n19 is removed on 2020-01-01, the window ending at that date is in an
+    # epoch of its own since the chronicle compares the end of the window with the action date
+    window_begins = cycles_from_conf('2019-12-31T00:00:00Z:2020-01-01T12:00:00Z:PT6H')
+
+    renderer = jcb.Renderer(dict(template_tree))
+    jedi_dicts = list(renderer.render_cycles('variational', window_begins))
+
+    for window_begin, jedi_dict in jedi_dicts:
+        window = window_begin.strftime('%Y-%m-%dT%H:%M:%SZ')
+        assert jedi_dict == jcb.Renderer({**template_tree, 'window_begin': window}).render(
+            'variational')
+
+    channels = [jedi_dict['cost function']['observations']['observers'][1]['obs space']['channels']
+                for _, jedi_dict in jedi_dicts]
+    assert channels == ['1, 2, 3, 4'] * 3 + ['1, 2, 3'] * 4
+
+    # The observers are rendered for the first cycle and amsua_n19 again for each new epoch
+    assert renderer.fragment_cache.misses == 5
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_cycles_driver(tmp_path, template_tree):
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    result = CliRunner().invoke(jcb_driver, [
+        'render', dictionary_of_templates, os.path.join(tmp_path, 'hofx_%Y%m%d%H.yaml'),
+        '--cycles', '2020-01-01T00:00:00Z:2020-01-01T18:00:00Z:PT6H'])
+    assert result.exit_code == 0, result.output
+
+    with open(os.path.join(tmp_path, 'hofx_2020010112.yaml')) as f:
+        hofx = yaml.safe_load(f)
+    assert hofx['time window']['begin'] == '2020-01-01T12:00:00Z'
+    assert len([name for name in os.listdir(tmp_path) if name.startswith('hofx_')]) == 4
+
+    # Every cycle needs its own file
+    result = CliRunner().invoke(jcb_driver, [
+        'render', dictionary_of_templates, os.path.join(tmp_path, 'hofx.yaml'),
+        '--cycles', '2020-01-01T00:00:00Z:2020-01-01T18:00:00Z:PT6H'])
+    assert result.exit_code != 0
+
+
+# --------------------------------------------------------------------------------------------------
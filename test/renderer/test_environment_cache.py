@@ -0,0 +1,188 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import time
+
+import jcb
+import pytest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@pytest.fixture(autouse=True)
+def empty_environment_cache():
+    jcb.clear_environment_cache()
+    yield
+    jcb.clear_environment_cache()
+    jcb.set_environment_cache_size(16)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_renderers_share_environment(template_tree):
+
+    renderer_1 = jcb.Renderer(dict(template_tree))
+    renderer_2 = jcb.Renderer(dict(template_tree))
+
+    assert renderer_1.env is renderer_2.env
+    assert renderer_1.render('hofx4d') == renderer_2.render('hofx4d')
+
+    # Templates compiled by the first renderer are reused by the second
+    template = renderer_1.env.get_template('hofx4d.yaml.j2')
+    assert renderer_2.env.get_template('hofx4d.yaml.j2') is template
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_modified_template_is_recompiled(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    assert renderer.render('converttostructuredgrid')['output'] == '/data/output'
+
+    # Rewrite the template with a newer modification time
+    template_file = os.path.join(template_tree['algorithm_path'],
+                                 'converttostructuredgrid.yaml.j2')
+    with open(template_file, 'w') as f:
+        f.write("output: 'new/{{atmosphere_output_path}}'\n")
+    mtime = time.time() + 10
+    os.utime(template_file, (mtime, mtime))
+
+    assert jcb.Renderer(dict(template_tree)).render('converttostructuredgrid') == \
+        {'output': 'new//data/output'}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_environment_cache_eviction_and_clear(tmp_path):
+
+    jcb.set_environment_cache_size(2)
+
+    paths = [str(tmp_path / name) for name in ['a', 'b', 'c']]
+    env_a = jcb.get_environment([paths[0]])
+    jcb.get_environment([paths[1]])
+
+    # Using a makes b the least recently used so b is evicted when c is added
+    assert jcb.get_environment([paths[0]]) is env_a
+    jcb.get_environment([paths[2]])
+
+    info = jcb.environment_cache_info()
+    assert info['size'] == 2
+    assert info['search_paths'] == [[paths[0]], [paths[2]]]
+
+    jcb.clear_environment_cache()
+    assert jcb.environment_cache_info()['size'] == 0
+    assert jcb.get_environment([paths[0]]) is not env_a
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_bytecode_cache_shared_between_environments(template_tree, tmp_path):
+
+    cache_dir = str(tmp_path / 'cache')
+    template_tree['jcb_cache_dir'] = cache_dir
+
+    jedi_dict = jcb.Renderer(dict(template_tree)).render('hofx4d')
+    cache_files = os.listdir(cache_dir)
+    assert cache_files
+    assert not [f for f in cache_files if f.endswith('.tmp')]
+
+    # A fresh environment (as in a new process) is able to use the cached bytecode
+    jcb.clear_environment_cache()
+    bytecode_cache = jcb.Renderer(dict(template_tree)).env.bytecode_cache
+    loaded = []
+    load_bytecode = bytecode_cache.load_bytecode
+
+    def recording_load_bytecode(bucket):
+        load_bytecode(bucket)
+        loaded.append(bucket.code is not None)
+
+    bytecode_cache.load_bytecode = recording_load_bytecode
+    assert jcb.Renderer(dict(template_tree)).render('hofx4d') == jedi_dict
+    assert loaded and all(loaded)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_bytecode_cache_file_mode(template_tree, tmp_path, monkeypatch):
+
+    cache_dir = tmp_path / 'cache'
+    template_tree['jcb_cache_dir'] = str(cache_dir)
+
+    # The umask of the process is not changed while writing, other threads may be creating files
+    def umask(mask):
+        raise AssertionError('the umask was changed')
+
+    monkeypatch.setattr(os, 'umask', umask)
+    jcb.Renderer(dict(template_tree)).render('hofx4d')
+
+    mode = 0o666 & ~jcb.utilities.files.process_umask
+    assert [cache_file.stat().st_mode & 0o777 for cache_file in cache_dir.iterdir()] == \
+        [mode] * len(list(cache_dir.iterdir()))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_bytecode_cache_ignores_corrupt_files(template_tree, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+    template_tree['jcb_cache_dir'] = str(cache_dir)
+    jedi_dict = jcb.Renderer(dict(template_tree)).render('variational')
+
+    # Truncate every cache file, as if a writer had been interrupted
+    for cache_file in cache_dir.iterdir():
+        cache_file.write_bytes(cache_file.read_bytes()[:20])
+
+    jcb.clear_environment_cache()
+    assert jcb.Renderer(dict(template_tree)).render('variational') == jedi_dict
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_bytecode_cache_from_environment_variable(template_tree, tmp_path, monkeypatch):
+
+    cache_dir = tmp_path / 'env_cache'
+    monkeypatch.setenv('JCB_CACHE_DIR', str(cache_dir))
+
+    jcb.Renderer(dict(template_tree)).render('converttostructuredgrid')
+    assert list(cache_dir.iterdir())
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_functions_in_imported_macros(template_tree):
+
+    with open(os.path.join(template_tree['algorithm_path'], 'macros.j2'), 'w') as f:
+        f.write("{% macro channels(name) %}"
+                "{{ get_satellite_variable(name, 'simulated') }}{% endmacro %}\n"
+                "{% macro active(name) %}{{ use_observer(name) }}{% endmacro %}\n")
+
+    with open(os.path.join(template_tree['algorithm_path'], 'macros.yaml.j2'), 'w') as f:
+        f.write("{% import 'macros.j2' as macros %}\n"
+                "channels: {{ macros.channels('amsua_n19') }}\n"
+                "active: {{ macros.active('amsua_n19') }}\n"
+                "expected: {{ get_satellite_variable('amsua_n19', 'simulated') }}\n")
+
+    # Macros imported without context call the functions of the Renderer that is rendering
+    renderer_1 = jcb.Renderer(dict(template_tree))
+    renderer_2 = jcb.Renderer({**template_tree, 'window_begin': '2019-01-01T00:00:00Z'})
+    assert renderer_1.env is renderer_2.env
+
+    macros_1 = renderer_1.render('macros')
+    macros_2 = renderer_2.render('macros')
+    assert macros_1['channels'] == macros_1['expected']
+    assert macros_2['channels'] == macros_2['expected']
+    assert macros_1['channels'] != macros_2['channels']
+    assert macros_1['active'] is True
+
+
+# --------------------------------------------------------------------------------------------------
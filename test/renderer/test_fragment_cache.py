@@ -0,0 +1,140 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+algorithms = ['hofx4d', 'variational', 'converttostructuredgrid']
+
+
+def render_without_fragments(template_dict, algorithm):
+    return jcb.Renderer({**template_dict, 'jcb_fragment_cache': False}).render(algorithm)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_fragments_match_full_render(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+
+    for algorithm in algorithms:
+        assert renderer.render(algorithm) == render_without_fragments(template_tree, algorithm)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_observers_rendered_once_per_renderer(template_tree):
+
+    # Without pruning before rendering the observation templates are the same for all algorithms
+    renderer = jcb.Renderer({**template_tree, 'jcb_prune_observer_templates': False})
+
+    hofx = renderer.render('hofx4d')
+    assert (renderer.fragment_cache.misses, renderer.fragment_cache.hits) == (3, 0)
+
+    variational = renderer.render('variational')
+    assert (renderer.fragment_cache.misses, renderer.fragment_cache.hits) == (3, 3)
+
+    # Pruning of the hofx observers must not change the cached observers
+    assert 'obs filters' not in hofx['observations']['observers'][0]
+    assert 'obs filters' in variational['cost function']['observations']['observers'][0]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_fragment_depending_on_algorithm(template_tree):
+
+    # An observation that reads the algorithm is rendered once per algorithm
+    obs_file = os.path.join(template_tree['app_path_observations'], 'sondes.yaml.j2')
+    with open(obs_file, 'a') as f:
+        f.write("obs bias:\n  comment: 'used in {{algorithm}}'\n")
+
+    renderer = jcb.Renderer({**template_tree, 'jcb_prune_observer_templates': False})
+    renderer.render('hofx4d')
+    variational = renderer.render('variational')
+
+    assert renderer.fragment_cache.misses == 4
+    assert variational['cost function']['observations']['observers'][2]['obs bias'] == \
+        {'comment': 'used in variational'}
+    assert variational == render_without_fragments(template_tree, 'variational')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_fragment_that_cannot_be_parsed_alone(template_tree):
+
+    # Sondes refers to an anchor that is defined by aircraft
+    obs_path = template_tree['app_path_observations']
+    aircraft_file = os.path.join(obs_path, 'aircraft.yaml.j2')
+    with open(aircraft_file, 'r') as f:
+        aircraft = f.read()
+    with open(aircraft_file, 'w') as f:
+        f.write(aircraft.replace('obs bias: {}', 'obs bias: &shared_bias {input file: bias.nc}'))
+    with open(os.path.join(obs_path, 'sondes.yaml.j2'), 'a') as f:
+        f.write('obs bias: *shared_bias\n')
+
+    renderer = jcb.Renderer(dict(template_tree))
+    jedi_dict = renderer.render('variational')
+
+    observers = jedi_dict['cost function']['observations']['observers']
+    assert observers[2]['obs bias'] == {'input file': 'bias.nc'}
+    assert jedi_dict == render_without_fragments(template_tree, 'variational')
+
+    # The failure is remembered, the next render goes straight to rendering in one piece
+    template = renderer.env.get_template('variational.yaml.j2')
+    assert template in renderer.fragment_cache.whole_templates
+
+    misses = renderer.fragment_cache.misses
+    assert renderer.render('variational') == jedi_dict
+    assert renderer.fragment_cache.misses == misses
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_many(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    jedi_dicts = renderer.render_many(algorithms)
+
+    assert list(jedi_dicts) == algorithms
+    for algorithm in algorithms:
+        assert jedi_dicts[algorithm] == render_without_fragments(template_tree, algorithm)
+
+    # Identical sub-trees are the same object
+    hofx_observers = jedi_dicts['hofx4d']['observations']['observers']
+    var_observers = jedi_dicts['variational']['cost function']['observations']['observers']
+    assert hofx_observers[0]['obs space'] is var_observers[0]['obs space']
+    assert jedi_dicts['hofx4d']['geometry'] is jedi_dicts['converttostructuredgrid']['geometry']
+
+    # Chronicles are processed once for each observer
+    assert list(renderer.obs_chron.processed_satellites) == ['amsua_n19']
+
+    # Without sharing nothing is shared
+    jedi_dicts = renderer.render_many(algorithms, share_subtrees=False)
+    assert jedi_dicts['hofx4d']['geometry'] is not jedi_dicts['converttostructuredgrid']['geometry']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_observers_rendered_in_pool(template_tree):
+
+    with jcb.Renderer(dict(template_tree), workers=2) as renderer:
+        for algorithm in algorithms:
+            assert renderer.render(algorithm) == render_without_fragments(template_tree,
+                                                                          algorithm)
+        assert renderer.fragment_pool.executor is not None
+
+    assert renderer.fragment_pool.executor is None
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,72 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from datetime import datetime
+import json
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+from jcb.serializers import format_from_path, serialize
+import pytest
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_serialize(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    variational = renderer.render('variational')
+    nesting = renderer.observer_nesting('variational')
+
+    assert yaml.safe_load(serialize(variational)) == variational
+    assert json.loads(serialize(variational, 'json')) == variational
+
+    # The observers are on their own lines after the rest of the configuration
+    lines = [json.loads(line) for line in serialize(variational, 'jsonl', nesting).splitlines()]
+    assert len(lines) == 4
+    assert lines[0]['cost function']['observations']['observers'] == []
+    assert lines[1:] == variational['cost function']['observations']['observers']
+    assert len(variational['cost function']['observations']['observers']) == 3
+
+    # Dates are written as they are in the templates
+    assert json.loads(serialize({'begin': datetime(2020, 1, 1, 6)}, 'json')) == \
+        {'begin': '2020-01-01T06:00:00Z'}
+    assert json.loads(serialize({'begin': datetime(2020, 1, 1, 6, 0, 0, 500)}, 'json')) == \
+        {'begin': '2020-01-01T06:00:00.000500Z'}
+
+    # Other values JSON does not have are an error
+    with pytest.raises(TypeError, match='set'):
+        serialize({'channels': {1, 2}}, 'json')
+
+    assert renderer.render_text('variational', 'json') == serialize(variational, 'json')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_format(tmp_path, template_tree):
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    expected = jcb.render({**template_tree, 'algorithm': 'hofx4d'})
+
+    # The format is taken from the extension unless it is given
+    for output_file, options in [('hofx.json', []), ('hofx.out', ['--format', 'json'])]:
+        output_path = os.path.join(tmp_path, output_file)
+        result = CliRunner().invoke(jcb_driver, ['render', dictionary_of_templates, output_path]
+                                    + options)
+        assert result.exit_code == 0, result.output
+        with open(output_path) as f:
+            assert json.load(f) == expected
+
+    assert format_from_path('hofx.jsonl') == 'jsonl'
+    assert format_from_path('hofx.out') == 'yaml'
+
+
+# --------------------------------------------------------------------------------------------------
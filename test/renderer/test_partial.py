@@ -0,0 +1,75 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import jcb
+import pytest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_partial(template_tree):
+
+    late_bound_keys = ['obs_path', 'atmosphere_layout_x', 'atmosphere_namelist']
+
+    renderer = jcb.Renderer(dict(template_tree))
+    jedi_dict = renderer.render('variational')
+    partial = renderer.render_partial('variational', late_bound_keys)
+
+    # The partial render is kept
+    assert renderer.render_partial('variational', reversed(late_bound_keys)) is partial
+
+    # The Renderer is not changed, so its cached observers are still used
+    assert dict(renderer.template_dict) == jcb.Renderer(dict(template_tree)).template_dict
+    misses = renderer.fragment_cache.misses
+    assert renderer.render('variational') == jedi_dict
+    assert renderer.fragment_cache.misses == misses
+
+    for member in range(1, 4):
+        values = {'obs_path': f'/data/mem{member:03d}/obs', 'atmosphere_layout_x': member,
+                  'atmosphere_namelist': f'fmsmpp_{member}.nml'}
+        expected = jcb.Renderer({**template_tree, **values}).render('variational')
+        assert partial.finalize(values) == expected
+
+    # Values written out on their own are read as YAML
+    variational = partial.finalize({'obs_path': '/data', 'atmosphere_layout_x': '4',
+                                    'atmosphere_namelist': 'input.nml'})
+    assert variational['cost function']['geometry']['layout'] == [4, 3]
+
+    # The partial render is not changed by finalize
+    assert partial.tree['cost function']['geometry']['layout'][0] != 4
+
+    # The Renderer still renders with its own values
+    assert renderer.render('variational') == jcb.render({**template_tree,
+                                                         'algorithm': 'variational'})
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_partial_checks(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+
+    # The chronicle depends on the window
+    with pytest.raises(jcb.JcbError, match='cannot be late bound'):
+        renderer.render_partial('variational', ['window_begin'])
+
+    # The model component is used to name an included template
+    with pytest.raises(jcb.JcbError, match='can only be written out'):
+        renderer.render_partial('variational', ['model_component'])
+
+    partial = renderer.render_partial('variational', ['obs_path'])
+    with pytest.raises(jcb.JcbError, match='cannot be substituted'):
+        partial.finalize({'obs_path': "/data/'quoted'"})
+
+    # A value in a flow sequence cannot add items to it
+    partial = renderer.render_partial('variational', ['atmosphere_layout_x'])
+    for value in ['4, 5', '[4]', '{4: 5}']:
+        with pytest.raises(jcb.JcbError, match='cannot be substituted'):
+            partial.finalize({'atmosphere_layout_x': value})
+    with pytest.raises(jcb.JcbError, match='Values are needed'):
+        partial.finalize({})
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,142 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+import pytest
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_plan(template_tree):
+
+    plan = jcb.Renderer(dict(template_tree)).plan('hofx4d')
+
+    assert plan['templates'] == ['hofx4d.yaml.j2', 'atmosphere_geometry.yaml.j2',
+                                 'aircraft.yaml.j2', 'amsua_n19.yaml.j2', 'sondes.yaml.j2']
+    assert plan['keys'] == ['atmosphere_layout_x', 'atmosphere_layout_y', 'atmosphere_namelist',
+                            'model_component', 'obs_path', 'observations', 'window_begin',
+                            'window_length']
+    assert plan['missing_keys'] == []
+    assert plan['missing_templates'] == []
+    assert plan['unresolved_includes'] == []
+    assert plan['observers'] == ['aircraft', 'amsua_n19', 'sondes']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_plan_inactive_observer(template_tree):
+
+    # amsua_n19 was commissioned in 2009 so is not used in 2008
+    renderer = jcb.Renderer({**template_tree, 'window_begin': '2008-01-01T00:00:00Z'})
+    plan = renderer.plan('hofx4d')
+
+    assert plan['observers'] == ['aircraft', 'sondes']
+    assert 'amsua_n19.yaml.j2' not in plan['templates']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_plan_pruned_components(template_tree):
+
+    obs_file = os.path.join(template_tree['app_path_observations'], 'sondes.yaml.j2')
+    with open(obs_file, 'a') as f:
+        f.write("obs bias:\n  input file: '{{bias_path}}'\n")
+
+    # hofx4d does not allow the obs bias, so it is removed before rendering
+    renderer = jcb.Renderer(dict(template_tree))
+    assert renderer.plan('hofx4d')['missing_keys'] == []
+    assert renderer.render('hofx4d') is not None
+    assert renderer.plan('variational')['missing_keys'] == ['bias_path']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_plan_conditional_keys(template_tree):
+
+    algorithm_file = os.path.join(template_tree['algorithm_path'],
+                                  'converttostructuredgrid.yaml.j2')
+    with open(algorithm_file, 'a') as f:
+        f.write("{% if do_bias == 'yes' %}bias: '{{bias_only_key}}'\n"
+                "{% elif do_bias is defined and not do_bias %}bias: '{{empty_bias_key}}'\n"
+                "{% else %}bias: none\n{% endif %}\n"
+                "{% if obs_path | length > 30 %}long: '{{long_path_key}}'\n{% endif %}\n")
+
+    # Keys of branches that are not taken are not read
+    template_dict = {**template_tree, 'do_bias': 'no', 'obs_path': '/data/obs'}
+    renderer = jcb.Renderer(template_dict)
+    plan = renderer.validate('converttostructuredgrid')
+    assert 'bias_only_key' not in plan['keys'] + plan['missing_keys']
+    assert 'empty_bias_key' not in plan['keys'] + plan['missing_keys']
+    assert renderer.render('converttostructuredgrid')['bias'] == 'none'
+
+    # Keys of branches whose test cannot be evaluated are conditional
+    assert plan['conditional_keys'] == ['long_path_key']
+
+    renderer = jcb.Renderer({**template_dict, 'do_bias': 'yes'})
+    with pytest.raises(jcb.JcbError, match='bias_only_key'):
+        renderer.validate('converttostructuredgrid')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_validate(template_tree):
+
+    obs_file = os.path.join(template_tree['app_path_observations'], 'sondes.yaml.j2')
+    with open(obs_file, 'a') as f:
+        f.write("obs bias:\n  input file: '{{bias_path}}'\n"
+                "  comment: '{{bias_comment | default(\"\")}}'\n"
+                "{% include 'sondes_extra.yaml.j2' %}\n")
+
+    template_dict = dict(template_tree)
+    del template_dict['atmosphere_namelist']
+    renderer = jcb.Renderer(template_dict)
+
+    with pytest.raises(jcb.JcbError) as error:
+        renderer.validate('variational')
+
+    plan = error.value.context['plan']
+    assert plan['missing_keys'] == ['atmosphere_namelist', 'bias_path']
+    assert plan['missing_templates'] == ['sondes_extra.yaml.j2']
+
+    # The converter does not read the observations
+    renderer = jcb.Renderer(dict(template_tree))
+    assert renderer.validate('converttostructuredgrid')['templates'] == \
+        ['converttostructuredgrid.yaml.j2', 'atmosphere_geometry.yaml.j2']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_driver_deps(template_tree, tmp_path):
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    result = CliRunner().invoke(jcb_driver, ['deps', dictionary_of_templates, '--algorithm',
+                                             'hofx4d', '--algorithm', 'variational'])
+    assert result.exit_code == 0, result.output
+
+    plans = yaml.safe_load(result.output)
+    assert [plan['algorithm'] for plan in plans] == ['hofx4d', 'variational']
+
+    # A missing key fails the command
+    del template_tree['obs_path']
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    result = CliRunner().invoke(jcb_driver, ['deps', dictionary_of_templates])
+    assert isinstance(result.exception, jcb.JcbError)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,70 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+from jcb.utilities import yaml_backend
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_profile_render(template_tree):
+
+    template_dict = {**template_tree, 'algorithm': 'variational'}
+    expected = jcb.render(template_dict)
+    jcb.clear_environment_cache()
+
+    jedi_dict, profile = jcb.profile_render(template_dict, trace_memory=True)
+
+    assert jedi_dict == expected
+
+    for name in ['construction', 'chronicle_load', 'template_load', 'jinja_compile', 'render',
+                 'directive_scan', 'yaml_parse', 'observer_pruning', 'other']:
+        assert name in profile.phases, name
+
+    # Each template, including the observations rendered as fragments and the includes of the
+    # observations, is timed once
+    assert {name: timing['calls'] for name, timing in profile.templates.items()} == {
+        'variational.yaml.j2': 1, 'atmosphere_geometry.yaml.j2': 1, 'aircraft.yaml.j2': 1,
+        'amsua_n19.yaml.j2': 1, 'sondes.yaml.j2': 1}
+
+    assert profile.calls == {'use_observer': 3, 'get_satellite_variable': 2}
+    assert profile.peak_memory > 0 and profile.peak_resident_memory > 0
+
+    # The own times add up to the time of the profile
+    own_seconds = sum(row[3] for row in profile.rows())
+    assert abs(own_seconds - profile.seconds) < 1e-6
+    assert [row[3] for row in profile.rows()] == sorted((row[3] for row in profile.rows()),
+                                                        reverse=True)
+
+    # Nothing is recorded when no profile is active
+    jcb.Renderer(dict(template_tree)).render('variational')
+    assert profile.templates['variational.yaml.j2']['calls'] == 1
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_profile_cli(tmp_path, template_tree):
+
+    dictionary_path = tmp_path / 'dictionary.yaml'
+    output_path = tmp_path / 'jedi.yaml'
+    with open(dictionary_path, 'w') as f:
+        f.write(yaml_backend.dump({**template_tree, 'algorithm': 'hofx4d'}))
+
+    result = CliRunner().invoke(jcb_driver, ['render', str(dictionary_path), str(output_path),
+                                             '--profile'])
+    assert result.exit_code == 0, result.output
+
+    assert 'hofx4d.yaml.j2' in result.output
+    # The error parameters of the observation filters are pruned before rendering for hofx4d
+    assert 'get_satellite_variable calls: 1' in result.output
+    assert 'peak resident memory' in result.output
+
+    with open(output_path, 'r') as f:
+        assert yaml_backend.safe_load(f) == jcb.render({**template_tree, 'algorithm': 'hofx4d'})
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,96 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_yaml_without_pruning(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+
+    # converttostructuredgrid has no observer components so the rendered text is returned
+    jedi_yaml = renderer.render_yaml('converttostructuredgrid')
+    template = renderer.env.get_template('converttostructuredgrid.yaml.j2')
+
+    assert jedi_yaml == template.render({**renderer.template_functions, **renderer.template_dict})
+    assert yaml.safe_load(jedi_yaml) == renderer.render('converttostructuredgrid')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_yaml_with_pruning(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+
+    # Every observation template is pruned before it is rendered so the text is not parsed, it
+    # keeps the flow sequences of the templates
+    for algorithm in ['hofx4d', 'variational']:
+        jedi_yaml = renderer.render_yaml(algorithm)
+        assert 'layout: [2, 3]' in jedi_yaml
+        assert yaml.safe_load(jedi_yaml) == renderer.render(algorithm)
+
+    assert 'obs filters' not in renderer.render_yaml('hofx4d')
+
+    # The observations are taken from the fragment cache when rendered again
+    misses = renderer.fragment_cache.misses
+    renderer.render_yaml('hofx4d')
+    assert renderer.fragment_cache.misses == misses
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_yaml_incomplete_pruning(template_tree):
+
+    # The blocks of aircraft around an if statement cannot be removed before rendering
+    aircraft = os.path.join(template_tree['app_path_observations'], 'aircraft.yaml.j2')
+    with open(aircraft, 'a') as f:
+        f.write("{% if obs_path %}\nobs error: {}\n{% endif %}\n")
+
+    renderer = jcb.Renderer(dict(template_tree))
+
+    jedi_yaml = renderer.render_yaml('hofx4d')
+    assert 'layout:\n  - 2' in jedi_yaml
+    assert yaml.safe_load(jedi_yaml) == renderer.render('hofx4d')
+    assert 'obs error' not in jedi_yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_driver_passthrough(template_tree, tmp_path):
+
+    template_dict = {**template_tree, 'algorithm': 'converttostructuredgrid'}
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump(template_dict, f)
+
+    renderer = jcb.Renderer(dict(template_dict))
+    template = renderer.env.get_template('converttostructuredgrid.yaml.j2')
+    rendered_text = template.render({**renderer.template_functions, **renderer.template_dict})
+
+    for options in [[], ['--passthrough']]:
+        jedi_yaml = os.path.join(tmp_path, f'jedi{len(options)}.yaml')
+        result = CliRunner().invoke(jcb_driver, ['render', dictionary_of_templates, jedi_yaml] +
+                                    options)
+        assert result.exit_code == 0, result.output
+
+        with open(jedi_yaml, 'r') as f:
+            jedi_text = f.read()
+
+        # With --passthrough the rendered text is written as it is
+        assert (jedi_text == rendered_text) == bool(options)
+        assert yaml.safe_load(jedi_text) == jcb.render(template_dict)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,170 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+from jcb.result_cache import parse_size, ResultCache
+from jcb.tree_index import write_index
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_result_cache(tmp_path, template_tree, monkeypatch):
+
+    cache_dir = os.path.join(tmp_path, 'results')
+    template_dict = {**template_tree, 'algorithm': 'hofx4d', 'jcb_result_cache_dir': cache_dir}
+    expected = jcb.Renderer(dict(template_tree)).render('hofx4d')
+
+    assert jcb.render(dict(template_dict)) == expected
+
+    # The second render is read from the cache
+    monkeypatch.setattr(jcb.renderer.Renderer, 'render', None)
+    assert jcb.render(dict(template_dict)) == expected
+
+    result_cache = ResultCache(cache_dir)
+    assert result_cache.stats()['results'] == 1
+    assert (result_cache.stats()['hits'], result_cache.stats()['misses']) == (1, 1)
+
+    # Options do not change the key, the keys of the dictionary, the templates and the
+    # chronicles do
+    monkeypatch.setattr(jcb.result_cache, 'tree_digest_lifetime', 0.0)
+    key = result_cache.key(template_dict, 'hofx4d')
+    assert result_cache.key({**template_dict, 'jcb_workers': 4}, 'hofx4d') == key
+    assert result_cache.key(template_dict, 'variational') != key
+    assert result_cache.key({**template_dict, 'obs_path': '/other'}, 'hofx4d') != key
+
+    sondes = os.path.join(template_tree['app_path_observations'], 'sondes.yaml.j2')
+    with open(sondes, 'a') as f:
+        f.write('# changed\n')
+    assert result_cache.key(template_dict, 'hofx4d') != key
+    key = result_cache.key(template_dict, 'hofx4d')
+
+    chronicle = os.path.join(template_tree['app_path_observation_chronicle'], 'amsua_n19.yaml')
+    with open(chronicle, 'a') as f:
+        f.write('# changed\n')
+    assert result_cache.key(template_dict, 'hofx4d') != key
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_tree_digest(tmp_path, template_tree, monkeypatch):
+
+    result_cache = ResultCache(os.path.join(tmp_path, 'results'))
+    observations = template_tree['app_path_observations']
+    digest = result_cache.tree_digest(observations)
+
+    # A digest is reused for a short time without looking at the files
+    def stat(*args, **kwargs):
+        raise AssertionError('the files were checked')
+
+    with monkeypatch.context() as context:
+        context.setattr(os, 'stat', stat)
+        assert result_cache.tree_digest(observations) == digest
+
+    # The files of an indexed tree are not listed, and give the same digest
+    monkeypatch.setattr(jcb.result_cache, 'tree_digest_lifetime', 0.0)
+    write_index(os.path.dirname(observations))
+
+    def walk(*args, **kwargs):
+        raise AssertionError('the tree was listed')
+
+    with monkeypatch.context() as context:
+        context.setattr(os, 'walk', walk)
+        assert result_cache.tree_digest(observations) == digest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_result_cache_prune(tmp_path):
+
+    result_cache = ResultCache(os.path.join(tmp_path, 'results'), '1K', prune_interval=1000)
+
+    for index in range(10):
+        assert result_cache.put(f'{index + 1:08x}' * 8, {'value': 'x' * 200})
+        os.utime(result_cache.result_path(f'{index + 1:08x}' * 8), (index, index))
+
+    # The least recently used results are removed
+    assert result_cache.stats()['size'] > 1024
+    assert result_cache.prune() > 0
+    assert result_cache.stats()['size'] <= 1024
+    assert result_cache.get(f'{10:08x}' * 8) is not None
+    assert result_cache.get(f'{1:08x}' * 8) is None
+
+    # Storing a result prunes after one in prune_interval results
+    result_cache.prune_interval = 1
+    for index in range(10):
+        result_cache.put(f'{index + 11:08x}' * 8, {'value': 'x' * 200})
+    assert result_cache.stats()['size'] <= 1024
+
+    # Results that JSON would change are not stored
+    assert not result_cache.put('f' * 64, {1: 'value'})
+
+    assert parse_size('2G') == 2 << 30
+    assert parse_size(1000) == 1000
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_result_cache_counters(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(jcb.result_cache, 'counters_interval', 0.0)
+    result_cache = ResultCache(os.path.join(tmp_path, 'results'))
+    result_cache.put('0' * 64, {'value': 1})
+
+    # The counters file keeps its size however many hits and misses are counted
+    result_cache.get('0' * 64)
+    size = os.path.getsize(result_cache.counters_path)
+    for _ in range(100):
+        result_cache.get('0' * 64)
+        result_cache.get('1' * 64)
+    assert os.path.getsize(result_cache.counters_path) <= size + 4
+
+    stats = result_cache.stats()
+    assert (stats['hits'], stats['misses']) == (101, 100)
+    assert stats['size'] >= os.path.getsize(result_cache.counters_path)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_cache_command(tmp_path, template_tree, monkeypatch):
+
+    cache_dir = os.path.join(tmp_path, 'results')
+    monkeypatch.setenv('JCB_RESULT_CACHE_DIR', cache_dir)
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    for output_file in ['hofx.yaml', 'hofx.jsonl']:
+        result = CliRunner().invoke(jcb_driver, ['render', dictionary_of_templates,
+                                                 os.path.join(tmp_path, output_file)])
+        assert result.exit_code == 0, result.output
+
+    # The JSONL still has the observers on their own lines
+    with open(os.path.join(tmp_path, 'hofx.jsonl')) as f:
+        assert len(f.readlines()) == 4
+
+    result = CliRunner().invoke(jcb_driver, ['cache', 'stats'])
+    assert result.exit_code == 0, result.output
+    stats = yaml.safe_load(result.output)
+    assert (stats['results'], stats['hits'], stats['misses']) == (1, 1, 1)
+
+    result = CliRunner().invoke(jcb_driver, ['cache', 'prune', '--max-size', '0'])
+    assert result.exit_code == 0, result.output
+    assert 'Removed 1 results' in result.output
+
+    result = CliRunner().invoke(jcb_driver, ['cache', 'clear'])
+    assert result.exit_code == 0, result.output
+    assert not os.path.exists(os.path.join(cache_dir, 'results'))
+
+
+# --------------------------------------------------------------------------------------------------
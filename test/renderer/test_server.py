@@ -0,0 +1,159 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import json
+import os
+import socket
+import threading
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+from jcb.server import absolute_paths, create_server, render_with_server
+import pytest
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def server(tmp_path):
+
+    server = create_server(os.path.join(tmp_path, 'jcb.sock'))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_render_with_server(server, template_tree):
+
+    template_dict = {**template_tree, 'algorithm': 'variational'}
+
+    result = render_with_server(server.server_address, template_dict)
+    assert yaml.safe_load(result) == jcb.render(dict(template_dict))
+
+    # The Renderer is reused and updated for a new cycle
+    template_dict['obs_path'] = '/data/new_obs'
+    result = render_with_server(server.server_address, template_dict, output_format='json')
+    assert json.loads(result) == jcb.render(dict(template_dict))
+
+    assert server.requests == 2
+    assert len(server.renderers) == 1
+    _, renderer = next(iter(server.renderers.renderers.values()))
+    assert renderer.fragment_cache.misses == 6
+
+    # Errors are reported to the client
+    with pytest.raises(jcb.JcbError):
+        render_with_server(server.server_address, {**template_dict, 'algorithm': 'unknown'})
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_driver_with_server(server, template_tree, tmp_path):
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    expected = jcb.render({**template_tree, 'algorithm': 'hofx4d'})
+
+    # With the server, and falling back to rendering in process when there is no server
+    for server_socket in [server.server_address, os.path.join(tmp_path, 'missing.sock')]:
+        jedi_yaml = os.path.join(tmp_path, 'jedi.yaml')
+        result = CliRunner().invoke(jcb_driver, ['render', dictionary_of_templates, jedi_yaml,
+                                                 '--server', server_socket])
+        assert result.exit_code == 0, result.output
+
+        with open(jedi_yaml, 'r') as f:
+            assert yaml.safe_load(f) == expected
+
+    assert server.requests == 1
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_server_threads(server, template_tree, tmp_path, monkeypatch):
+
+    # A request for one setup that does not finish does not hold up the requests for others
+    blocked = threading.Event()
+    release = threading.Event()
+    render_request = jcb.server.render_request
+
+    def blocking_render_request(renderer, request):
+        if request['template_dict'].get('jcb_cache_dir'):
+            blocked.set()
+            release.wait(10)
+        return render_request(renderer, request)
+
+    monkeypatch.setattr(jcb.server, 'render_request', blocking_render_request)
+
+    template_dict = {**template_tree, 'algorithm': 'hofx4d'}
+    slow_dict = {**template_dict, 'jcb_cache_dir': os.path.join(tmp_path, 'bytecode')}
+    slow = threading.Thread(target=render_with_server, args=(server.server_address, slow_dict))
+    slow.start()
+    try:
+        assert blocked.wait(10)
+        result = render_with_server(server.server_address, template_dict, timeout=10)
+        assert yaml.safe_load(result) == jcb.render(dict(template_dict))
+    finally:
+        release.set()
+        slow.join()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_server_timeout(template_tree, tmp_path, monkeypatch):
+
+    dictionary_of_templates = os.path.join(tmp_path, 'dictionary_of_templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump({**template_tree, 'algorithm': 'hofx4d'}, f)
+
+    # A server that accepts connections but never responds
+    socket_path = os.path.join(tmp_path, 'hung.sock')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as hung_server:
+        hung_server.bind(socket_path)
+        hung_server.listen()
+
+        jedi_yaml = os.path.join(tmp_path, 'jedi.yaml')
+        result = CliRunner().invoke(jcb_driver, ['render', dictionary_of_templates, jedi_yaml,
+                                                 '--server', socket_path,
+                                                 '--server-timeout', '0.2'])
+        assert result.exit_code == 0, result.output
+
+    with open(jedi_yaml, 'r') as f:
+        assert yaml.safe_load(f) == jcb.render({**template_tree, 'algorithm': 'hofx4d'})
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_absolute_paths(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+
+    template_dict = absolute_paths({'algorithm_path': 'algorithms', 'jcb_cache_dir': 'cache',
+                                    'jcb_result_cache_size': '1G', 'jcb_workers': 2,
+                                    'app_path_model': 'model', 'obs_path': 'obs'})
+
+    # Paths are resolved in the working directory of the client, app paths in the apps of jcb
+    assert template_dict['algorithm_path'] == os.path.join(tmp_path, 'algorithms')
+    assert template_dict['jcb_cache_dir'] == os.path.join(tmp_path, 'cache')
+    assert template_dict['app_path_model'] == jcb.renderer.get_app_path('model')
+    assert template_dict['jcb_result_cache_size'] == '1G'
+    assert template_dict['jcb_workers'] == 2
+    assert template_dict['obs_path'] == 'obs'
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,78 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import shutil
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+import pytest
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_compile_and_render_from_archive(template_tree, tmp_path):
+
+    archive = str(tmp_path / 'templates.zip')
+    template_names = jcb.compile_template_archive(dict(template_tree), archive)
+    assert 'hofx4d.yaml.j2' in template_names
+    assert 'amsua_n19.yaml.j2' in template_names
+
+    # The archive is created like any other file, using the umask of the process
+    assert os.stat(archive).st_mode & 0o777 == 0o666 & ~jcb.utilities.files.process_umask
+
+    expected = {algorithm: jcb.Renderer(dict(template_tree)).render(algorithm)
+                for algorithm in ['hofx4d', 'variational', 'converttostructuredgrid']}
+
+    # Remove the template directories so the archive is the only place to find the templates
+    for key in ['algorithm_path', 'app_path_model', 'app_path_observations']:
+        shutil.rmtree(template_tree[key])
+
+    archive_dict = dict(template_tree)
+    archive_dict['jcb_template_archive'] = archive
+    del archive_dict['observations']
+
+    renderer = jcb.Renderer(archive_dict)
+    assert sorted(renderer.template_dict['observations']) == ['aircraft', 'amsua_n19', 'sondes']
+    renderer.template_dict['observations'] = template_tree['observations']
+
+    for algorithm, jedi_dict in expected.items():
+        assert renderer.render(algorithm) == jedi_dict
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_archive_paths_must_match(template_tree, tmp_path):
+
+    archive = str(tmp_path / 'templates.zip')
+    jcb.compile_template_archive(dict(template_tree), archive)
+
+    template_tree['jcb_template_archive'] = archive
+    template_tree['app_path_model'] = '/some/other/model'
+
+    with pytest.raises(ValueError):
+        jcb.Renderer(template_tree)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_compile_command(template_tree, tmp_path):
+
+    dictionary_of_templates = str(tmp_path / 'templates.yaml')
+    with open(dictionary_of_templates, 'w') as f:
+        yaml.safe_dump(template_tree, f)
+
+    archive = str(tmp_path / 'templates.zip')
+    result = CliRunner().invoke(jcb_driver, ['compile', dictionary_of_templates, archive])
+
+    assert result.exit_code == 0, result.output
+    assert os.path.exists(archive)
+    assert 'hofx4d.yaml.j2' in jcb.TemplateArchive(archive).metadata['templates']
+
+
+# --------------------------------------------------------------------------------------------------
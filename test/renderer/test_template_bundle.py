@@ -0,0 +1,73 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+import pytest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_template_bundle(tmp_path, template_tree, monkeypatch):
+
+    expected = jcb.render({**template_tree, 'algorithm': 'variational'})
+
+    bundle = os.path.join(tmp_path, 'templates.zip')
+    result = CliRunner().invoke(jcb_driver, ['bundle', bundle, template_tree['algorithm_path'],
+                                             f'={tmp_path}/app'])
+    assert result.exit_code == 0, result.output
+
+    bundle_dict = {**template_tree,
+                   'algorithm_path': f'{bundle}/algorithms',
+                   'app_path_model': f'{bundle}/model/atmosphere',
+                   'app_path_observations': f'{bundle}/observations/atmosphere',
+                   'app_path_observation_chronicle': f'{bundle}/observation_chronicle/atmosphere'}
+
+    # The templates are read from the bundle
+    def listdir(path):
+        raise AssertionError(f'{path} was listed')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'listdir', listdir)
+        renderer = jcb.Renderer(dict(bundle_dict))
+        assert renderer.render('variational') == expected
+
+    assert sorted(renderer.all_observations) == ['aircraft', 'amsua_n19', 'sondes']
+
+    with pytest.raises(jcb.JcbError, match='no directory'):
+        jcb.Renderer({**bundle_dict, 'app_path_model': f'{bundle}/model/ocean'})
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_loader_objects(template_tree):
+
+    expected = jcb.render({**template_tree, 'algorithm': 'hofx4d'})
+
+    # A bundle held in memory
+    files = {}
+    for name, key in [('algorithms', 'algorithm_path'), ('atmosphere', 'app_path_model'),
+                      ('observations', 'app_path_observations')]:
+        for file_name in os.listdir(template_tree[key]):
+            with open(os.path.join(template_tree[key], file_name)) as f:
+                files[f'{name}/{file_name}'] = f.read()
+    bundle = jcb.TemplateBundle(files=files)
+
+    loader_dict = {**template_tree, 'algorithm': 'hofx4d',
+                   'algorithm_path': bundle.loader('algorithms'),
+                   'app_path_model': bundle.loader('atmosphere'),
+                   'app_path_observations': bundle.loader('observations')}
+
+    assert jcb.render(loader_dict) == expected
+
+    # The name of the model comes from the loader
+    with pytest.raises(jcb.JcbError, match='must have a name'):
+        jcb.Renderer({**loader_dict, 'app_path_model': jcb.TemplateBundle(files={}).loader()})
+
+
+# --------------------------------------------------------------------------------------------------
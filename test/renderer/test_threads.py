@@ -0,0 +1,47 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_dictionary_not_modified(template_tree):
+
+    template_dict = {**template_tree, 'algorithm': 'hofx4d'}
+    template_dict.pop('observations')
+    original = dict(template_dict)
+
+    renderer = jcb.Renderer(template_dict)
+    renderer.render('variational')
+    renderer.update(obs_path='/data/other')
+    jcb.render(template_dict)
+
+    assert template_dict == original
+
+    # The keys set by the Renderer are in the layer over the dictionary
+    assert renderer.template_dict['model_component'] == 'atmosphere_'
+    assert renderer.template_dict['observations'] == renderer.all_observations
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_concurrent_renders(template_tree):
+
+    algorithms = ['variational', 'hofx4d', 'converttostructuredgrid'] * 20
+    expected = {algorithm: jcb.Renderer(dict(template_tree)).render(algorithm)
+                for algorithm in set(algorithms)}
+
+    # One Renderer shared by the threads, including its fragments and chronicle
+    renderer = jcb.Renderer(dict(template_tree))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(renderer.render, algorithms))
+
+    assert results == [expected[algorithm] for algorithm in algorithms]
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,99 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+
+from click.testing import CliRunner
+import jcb
+from jcb.driver import jcb_driver
+from jcb.tree_index import find_index, fresh_index, IndexedLoader, write_index
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_tree_index(tmp_path, template_tree, monkeypatch):
+
+    expected = jcb.render({**template_tree, 'algorithm': 'variational'})
+
+    result = CliRunner().invoke(jcb_driver, ['index', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    jcb.clear_environment_cache()
+
+    # The directories are not listed when the manifest is up to date
+    def listdir(path):
+        raise AssertionError(f'{path} was listed')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'listdir', listdir)
+        renderer = jcb.Renderer(dict(template_tree))
+        assert isinstance(renderer.env.loader, IndexedLoader)
+        assert renderer.render('variational') == expected
+
+    index = fresh_index(template_tree['app_path_observations'])
+    assert sorted(index.files(template_tree['app_path_observations'])) == \
+        ['aircraft.yaml.j2', 'amsua_n19.yaml.j2', 'sondes.yaml.j2']
+
+    def walked(walk):
+        return sorted((path, sorted(directories), sorted(files))
+                      for path, directories, files in walk)
+
+    app_path = os.path.join(tmp_path, 'app')
+    assert walked(index.walk(app_path)) == walked(os.walk(app_path))
+
+    # A template edited in place is reloaded while the manifest is still up to date
+    renderer = jcb.Renderer(dict(template_tree))
+    assert renderer.render('converttostructuredgrid')['output'] == '/data/output'
+    template_path = os.path.join(template_tree['algorithm_path'], 'converttostructuredgrid.yaml.j2')
+    with open(template_path, 'w') as f:
+        f.write("output: 'edited'\n")
+    stat = os.stat(template_path)
+    os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert fresh_index(template_tree['algorithm_path']) is not None
+    assert renderer.render('converttostructuredgrid') == {'output': 'edited'}
+
+    # Adding a template makes the manifest out of date for its directory
+    with open(os.path.join(template_tree['app_path_observations'], 'scatwind.yaml.j2'), 'w') as f:
+        f.write('obs space:\n  name: scatwind\n')
+
+    assert fresh_index(template_tree['app_path_observations']) is None
+    assert fresh_index(template_tree['algorithm_path']) is not None
+    assert 'scatwind' in jcb.Renderer(dict(template_tree)).all_observations
+
+    # A changed observer_components.yaml is read again
+    with open(os.path.join(template_tree['algorithm_path'], 'observer_components.yaml'), 'a') as f:
+        f.write('converttostructuredgrid:\n  observer_nesting: []\n  components: []\n')
+
+    assert 'converttostructuredgrid' in \
+        jcb.renderer.read_observer_components(template_tree['algorithm_path'])
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_tree_without_index(tmp_path, template_tree, monkeypatch):
+
+    algorithm_path = template_tree['algorithm_path']
+    assert find_index(algorithm_path) is None
+
+    # A directory that is not in an indexed tree is not searched again while it does not change
+    stats = []
+    original_stat = os.stat
+
+    def stat(path, *args, **kwargs):
+        stats.append(path)
+        return original_stat(path, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'stat', stat)
+        assert find_index(algorithm_path) is None
+
+    assert stats == [algorithm_path]
+
+    # Writing a manifest in this process makes the tree indexed
+    write_index(str(tmp_path))
+    assert find_index(algorithm_path) is not None
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,106 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import shutil
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def render_new(template_dict, algorithm, **changed_keys):
+    return jcb.Renderer({**template_dict, **changed_keys}).render(algorithm)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_update_renders_affected_observers(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    renderer.render('variational')
+    assert renderer.fragment_cache.misses == 3
+
+    # No observation template reads the layout
+    renderer.update(atmosphere_layout_x=4)
+    variational = renderer.render('variational')
+    assert (renderer.fragment_cache.misses, renderer.fragment_cache.hits) == (3, 3)
+    assert variational == render_new(template_tree, 'variational', atmosphere_layout_x=4)
+
+    # All the observation templates read obs_path
+    renderer.update(obs_path='/data/new_obs')
+    variational = renderer.render('variational')
+    assert (renderer.fragment_cache.misses, len(renderer.fragment_cache.fragments)) == (6, 3)
+    assert variational == render_new(template_tree, 'variational', atmosphere_layout_x=4,
+                                     obs_path='/data/new_obs')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_update_window(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    renderer.render('variational')
+
+    # Only amsua_n19 reads the chronicle, and channel 4 was only removed in 2020
+    renderer.update(window_begin='2019-01-01T00:00:00Z')
+    variational = renderer.render('variational')
+
+    assert renderer.fragment_cache.misses == 4
+    assert variational == render_new(template_tree, 'variational',
+                                     window_begin='2019-01-01T00:00:00Z')
+    amsua_n19 = variational['cost function']['observations']['observers'][1]
+    assert amsua_n19['obs space']['channels'] == '1, 2, 3, 4'
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_update_setup_keys(template_tree):
+
+    renderer = jcb.Renderer(dict(template_tree))
+    renderer.render('hofx4d')
+
+    renderer.update(jcb_fragment_cache=False, observations=['sondes'])
+
+    assert renderer.fragment_cache is None
+    assert renderer.render('hofx4d') == render_new(template_tree, 'hofx4d',
+                                                   observations=['sondes'])
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_update_paths(template_tree, tmp_path):
+
+    # Another set of observations, with only sondes, and another model
+    other_observations = tmp_path / 'other_observations'
+    other_observations.mkdir()
+    sondes = os.path.join(template_tree['app_path_observations'], 'sondes.yaml.j2')
+    shutil.copy(sondes, other_observations / 'sondes.yaml.j2')
+
+    ocean = tmp_path / 'app' / 'model' / 'ocean'
+    ocean.mkdir()
+    (ocean / 'ocean_geometry.yaml.j2').write_text('ocean grid: mom6\n')
+
+    template_dict = dict(template_tree)
+    del template_dict['observations']
+
+    renderer = jcb.Renderer(template_dict)
+    renderer.render('hofx4d')
+
+    # The observations and model component set for the first paths are not kept
+    renderer.update(app_path_observations=str(other_observations), app_path_model=str(ocean))
+
+    assert renderer.all_observations == ['sondes']
+    assert renderer.template_dict['observations'] == ['sondes']
+    assert renderer.template_dict['model_component'] == 'ocean_'
+    assert renderer.render('hofx4d') == render_new(template_dict, 'hofx4d',
+                                                   app_path_observations=str(other_observations),
+                                                   app_path_model=str(ocean))
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,45 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import jcb
+from jcb.renderer import check_rendered
+import pytest
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_lazy_message():
+
+    def message():
+        raise AssertionError('The message should not be built')
+
+    jcb.abort_if(False, message)
+
+    with pytest.raises(jcb.JcbError) as error:
+        jcb.abort_if(True, lambda: 'Built when needed', observer='amsua_n19')
+
+    assert str(error.value) == 'Built when needed'
+    assert error.value.context == {'observer': 'amsua_n19'}
+    assert isinstance(error.value, ValueError)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_check_rendered():
+
+    check_rendered('obs space:\n  name: {a: 1}\n')
+
+    rendered = 'obs space:\n  name: {{name}} {{name}}\n  channels: 1-15\nobs operator: }}\n'
+
+    with pytest.raises(jcb.JcbError) as error:
+        check_rendered(rendered, 'amsua_n19.yaml.j2')
+
+    assert error.value.context['template'] == 'amsua_n19.yaml.j2'
+    assert error.value.context['lines'] == [(2, 'name: {{name}} {{name}}'),
+                                            (4, 'obs operator: }}')]
+    assert 'line 4: obs operator: }}' in str(error.value)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,47 @@
+# --------------------------------------------------------------------------------------------------
+
+
+import jcb
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_copy_tree():
+
+    tree = {'a': [1, {'b': 2.0}], 'c': 'd'}
+    copy = jcb.copy_tree(tree)
+
+    assert copy == tree
+    assert copy['a'] is not tree['a']
+    assert copy['a'][1] is not tree['a'][1]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_share_subtrees():
+
+    tree = {'x': {'a': [1, 2], 'b': 0.0}, 'y': {'a': [1, 2], 'b': 0.0}, 'z': {'a': [1, 2]}}
+    shared = jcb.share_subtrees(tree)
+
+    assert shared == tree
+    assert shared['x'] is shared['y']
+    assert shared['x']['a'] is shared['z']['a']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_share_subtrees_keeps_types_apart():
+
+    tree = [{'a': 1}, {'a': True}, {'a': 1.0}, {'a': -0.0}, {'a': 0.0}, [1], [True]]
+    shared = jcb.share_subtrees(tree)
+
+    assert [type(item['a']) for item in shared[:3]] == [int, bool, float]
+    assert str(shared[3]['a']) == '-0.0' and str(shared[4]['a']) == '0.0'
+    assert shared[5] is not shared[6]
+    assert shared[6][0] is True
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,77 @@
+# --------------------------------------------------------------------------------------------------
+
+
+from datetime import datetime
+
+from jcb.utilities import yaml_backend
+import pytest
+import yaml
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+jedi_dict = {
+    'cost function': {
+        'cost type': '3D-Var',
+        'time window': {'begin': datetime(2021, 1, 1, 0), 'length': 'PT6H'},
+        'observations': {
+            'observers': [
+                {
+                    'obs space': {
+                        'name': 'amsua_n19',
+                        'channels': ', '.join(str(channel) for channel in range(1, 60)),
+                        'simulated variables': ['brightnessTemperature'],
+                        'empty list': [],
+                        'empty dict': {},
+                        'comment': 'A string with a\nnewline and unicode ° characters',
+                        'quoted': 'yes',
+                        'number string': '0012',
+                    },
+                    'obs error': [0.5, 1e-10, float('inf'), -2, None, True, False],
+                },
+            ],
+        },
+    },
+}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+@pytest.mark.skipif(not yaml_backend.libyaml_available, reason='PyYAML built without libyaml')
+def test_dump_matches_pure_python(monkeypatch):
+
+    expected = yaml.dump(jedi_dict, default_flow_style=False, sort_keys=False)
+
+    assert yaml_backend.backend_name() == 'libyaml'
+    assert yaml_backend.dump(jedi_dict, default_flow_style=False, sort_keys=False) == expected
+
+    monkeypatch.setenv('JCB_YAML_BACKEND', 'python')
+    assert yaml_backend.backend_name() == 'python'
+    assert yaml_backend.dump(jedi_dict, default_flow_style=False, sort_keys=False) == expected
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_load_matches_pure_python():
+
+    text = yaml.dump(jedi_dict, default_flow_style=False, sort_keys=False)
+    text += 'anchors:\n  a: &anchor [1, 2]\n  b: *anchor\n'
+
+    assert yaml_backend.safe_load(text) == yaml.safe_load(text)
+    assert list(yaml_backend.safe_load_all(text + '---\na: 1\n')) == \
+        list(yaml.safe_load_all(text + '---\na: 1\n'))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def test_unsafe_tags_are_rejected():
+
+    with pytest.raises(yaml.YAMLError):
+        yaml_backend.safe_load('!!python/object/apply:os.system ["true"]')
+
+
+# --------------------------------------------------------------------------------------------------